@@ -1,7 +1,10 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime
-import re
-# import openpyxl
+from enum import Enum
+from dcfeval import FormulaCompiler, DependencyGraph
+from dcfscen import DCFScenarios
+from openpyxl import Workbook
 
 """
 Class for a company valuation using a specified DCF model
@@ -11,6 +14,12 @@ To do list:
 """
 
 
+# Approaches to terminal value calculation
+class TerminalValuation(Enum):
+    GordonGrowth = 1
+    ExitMultiple = 2
+
+
 class DCFModel:
 
     def __init__(self):
@@ -33,9 +42,24 @@ class DCFModel:
         self.series_values = None
         # dictionary with constant values
         self.constant_values = None
+        # dictionary with actual row values for the past dates
+        self.actual_values = None
+
+        # formula compiler, compiled row blocks (start column, end column, formula) and row dependency graph
+        self.compiler = self.compiled_rows = self.graph = None
+        # value arrays padding for shifted items: (past, future) columns
+        self.padding = (0, 0)
+        # evaluated value arrays (rows values, series values, constants) kept for incremental recalculation
+        self.value_arrays = None
+        # rows to recalculate: row index -> first changed column
+        self.dirty_rows = {}
 
         # approach to terminal value calculation (enumeration used)
         self.terminal_valuation = None
+        # valuation items: cash flow row and names of the valuation constants
+        self.valuation_items = None
+        # valuation results
+        self.valuation = None
 
     """
     Setting the valuation calendar
@@ -46,6 +70,7 @@ class DCFModel:
     def set_valuation_calendar(self, past_dts, valuation_dt, future_dts):
         # reset model data frames
         self.model_formulas = self.model_values = None
+        self.compiled_rows = self.value_arrays = None
         # should be an ordered tuple
         self.past_dates = [datetime.strptime(date, "%Y-%m-%d") for date in past_dts]
         # scalar value
@@ -64,10 +89,12 @@ class DCFModel:
 
         # reset model data frames
         self.model_formulas = self.model_values = None
+        self.compiler = self.compiled_rows = self.value_arrays = None
 
-        # clear time series and constant values
+        # clear time series, constant and actual values
         self.series_values = {}
         self.constant_values = {}
+        self.actual_values = {}
 
     """
     Creating empty model template (formula and value data frames)
@@ -78,18 +105,11 @@ class DCFModel:
             return -1
         # uniting past and future dates in one set
         dates = self.past_dates + self.future_dates
-        # number of rows
-        row_num = len(self.row_names)
-        # empty dictionary filled with the model dates as the dictionary keys
-        template = {}
-        # filling the dictionary
-        for date in dates:
-            template[date] = list(range(0, row_num))
-        # creating the model data frames from the dictionary
-        self.model_formulas = pd.DataFrame(template, columns=dates, index=self.row_names)
-        self.model_formulas[:] = None
-        self.model_values = pd.DataFrame(template, columns=dates, index=self.row_names)
-        self.model_values[:] = None
+        # creating the model data frames: empty formulas and values
+        self.model_formulas = pd.DataFrame([[None] * len(dates)] * len(self.row_names),
+                                           columns=dates, index=self.row_names, dtype=object)
+        self.model_values = pd.DataFrame(np.nan, columns=dates, index=self.row_names)
+        self.compiled_rows = self.value_arrays = None
 
     """
     Loading actual financial data from DB
@@ -112,6 +132,9 @@ class DCFModel:
             return -1
         # set specified formula from the start_date to the last column of the row
         self.model_formulas.loc[row, start_date:] = formula
+        # recompiling the model and recalculating the row from the start_date
+        self.compiled_rows = None
+        self.__mark_dirty(self.row_names.index(row), self.model_formulas.columns.get_loc(start_date))
         return 0
 
     """
@@ -121,6 +144,21 @@ class DCFModel:
         if series not in self.series_names:
             return -1
         self.series_values[series] = value[:]
+        if not self.__is_evaluated():
+            return
+        # updating the evaluated series and marking the rows using its changed periods
+        series_ind = self.series_names.index(series)
+        series_values = self.value_arrays[1]
+        start = self.padding[0] + len(self.past_dates)
+        new_values = np.full(series_values.shape[-1] - start, np.nan)
+        new_values[:len(value)] = value[:len(new_values)]
+        changed = np.flatnonzero(~np.isclose(series_values[series_ind, start:], new_values, equal_nan=True))
+        if len(changed) == 0:
+            return
+        series_values[series_ind, start:] = new_values
+        for row_ind, blocks in enumerate(self.compiled_rows):
+            for shift in {shift for blk in blocks for ind, shift in blk[2].series_refs if ind == series_ind}:
+                self.__mark_dirty(row_ind, start + changed[0] - self.padding[0] - shift)
 
     """
     Setting constant value
@@ -129,72 +167,456 @@ class DCFModel:
         if constant not in self.constant_names:
             return -1
         self.constant_values[constant] = value
+        if not self.__is_evaluated():
+            return
+        # updating the evaluated constant and marking the rows using it
+        constant_ind = self.constant_names.index(constant)
+        self.value_arrays[2][constant_ind] = value
+        for row_ind, blocks in enumerate(self.compiled_rows):
+            if any(constant_ind in blk[2].constant_refs for blk in blocks):
+                self.__mark_dirty(row_ind, 0)
+
+    """
+    Setting actual row values for the past dates; should be an ordered list
+    """
+    def set_actual_values(self, row, value):
+        if row not in self.row_names:
+            return -1
+        self.actual_values[row] = value[:]
+        if not self.__is_evaluated():
+            return
+        # updating the evaluated row (actual values of the previous list are cleared) and marking the rows using it
+        row_ind = self.row_names.index(row)
+        past_pad = self.padding[0]
+        self.value_arrays[0][row_ind, :past_pad + len(self.past_dates)] = np.nan
+        self.value_arrays[0][row_ind, past_pad:past_pad + len(value)] = value
+        self.__mark_dirty(row_ind, 0)
+
+    # check that evaluated arrays can be updated incrementally
+    def __is_evaluated(self):
+        if self.value_arrays is not None and self.compiled_rows is None:
+            self.compile_model()
+        return self.value_arrays is not None
+
+    # mark row to be recalculated from the column
+    def __mark_dirty(self, row_ind, col):
+        self.dirty_rows[row_ind] = max(0, min(self.dirty_rows.get(row_ind, col), col))
+
+    """
+    Compiling row formulas: each distinct formula is parsed once,
+    consecutive dates with the same formula form one evaluation block of the row,
+    rows are ordered by the dependency graph (circular references raise ValueError)
+    """
+    def compile_model(self):
+        if self.model_formulas is None:
+            return -1
+        if self.compiler is None:
+            self.compiler = FormulaCompiler(self.row_names, self.series_names, self.constant_names)
+        compiled_rows = []
+        past_pad = future_pad = 0
+        for row in self.row_names:
+            formulas = self.model_formulas.loc[row].tolist()
+            blocks = []
+            start = 0
+            for col in range(1, len(formulas) + 1):
+                if col < len(formulas) and formulas[col] == formulas[start]:
+                    continue
+                if isinstance(formulas[start], str):
+                    formula = self.compiler.compile(formulas[start])
+                    blocks.append((start, col, formula))
+                    past_shift, future_shift = formula.max_shifts()
+                    past_pad, future_pad = max(past_pad, past_shift), max(future_pad, future_shift)
+                start = col
+            compiled_rows.append(blocks)
+        self.graph = DependencyGraph([sorted({ref for blk in blocks for ref in blk[2].row_refs})
+                                      for blocks in compiled_rows], self.row_names)
+        self.compiled_rows = compiled_rows
+        # evaluated arrays can't be reused with other padding
+        if self.padding != (past_pad, future_pad):
+            self.value_arrays = None
+        self.padding = (past_pad, future_pad)
+        return 0
+
+    """
+    Creating padded value arrays: rows x dates values, series x dates values and constants
+    """
+    def init_value_arrays(self):
+        past_pad, future_pad = self.padding
+        col_num = past_pad + len(self.past_dates) + len(self.future_dates) + future_pad
+        values = np.full((len(self.row_names), col_num), np.nan)
+        for row, value in self.actual_values.items():
+            values[self.row_names.index(row), past_pad:past_pad + len(value)] = value
+        series = np.full((len(self.series_names), col_num), np.nan)
+        start = past_pad + len(self.past_dates)
+        for name, value in self.series_values.items():
+            series[self.series_names.index(name), start:start + len(value)] = value
+        constants = np.array([self.constant_values.get(name, np.nan) for name in self.constant_names], dtype=float)
+        return values, series, constants
+
+    """
+    Evaluating compiled blocks over the value arrays (optionally with a leading scenario axis)
+    dirty_rows - rows to recalculate with their first changed columns, all rows if None
+    """
+    def evaluate_arrays(self, values, series, constants, dirty_rows=None):
+        past_pad = self.padding[0]
+        col_num = len(self.past_dates) + len(self.future_dates)
+        if dirty_rows is None:
+            dirty_rows = {row_ind: 0 for row_ind in range(len(self.row_names))}
+        else:
+            dirty_rows = self.graph.propagate(dirty_rows)
+
+        for rows, recursive in self.graph.groups:
+            # rows of the group are recalculated from the first changed column
+            first = min([dirty_rows[row_ind] for row_ind in rows if row_ind in dirty_rows], default=col_num)
+            if first >= col_num:
+                continue
+            # non-recursive row is evaluated for the whole block at once
+            if not recursive:
+                for start, end, formula in self.compiled_rows[rows[0]]:
+                    cols = np.arange(max(start, first) + past_pad, end + past_pad)
+                    if len(cols) > 0:
+                        values[..., rows[0], cols] = formula.evaluate(values, series, constants, cols)
+                continue
+            # recursive rows are evaluated period by period
+            col_formulas = [[None] * col_num for row_ind in rows]
+            for ind, row_ind in enumerate(rows):
+                for start, end, formula in self.compiled_rows[row_ind]:
+                    col_formulas[ind][start:end] = [formula] * (end - start)
+            for col in range(first, col_num):
+                cols = np.array([col + past_pad])
+                for ind, row_ind in enumerate(rows):
+                    if col_formulas[ind][col] is not None:
+                        values[..., row_ind, cols] = col_formulas[ind][col].evaluate(values, series, constants, cols)
+        return values
+
+    """
+    Evaluating the model values; after the first evaluation only the rows affected by changed
+    formulas, time series, constants or actual values are recalculated
+    """
+    def evaluate_model(self):
+        if self.compiled_rows is None and self.compile_model() != 0:
+            return -1
+        if self.value_arrays is None:
+            self.value_arrays = self.init_value_arrays()
+            self.evaluate_arrays(*self.value_arrays)
+        elif len(self.dirty_rows) > 0:
+            self.evaluate_arrays(*self.value_arrays, self.dirty_rows)
+        self.dirty_rows = {}
+        past_pad = self.padding[0]
+        values = self.value_arrays[0][:, past_pad:past_pad + len(self.model_formulas.columns)]
+        self.model_values = pd.DataFrame(values, index=self.row_names, columns=self.model_formulas.columns)
+        return self.model_values
+
+    """
+    Setting valuation items: discounted cash flow row and model constants used as discount rate,
+    terminal growth rate or exit multiple, net debt and number of shares (optional)
+    exit_metric_row - row multiplied by the exit multiple at the last future date (e.g. EBITDA)
+    mid_year - discounting cash flows from the middle of their periods
+    """
+    def set_valuation(self, cash_flow_row, discount_rate, growth_rate=None, net_debt=None, shares=None,
+                      terminal_valuation=TerminalValuation.GordonGrowth, exit_multiple=None, exit_metric_row=None,
+                      mid_year=False):
+        for row in [cash_flow_row, exit_metric_row]:
+            if row is not None and row not in self.row_names:
+                return -1
+        for constant in [discount_rate, growth_rate, net_debt, shares, exit_multiple]:
+            if constant is not None and constant not in self.constant_names:
+                return -1
+        if terminal_valuation == TerminalValuation.GordonGrowth and growth_rate is None:
+            return -1
+        if terminal_valuation == TerminalValuation.ExitMultiple and (exit_multiple is None or exit_metric_row is None):
+            return -1
+        self.terminal_valuation = terminal_valuation
+        self.valuation_items = {'CashFlow': cash_flow_row, 'DiscountRate': discount_rate,
+                                'GrowthRate': growth_rate, 'NetDebt': net_debt, 'Shares': shares,
+                                'ExitMultiple': exit_multiple, 'ExitMetric': exit_metric_row, 'MidYear': mid_year}
+        return 0
+
+    """
+    Year fractions of the future dates from the valuation date (ACT/365)
+    """
+    def year_fractions(self):
+        return np.array([(date - self.valuation_date).days / 365 for date in self.future_dates])
+
+    """
+    Discounting year fractions and shares of the future period cash flows remaining after the valuation date
+    """
+    def discounting_periods(self):
+        period_ends = self.year_fractions()
+        # the first period starts at the last past date (or a year before its end)
+        first_start = (self.past_dates[-1] - self.valuation_date).days / 365 if len(self.past_dates) > 0 \
+            else period_ends[0] - 1
+        period_starts = np.append(first_start, period_ends[:-1])
+        # stub period: only the remaining part of the cash flow is valued
+        remaining = np.clip(period_ends / np.maximum(period_ends - period_starts, 1e-9), 0, 1)
+        remaining = np.where(period_starts >= 0, 1, remaining)
+        if self.valuation_items['MidYear']:
+            return (np.maximum(period_starts, 0) + period_ends) / 2, remaining, period_ends
+        return period_ends, remaining, period_ends
+
+    """
+    Valuing evaluated arrays (optionally with a leading scenario axis): discounted cash flows,
+    terminal value, enterprise value and the net debt bridge to the equity value (per share)
+    """
+    def value_cash_flows(self, values, constants):
+        past_pad = self.padding[0]
+        start = past_pad + len(self.past_dates)
+
+        # future values of the row
+        def row_values(name):
+            return values[..., self.row_names.index(name), start:start + len(self.future_dates)]
+
+        # valuation constants as column vectors
+        def constant(name, default=0.0):
+            if name is None:
+                return np.full(constants.shape[:-1] + (1,), default)
+            ind = self.constant_names.index(name)
+            return constants[..., ind:ind + 1]
+
+        items = self.valuation_items
+        cash_flows = row_values(items['CashFlow'])
+        rate = constant(items['DiscountRate'])
+
+        # discounting with exact year fractions
+        cf_fractions, remaining, period_ends = self.discounting_periods()
+        pv_cash_flows = (cash_flows * remaining * (1 + rate) ** -cf_fractions).sum(axis=-1)
+        # terminal value at the last future date
+        if self.terminal_valuation == TerminalValuation.ExitMultiple:
+            terminal_value = row_values(items['ExitMetric'])[..., -1:] * constant(items['ExitMultiple'])
+        else:
+            growth = constant(items['GrowthRate'])
+            terminal_value = cash_flows[..., -1:] * (1 + growth) / (rate - growth)
+        pv_terminal_value = (terminal_value * (1 + rate) ** -period_ends[-1])[..., 0]
+
+        # net debt bridge
+        enterprise_value = pv_cash_flows + pv_terminal_value
+        equity_value = enterprise_value - constant(items['NetDebt'])[..., 0]
+        per_share = equity_value / constant(items['Shares'], np.nan)[..., 0]
+        return {'PVCashFlows': pv_cash_flows, 'TerminalValue': terminal_value[..., 0],
+                'PVTerminalValue': pv_terminal_value, 'EnterpriseValue': enterprise_value,
+                'EquityValue': equity_value, 'EquityValuePerShare': per_share}
+
+    """
+    Sensitivity table of the valuation result to two inputs (constants or time series),
+    all grid points are valued at once in the scenario mode
+    """
+    def sensitivity_table(self, row_input, row_values, col_input, col_values, result='EquityValue'):
+        scenarios = DCFScenarios(self)
+        if scenarios.set_grid(row_input, row_values) == -1 or scenarios.set_grid(col_input, col_values) == -1:
+            return -1
+        if scenarios.run() != 0:
+            return -1
+        table = scenarios.valuation[result].reshape(len(row_values), len(col_values))
+        return pd.DataFrame(table, index=pd.Index(row_values, name=row_input),
+                            columns=pd.Index(col_values, name=col_input))
+
+    """
+    Model specification as a dictionary of plain types: calendar, items, row formulas, input values
+    (time series, constants and actual values; NaN items as None) and valuation
+    """
+    def get_specification(self):
+        if self.model_formulas is None:
+            return None
+        date_format = "%Y-%m-%d"
+        valuation = None
+        if self.valuation_items is not None:
+            valuation = dict(self.valuation_items, TerminalValuation=self.terminal_valuation.name)
+
+        # plain float values without NaN
+        def plain(value):
+            if isinstance(value, (list, tuple, np.ndarray)):
+                return [plain(item) for item in value]
+            return None if value is None or np.isnan(value) else float(value)
+
+        values = {'Series': {name: plain(value) for name, value in self.series_values.items()},
+                  'Constants': {name: plain(value) for name, value in self.constant_values.items()},
+                  'Actuals': {row: plain(value) for row, value in self.actual_values.items()}}
+        return {'PastDates': [date.strftime(date_format) for date in self.past_dates],
+                'ValuationDate': self.valuation_date.strftime(date_format),
+                'FutureDates': [date.strftime(date_format) for date in self.future_dates],
+                'Rows': self.row_names[:], 'Series': self.series_names[:], 'Constants': self.constant_names[:],
+                'Formulas': {row: self.model_formulas.loc[row].tolist() for row in self.row_names},
+                'Values': values, 'Valuation': valuation}
+
+    """
+    Creating the model from the specification
+    """
+    @staticmethod
+    def from_specification(spec):
+        model = DCFModel()
+        model.set_valuation_calendar(spec['PastDates'], spec['ValuationDate'], spec['FutureDates'])
+        model.specify_model(spec['Rows'], spec['Series'], spec['Constants'])
+        model.create_model_template()
+        # the formulas data frame is built at once instead of row by row assignments
+        formulas = model.model_formulas
+        model.model_formulas = pd.DataFrame([spec['Formulas'].get(row, [None] * len(formulas.columns))
+                                             for row in model.row_names],
+                                            index=formulas.index, columns=formulas.columns, dtype=object)
+        # input values (missing items of the earlier specifications)
+        values = spec.get('Values') or {}
+        for name, value in values.get('Series', {}).items():
+            model.set_time_series(name, [np.nan if item is None else item for item in value])
+        for name, value in values.get('Constants', {}).items():
+            model.set_constant(name, np.nan if value is None else value)
+        for row, value in values.get('Actuals', {}).items():
+            model.set_actual_values(row, [np.nan if item is None else item for item in value])
+        valuation = spec.get('Valuation')
+        if valuation is not None:
+            valuation = dict(valuation)
+            model.set_valuation(valuation['CashFlow'], valuation['DiscountRate'], valuation['GrowthRate'],
+                                valuation['NetDebt'], valuation['Shares'],
+                                TerminalValuation[valuation['TerminalValuation']], valuation['ExitMultiple'],
+                                valuation['ExitMetric'], valuation['MidYear'])
+        return model
+
+    """
+    Valuing the model
+    """
+    def value_model(self):
+        if self.valuation_items is None or not isinstance(self.evaluate_model(), pd.DataFrame):
+            return -1
+        self.valuation = {key: float(value) for key, value in
+                          self.value_cash_flows(self.value_arrays[0], self.value_arrays[2]).items()}
+        return self.valuation
+
+    """
+    Excel sheet layout: item names in column A, dates from column B, header in row 1;
+    rows, series and constants are placed from row 2 separated by two empty rows,
+    constant values are placed in column B
+    """
+    def excel_item_names(self):
+        return self.row_names + ['', ''] + self.series_names + ['', ''] + self.constant_names
+
+    # Excel column letters of the column index (0 - A)
+    @staticmethod
+    def excel_column(col_ind):
+        letters = ''
+        col_ind += 1
+        while col_ind > 0:
+            col_ind, rest = divmod(col_ind - 1, 26)
+            letters = chr(ord('A') + rest) + letters
+        return letters
 
     """
     Convert formulas data frame to the excel format
+    the source formulas are not changed; each distinct formula is tokenized once and converted once
+    per date column (A1 format) or per model row (R[]C[] format, links are relative to the row)
     """
     def convert_model_to_excel(self, is_rc_format=False):
         # check existence of the formulas data frame
         if self.model_formulas is None:
             return -1
-        # combining the model items in one set
-        item_names = self.row_names + ['', ''] + self.series_names + ['', ''] + self.constant_names
-        # copy formulas to the converted data frame
-        result = self.model_formulas[:]
-
-        # starting row and column indices on the Excel sheet
+        # sheet rows of the model items
         start_row_index = 2
-        start_col_code = ord('B') + len(self.past_dates)
-
-        # Generate general cell link
-        def get_general_link():
-            # forming general cell link
-            row_ind = item_names.index(row_name)
-            general_cell_link = chr(
-                start_col_code + (int(item[len(row_name) + 1: -1]) if len(row_name) < len(item) else 0)) + str(
-                start_row_index + row_ind)
-            return general_cell_link
-
-        # Generate r[]c[] cell link
-        def get_rc_link():
-            # forming R[]C[] cell link
-            row_ind = item_names.index(row_name) - ind
-            rc_link = 'R[' + str(row_ind) + ']' + \
-                      'C[' + (item[len(row_name) + 1: -1] if len(row_name) < len(item) else '0') + ']'
-            return rc_link
-
-        # defining used function
-        get_link = get_rc_link if is_rc_format else get_general_link
-
-        # converting string name to RC format
-        for date in result.columns:
-            for ind, row in enumerate(result.index):
-                # checking existence
-                if result.loc[row, date] is None:
+        item_rows = {name: start_row_index + ind for ind, name in enumerate(self.excel_item_names()) if name != ''}
+        constants = set(self.constant_names)
+        # sheet column index of the first date
+        start_col_index = 1
+
+        # formula pieces: (text before the item, item name, shift), the last piece has no item
+        tokens = {}
+
+        def tokenize(formula):
+            pieces, pos = [], 0
+            for match in FormulaCompiler.itemPattern.finditer(formula):
+                if match.group(1) not in item_rows:
+                    continue
+                shift = int(match.group(2)) if match.group(2) is not None else 0
+                pieces.append((formula[pos:match.start()], match.group(1), shift))
+                pos = match.end()
+            pieces.append((formula[pos:], None, 0))
+            return pieces
+
+        # cell link of the item
+        def get_link(name, shift, row_ind, col_ind):
+            if is_rc_format:
+                if name in constants:
+                    return 'R%dC%d' % (item_rows[name], start_col_index + 1)
+                return 'R[%d]C[%d]' % (item_rows[name] - start_row_index - row_ind, shift)
+            if name in constants:
+                return '$%s$%d' % (self.excel_column(start_col_index), item_rows[name])
+            return self.excel_column(start_col_index + col_ind + shift) + str(item_rows[name])
+
+        # converting formulas
+        formulas = self.model_formulas.to_numpy()
+        result = np.full(formulas.shape, None, dtype=object)
+        converted = {}
+        for row_ind in range(formulas.shape[0]):
+            for col_ind in range(formulas.shape[1]):
+                formula = formulas[row_ind, col_ind]
+                if not isinstance(formula, str):
                     continue
-                # formula in the R[]C[] format
-                formula = result.loc[row, date]
-                # dividing into the row components
-                items = re.findall(r"[^0-9 .(]\w+[[]?[-]?\d*[]]?", result.loc[row, date])
-                # for each row component
-                for item in items:
-                    # discarding [-x] part
-                    row_name = item[:item.find('[')] if item.find('[') >= 0 else item[:]
-                    # checking presence of the item in the model rows
-                    if row_name not in item_names:
-                        continue
-                    # forming cell link
-                    cell_link = get_link()
-                    # replacing the found item with the cell link
-                    formula = formula.replace(item, cell_link)
-                # saving formula
-                result.loc[row, date] = '=' + formula
-        return result
-
-    # export model to excel in the R[]C[] format
-    def export_to_excel(self, is_rc_format=False):
-        ex_mdl = self.convert_model_to_excel(is_rc_format)
-        ex_mdl.to_excel(r'd:\DCF_Model.xlsx', index=True, header=True)
+                key = (formula, row_ind if is_rc_format else col_ind)
+                if key not in converted:
+                    if formula not in tokens:
+                        tokens[formula] = tokenize(formula)
+                    converted[key] = '=' + ''.join(
+                        text + (get_link(name, shift, row_ind, col_ind) if name is not None else '')
+                        for text, name, shift in tokens[formula])
+                result[row_ind, col_ind] = converted[key]
+        return pd.DataFrame(result, index=self.model_formulas.index, columns=self.model_formulas.columns)
+
+    """
+    Writing the model sheet rows to a write-only worksheet:
+    row formulas (or values) with actual past values, time series values and constants
+    """
+    def __write_excel_sheet(self, sheet, row_cells):
+        dates = self.past_dates + self.future_dates
+        past_num = len(self.past_dates)
+
+        # cell value without NaN items
+        def cell(value):
+            return None if value is None or (isinstance(value, float) and np.isnan(value)) else value
+
+        sheet.append(['Item'] + dates)
+        for row_ind, row in enumerate(self.row_names):
+            cells = [cell(value) for value in row_cells[row_ind]]
+            for ind, value in enumerate(self.actual_values.get(row, [])[:past_num]):
+                cells[ind] = cell(value) if cells[ind] is None else cells[ind]
+            sheet.append([row] + cells)
+        sheet.append([])
+        sheet.append([])
+        for name in self.series_names:
+            sheet.append([name] + [None] * past_num + [cell(value) for value in self.series_values.get(name, [])])
+        sheet.append([])
+        sheet.append([])
+        for name in self.constant_names:
+            sheet.append([name, cell(self.constant_values.get(name))])
+
+    """
+    Exporting the model to Excel: the model sheet with A1 formulas and the sheet with the evaluated values
+    (written if the evaluated values are current, the export doesn't evaluate the model)
+    target - file path or writable binary buffer; workbook - write-only workbook used for batch exports
+    without target and workbook the new workbook is returned unsaved
+    (formulas are always stored in the A1 format, R1C1 is a display option of Excel)
+    """
+    def export_to_excel(self, target=None, workbook=None, sheet_name='Model'):
+        formulas = self.convert_model_to_excel()
+        if not isinstance(formulas, pd.DataFrame):
+            return -1
+        own_workbook = workbook is None
+        if own_workbook:
+            workbook = Workbook(write_only=True)
+        self.__write_excel_sheet(workbook.create_sheet(sheet_name[:31]), formulas.to_numpy().tolist())
+        if self.value_arrays is not None and len(self.dirty_rows) == 0:
+            self.__write_excel_sheet(workbook.create_sheet((sheet_name + ' Values')[:31]),
+                                     self.model_values.to_numpy().tolist())
+        if own_workbook and target is None:
+            return workbook
+        if own_workbook:
+            workbook.save(target)
+        return 0
+
+    """
+    Exporting several models (name -> model) to one Excel workbook streaming sheet by sheet
+    """
+    @staticmethod
+    def export_models_to_excel(models, target):
+        workbook = Workbook(write_only=True)
+        for name, model in models.items():
+            model.export_to_excel(workbook=workbook, sheet_name=str(name))
+        workbook.save(target)
+        return 0
 
 
 # functional programming for performed operations
@@ -214,14 +636,14 @@ if __name__ == '__main__':
 
     row_names = ['Sales', 'EBIT_margin', 'EBIT', 'NI', 'IncFC', 'IncWC', 'FCFF']
     time_series_names = ['sales_growth', 'inc_fc_rate', 'inc_wc_rate']
-    constant_names = ['tax_rate']
+    constant_names = ['tax_rate', 'margin', 'wacc', 'growth', 'net_debt', 'shares']
 
     dcf.specify_model(row_names, time_series_names, constant_names)
 
     dcf.create_model_template()
 
-    dcf.set_general_row_formula('Sales', '2022-12-31', 'Sales[-1] * sales_growth')
-    dcf.set_general_row_formula('EBIT_margin', '2022-12-31', '0.1')
+    dcf.set_general_row_formula('Sales', '2022-12-31', 'Sales[-1] * (1 + sales_growth)')
+    dcf.set_general_row_formula('EBIT_margin', '2022-12-31', 'margin')
     dcf.set_general_row_formula('EBIT', '2022-12-31', 'Sales * EBIT_margin')
     dcf.set_general_row_formula('NI', '2022-12-31', 'EBIT * (1 - tax_rate)')
     dcf.set_general_row_formula('IncFC', '2022-12-31', 'NI * inc_fc_rate')
@@ -238,9 +660,20 @@ if __name__ == '__main__':
 
     tax_rate = 0.4
     dcf.set_constant('tax_rate', tax_rate)
+    dcf.set_constant('margin', 0.1)
+    dcf.set_constant('wacc', 0.15)
+    dcf.set_constant('growth', 0.04)
+    dcf.set_constant('net_debt', 150)
+    dcf.set_constant('shares', 10)
+    dcf.set_valuation('FCFF', 'wacc', 'growth', 'net_debt', 'shares', mid_year=True)
 
 #    print(dcf.model_formulas)
 #    print(dcf.model_formulas.columns)
 #    mdl = dcf.convert_model_to_excel()
 #    print(mdl)
-    dcf.export_to_excel()
+    dcf.set_actual_values('Sales', [900, 1000])
+    print(dcf.evaluate_model())
+    print(dcf.value_model())
+    print(dcf.sensitivity_table('wacc', [0.12, 0.15, 0.18], 'growth', [0.02, 0.03, 0.04], 'EquityValuePerShare'))
+    print(dcf.sensitivity_table('margin', [0.08, 0.1, 0.12], 'sales_growth', [0.05, 0.1, 0.15]))
+    dcf.export_to_excel('DCF_Model.xlsx')
@@ -0,0 +1,138 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from dcf import DCFModel
+from dcftemplate import load_template
+
+"""
+Batch valuation of a company universe
+Companies sharing a model template are valued together: the template is compiled once per process and
+the companies are stacked along the leading axis of the value arrays (as scenarios in DCFScenarios)
+"""
+
+# compiled templates of the worker process: specification json -> DCFModel
+_compiled_templates = {}
+
+
+# Get compiled template model for the specification
+def _get_template_model(spec_json):
+    if spec_json not in _compiled_templates:
+        model = DCFModel.from_specification(json.loads(spec_json))
+        model.compile_model()
+        _compiled_templates[spec_json] = model
+    return _compiled_templates[spec_json]
+
+
+# Value companies sharing the template; companies - list of (company id, inputs dictionary)
+def value_companies(spec_json, companies):
+    model = _get_template_model(spec_json)
+    company_num = len(companies)
+    values, series, constants = model.init_value_arrays()
+    values = np.repeat(values[None], company_num, axis=0)
+    series = np.repeat(series[None], company_num, axis=0)
+    constants = np.repeat(constants[None], company_num, axis=0)
+
+    # company inputs replace the whole template series / actual values (as DCFModel.set_time_series and
+    # set_actual_values): periods the company doesn't supply are missing, not the template ones
+    past_pad = model.padding[0]
+    start = past_pad + len(model.past_dates)
+    for ind, (company_id, inputs) in enumerate(companies):
+        for row, value in inputs.get('ActualValues', {}).items():
+            value = value[:len(model.past_dates)]
+            row_ind = model.row_names.index(row)
+            values[ind, row_ind, :start] = np.nan
+            values[ind, row_ind, past_pad:past_pad + len(value)] = value
+        for name, value in inputs.get('Series', {}).items():
+            value = value[:series.shape[-1] - start]
+            series_ind = model.series_names.index(name)
+            series[ind, series_ind, start:] = np.nan
+            series[ind, series_ind, start:start + len(value)] = value
+        for name, value in inputs.get('Constants', {}).items():
+            constants[ind, model.constant_names.index(name)] = value
+
+    model.evaluate_arrays(values, series, constants)
+    return pd.DataFrame(model.value_cash_flows(values, constants),
+                        index=pd.Index([company_id for company_id, inputs in companies], name='CompanyId'))
+
+
+class DCFBatch:
+
+    def __init__(self):
+        # model templates: name -> specification json
+        self.templates = {}
+        # companies: company id -> (template name, inputs dictionary)
+        self.companies = {}
+        # valuation results
+        self.results = None
+
+    # add model template (DCFModel with specified formulas and valuation items)
+    def add_template(self, name, model):
+        spec = model.get_specification()
+        if spec is None or spec['Valuation'] is None:
+            return -1
+        self.templates[name] = json.dumps(spec, sort_keys=True)
+        return 0
+
+    # add model template from the template definition file (JSON / YAML)
+    def add_template_file(self, name, path, cache_dir=None):
+        return self.add_template(name, load_template(path, cache_dir))
+
+    # add company valued by the template
+    # series / constants - dictionaries of the model input values, actual_values - past row values
+    def add_company(self, company_id, template, series=None, constants=None, actual_values=None):
+        if template not in self.templates:
+            return -1
+        self.companies[company_id] = (template, {'Series': series or {}, 'Constants': constants or {},
+                                                 'ActualValues': actual_values or {}})
+        return 0
+
+    # reset companies
+    def reset_companies(self):
+        self.companies = {}
+
+    # add companies with constants taken from Interfax Emitent/Multipliers data
+    # ifx_data - authorized InterfaxData object, mapping - model constant -> multipliers field,
+    # date_field - multipliers field of the report date
+    def add_companies_from_interfax(self, ifx_data, fin_inst_ids, template, mapping, constants=None,
+                                    series=None, date_field='date'):
+        for fin_inst_id in fin_inst_ids:
+            ifx_data.set_fin_inst_ids(fin_inst_id)
+            data = ifx_data.get_interfax_data('Emitent', 'Multipliers')
+            if not isinstance(data, list) or len(data) == 0:
+                continue
+            # the latest reported multipliers are used (records are not ordered by date)
+            dated = sorted([datum for datum in data if datum.get(date_field) is not None],
+                           key=lambda datum: datum[date_field])
+            datum = dated[-1] if len(dated) > 0 else data[-1]
+            company_constants = dict(constants or {})
+            company_constants.update({name: datum[field] for name, field in mapping.items()
+                                      if datum.get(field) is not None})
+            self.add_company(fin_inst_id, template, series, company_constants)
+
+    # value all companies; workers - number of processes (None - all cores, 1 - current process)
+    def run(self, workers=None):
+        workers = workers if workers is not None else os.cpu_count()
+        # company chunks of each template
+        tasks = []
+        for template, spec_json in self.templates.items():
+            companies = [(company_id, inputs) for company_id, (name, inputs) in self.companies.items()
+                         if name == template]
+            if len(companies) == 0:
+                continue
+            chunk_size = int(np.ceil(len(companies) / workers))
+            tasks.extend((template, spec_json, companies[ind:ind + chunk_size])
+                         for ind in range(0, len(companies), chunk_size))
+        if len(tasks) == 0:
+            return None
+
+        if workers == 1:
+            frames = [value_companies(spec_json, chunk) for template, spec_json, chunk in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                frames = list(executor.map(value_companies, [task[1] for task in tasks], [task[2] for task in tasks]))
+        for frame, task in zip(frames, tasks):
+            frame.insert(0, 'Template', task[0])
+        self.results = pd.concat(frames)
+        return self.results
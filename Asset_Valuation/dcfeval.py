@@ -0,0 +1,199 @@
+import re
+import marshal
+import numpy as np
+
+"""
+Compiling DCF model formulas into Python code objects evaluated over numpy arrays
+Formula items are translated to array lookups:
+    row item       Sales[-1]      ->  v[..., 0, c - 1]
+    time series    sales_growth   ->  s[..., 0, c]
+    constant       tax_rate       ->  k[..., 0:1]
+where c is the array of evaluated (padded) column indices, so the same code object evaluates one period,
+a block of periods or (with a leading scenario axis of the arrays) a batch of scenarios
+"""
+
+
+class CompiledFormula:
+
+    def __init__(self, text, expression, row_refs, series_refs, constant_refs):
+        # source formula
+        self.text = text
+        # translated python expression and its code object
+        self.expression = expression
+        self.code = compile(expression, '<formula: %s>' % text, 'eval')
+        # referenced row (index, shift) / series (index, shift) / constant indices
+        self.row_refs = row_refs
+        self.series_refs = series_refs
+        self.constant_refs = constant_refs
+
+    # code object is pickled in the marshal format (cached compiled templates)
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['code'] = marshal.dumps(self.code)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.code = marshal.loads(state['code'])
+
+    # largest backward / forward shift of the referenced items
+    def max_shifts(self):
+        shifts = [shift for ind, shift in self.row_refs + self.series_refs]
+        return max([0] + [-shift for shift in shifts]), max([0] + shifts)
+
+    # evaluate formula for the column indices
+    def evaluate(self, values, series, constants, cols):
+        return eval(self.code, {'__builtins__': {}},
+                    dict(FormulaCompiler.functions, v=values, s=series, k=constants, c=cols))
+
+
+class FormulaCompiler:
+
+    # model item reference: name with an optional [k] period shift
+    itemPattern = re.compile(r'(?<![\w.])([A-Za-z_]\w*)(?:\s*\[\s*([-+]?\d+)\s*\])?')
+    # numeric literals (the only items of formulas with dots)
+    numberPattern = re.compile(r'(?<![\w.])(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+    # functions allowed in formulas
+    functions = {'min': np.minimum, 'max': np.maximum, 'abs': np.abs,
+                 'exp': np.exp, 'log': np.log, 'sqrt': np.sqrt, 'where': np.where}
+
+    def __init__(self, rows, series, constants):
+        # item positions in the value arrays
+        self.rowIndex = {name: ind for ind, name in enumerate(rows)}
+        self.seriesIndex = {name: ind for ind, name in enumerate(series)}
+        self.constantIndex = {name: ind for ind, name in enumerate(constants)}
+        # compiled formulas: formula text -> compiled formula
+        self.cache = {}
+
+    # compile formula once
+    def compile(self, formula):
+        if formula not in self.cache:
+            self.cache[formula] = self.__translate(formula)
+        return self.cache[formula]
+
+    # column indices expression shifted by the period shift
+    @staticmethod
+    def __cols(shift):
+        return 'c' if shift == 0 else 'c %s %d' % ('-' if shift < 0 else '+', abs(shift))
+
+    # translate formula items to array lookups
+    def __translate(self, formula):
+        # attribute access and dunder names are not model items (formulas are loaded from template files)
+        if '__' in formula or '.' in FormulaCompiler.numberPattern.sub('0', formula):
+            raise ValueError("Attribute access is not allowed in formula '%s'" % formula)
+        row_refs, series_refs, constant_refs = [], [], []
+
+        def replace(match):
+            name, shift = match.group(1), int(match.group(2)) if match.group(2) is not None else 0
+            if name in self.rowIndex:
+                row_refs.append((self.rowIndex[name], shift))
+                return 'v[..., %d, %s]' % (self.rowIndex[name], self.__cols(shift))
+            if name in self.seriesIndex:
+                series_refs.append((self.seriesIndex[name], shift))
+                return 's[..., %d, %s]' % (self.seriesIndex[name], self.__cols(shift))
+            if name in self.constantIndex:
+                if shift != 0:
+                    raise ValueError("Constant '%s' can't be shifted in formula '%s'" % (name, formula))
+                constant_refs.append(self.constantIndex[name])
+                return 'k[..., %d:%d]' % (self.constantIndex[name], self.constantIndex[name] + 1)
+            if name in FormulaCompiler.functions and match.group(2) is None:
+                return name
+            raise ValueError("Unknown item '%s' in formula '%s'" % (name, formula))
+
+        expression = FormulaCompiler.itemPattern.sub(replace, formula)
+        return CompiledFormula(formula, expression, row_refs, series_refs, constant_refs)
+
+
+class DependencyGraph:
+
+    def __init__(self, row_refs, row_names=None):
+        # referenced (row, shift) items of each row
+        self.row_refs = row_refs
+        self.row_num = len(row_refs)
+        # row names used in error messages
+        self.row_names = row_names if row_names is not None else list(range(self.row_num))
+        # evaluation groups in topological order: (ordered rows, recursive flag)
+        self.groups = []
+        self.__build_groups()
+
+    # strongly connected components of the rows (Tarjan's algorithm) in topological order
+    # the depth first search keeps its own stack of (row, next reference position), so long chains of rows
+    # don't hit the recursion limit
+    def __components(self):
+        index, low, on_stack, stack, components = {}, {}, set(), [], []
+        for root in range(self.row_num):
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            search = [(root, 0)]
+            while len(search) > 0:
+                row, pos = search[-1]
+                refs = self.row_refs[row]
+                if pos < len(refs):
+                    search[-1] = (row, pos + 1)
+                    ref_ind = refs[pos][0]
+                    if ref_ind not in index:
+                        index[ref_ind] = low[ref_ind] = len(index)
+                        stack.append(ref_ind)
+                        on_stack.add(ref_ind)
+                        search.append((ref_ind, 0))
+                    elif ref_ind in on_stack:
+                        low[row] = min(low[row], index[ref_ind])
+                    continue
+                # all references of the row are visited
+                search.pop()
+                if len(search) > 0:
+                    parent = search[-1][0]
+                    low[parent] = min(low[parent], low[row])
+                if low[row] == index[row]:
+                    component = []
+                    while True:
+                        item = stack.pop()
+                        on_stack.discard(item)
+                        component.append(item)
+                        if item == row:
+                            break
+                    # referenced components are completed first
+                    components.append(component)
+        return components
+
+    # order rows of the component by references within the same or future periods
+    def __order_component(self, component):
+        members = set(component)
+        # values of the following periods are not evaluated yet in the period by period evaluation
+        if any(ref in members and shift > 0 for row in component for ref, shift in self.row_refs[row]):
+            raise ValueError("Circular references to following periods between rows %s" %
+                             [self.row_names[row] for row in sorted(component)])
+        same_period = {row: {ref for ref, shift in self.row_refs[row] if ref in members and shift == 0}
+                       for row in component}
+        ordered = []
+        while len(ordered) < len(component):
+            ready = [row for row in sorted(component) if row not in ordered and same_period[row] <= set(ordered)]
+            if len(ready) == 0:
+                raise ValueError("Circular references between rows %s" %
+                                 [self.row_names[row] for row in sorted(component) if row not in ordered])
+            ordered.extend(ready)
+        return ordered
+
+    # build evaluation groups: recursive groups are evaluated period by period
+    def __build_groups(self):
+        for component in self.__components():
+            recursive = len(component) > 1 or any(ref == component[0] for ref, shift in self.row_refs[component[0]])
+            self.groups.append((self.__order_component(component) if recursive else component, recursive))
+
+    # first dirty columns of the rows affected by the changed rows (row -> first changed column)
+    def propagate(self, dirty):
+        dirty = dict(dirty)
+        for rows, recursive in self.groups:
+            for row in rows:
+                for ref_ind, shift in self.row_refs[row]:
+                    if ref_ind in dirty:
+                        dirty[row] = max(0, min(dirty.get(row, dirty[ref_ind] - shift), dirty[ref_ind] - shift))
+            # rows of the recursive group depend on each other through the periods
+            if recursive and any(row in dirty for row in rows):
+                first = min(dirty[row] for row in rows if row in dirty)
+                for row in rows:
+                    dirty[row] = first
+        return dirty
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+"""
+Scenario mode of a DCF model: time series and constants are specified by distributions or grids,
+the model is evaluated for all scenarios at once over scenarios x rows x dates arrays
+Scenarios are the cartesian product of the grid inputs, each grid point repeated for every random draw
+"""
+
+
+class DCFScenarios:
+
+    def __init__(self, model):
+        # evaluated DCF model (DCFModel) with valuation items set
+        self.model = model
+        # input specifications: name -> (kind, parameters)
+        self.inputs = {}
+
+        # number of scenarios
+        self.scenario_num = 0
+        # scenario input values: name -> scenarios (x dates) array
+        self.scenario_inputs = None
+        # scenarios x rows x dates values / scenarios x series x dates values / scenarios x constants values
+        self.values = self.series = self.constants = None
+        # scenario valuation results: name -> scenarios array
+        self.valuation = None
+
+    # ----- INPUTS SPECIFYING BLOCK -----
+
+    # check model input name
+    def __is_input(self, name):
+        return name in self.model.series_names or name in self.model.constant_names
+
+    # normally distributed input: scalar or per future date mean and std
+    def set_normal(self, name, mean, std):
+        if not self.__is_input(name):
+            return -1
+        self.inputs[name] = ('Normal', (mean, std))
+
+    # uniformly distributed input: scalar or per future date bounds
+    def set_uniform(self, name, low, high):
+        if not self.__is_input(name):
+            return -1
+        self.inputs[name] = ('Uniform', (low, high))
+
+    # input grid: list of scalars or per future date lists
+    def set_grid(self, name, grid):
+        if not self.__is_input(name):
+            return -1
+        self.inputs[name] = ('Grid', (list(grid),))
+
+    # explicit input draws: array of scenarios (x future dates) values
+    def set_draws(self, name, draws):
+        if not self.__is_input(name):
+            return -1
+        self.inputs[name] = ('Draws', (np.asarray(draws, dtype=float),))
+
+    # reset input specifications
+    def reset_inputs(self):
+        self.inputs = {}
+
+    # ----- EVALUATION BLOCK -----
+
+    # generate scenario input values
+    def __generate_inputs(self, draw_num, rng):
+        grid_names = [name for name, (kind, params) in self.inputs.items() if kind == 'Grid']
+        grid_sizes = [len(self.inputs[name][1][0]) for name in grid_names]
+        grid_num = int(np.prod(grid_sizes)) if len(grid_sizes) > 0 else 1
+        # explicit draws define the number of draws
+        for kind, params in self.inputs.values():
+            if kind == 'Draws':
+                draw_num = len(params[0])
+        self.scenario_num = grid_num * draw_num
+
+        # grid point indices of the scenarios
+        grid_indices = np.repeat(np.indices(grid_sizes).reshape(len(grid_sizes), grid_num), draw_num, axis=1)
+        period_num = len(self.model.future_dates)
+        self.scenario_inputs = {}
+        for name, (kind, params) in self.inputs.items():
+            shape = (self.scenario_num, period_num) if name in self.model.series_names else (self.scenario_num,)
+            if kind == 'Grid':
+                grid = np.asarray(params[0], dtype=float)
+                draws = grid[grid_indices[grid_names.index(name)]]
+            else:
+                if kind == 'Normal':
+                    draws = rng.normal(params[0], params[1], (draw_num,) + shape[1:])
+                elif kind == 'Uniform':
+                    draws = rng.uniform(params[0], params[1], (draw_num,) + shape[1:])
+                else:
+                    draws = params[0]
+                # draws are repeated for each grid point
+                draws = np.tile(draws, (grid_num,) + (1,) * (draws.ndim - 1))
+            # scalar series values are applied to all future dates
+            if len(shape) > 1 and draws.ndim == 1:
+                draws = draws[:, None]
+            self.scenario_inputs[name] = np.broadcast_to(draws, shape)
+
+    # evaluate and value the model for all scenarios
+    def run(self, draw_num=1, seed=None):
+        model = self.model
+        if model.valuation_items is None or (model.compiled_rows is None and model.compile_model() != 0):
+            return -1
+        self.__generate_inputs(draw_num, np.random.default_rng(seed))
+
+        # base model arrays broadcast to the scenarios
+        values, series, constants = model.init_value_arrays()
+        self.values = np.repeat(values[None], self.scenario_num, axis=0)
+        self.series = np.repeat(series[None], self.scenario_num, axis=0)
+        self.constants = np.repeat(constants[None], self.scenario_num, axis=0)
+        start = model.padding[0] + len(model.past_dates)
+        for name, draws in self.scenario_inputs.items():
+            if name in model.series_names:
+                self.series[:, model.series_names.index(name), start:start + draws.shape[1]] = draws
+            else:
+                self.constants[:, model.constant_names.index(name)] = draws
+
+        model.evaluate_arrays(self.values, self.series, self.constants)
+        self.valuation = model.value_cash_flows(self.values, self.constants)
+        return 0
+
+    # ----- RESULTS BLOCK -----
+
+    # scenarios x future dates values of the row
+    def row_values(self, row):
+        if self.values is None or row not in self.model.row_names:
+            return None
+        start = self.model.padding[0] + len(self.model.past_dates)
+        values = self.values[:, self.model.row_names.index(row), start:start + len(self.model.future_dates)]
+        return pd.DataFrame(values, columns=self.model.future_dates)
+
+    # scenario valuation results as a data frame
+    def valuation_frame(self):
+        if self.valuation is None:
+            return None
+        return pd.DataFrame(self.valuation)
+
+    # distribution statistics of the valuation results and cash flows
+    def summary(self, percentiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        if self.valuation is None:
+            return None
+        frame = self.valuation_frame()
+        cash_flows = self.row_values(self.model.valuation_items['CashFlow'])
+        cash_flows.columns = [self.model.valuation_items['CashFlow'] + ' ' + date.strftime("%Y-%m-%d")
+                              for date in cash_flows.columns]
+        return pd.concat([cash_flows, frame], axis=1).describe(percentiles=list(percentiles)).T
@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import pickle
+import hashlib
+import dcf
+import dcfeval
+from dcf import DCFModel
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+"""
+DCF model templates stored as JSON (or YAML) definitions with a binary cache of the compiled model
+Row formulas are stored compactly as blocks [start date, formula] expanding to the next block or the last date:
+    "Formulas": {"Sales": [["2022-12-31", "Sales[-1] * (1 + sales_growth)"]], ...}
+Input values (time series, constants and actual values) are stored in the "Values" item
+The cache file keeps the pickled compiled model (formula code objects in the marshal format) and is
+rebuilt when the definition, the Python version, the cache format or the model code (dcf, dcfeval) changes
+"""
+
+# cache files extension and format version
+cacheExtension = '.dcfc'
+cacheFormat = 2
+# hash of the model code: pickled models are not valid after the DCFModel / formula layout changes
+_code_hash = None
+# compiled templates loaded in the process: definition path -> (cache key, pickled DCFModel)
+_loaded_templates = {}
+
+
+# Template definition of the model: specification with formula blocks
+def model_to_template(model):
+    spec = model.get_specification()
+    if spec is None:
+        return None
+    dates = spec['PastDates'] + spec['FutureDates']
+    formula_blocks = {}
+    for row, formulas in spec['Formulas'].items():
+        # a new block starts with each formula change, the leading empty block is implied
+        formula_blocks[row] = [[dates[ind], formula] for ind, formula in enumerate(formulas)
+                               if formula != (formulas[ind - 1] if ind > 0 else None)]
+    spec['Formulas'] = formula_blocks
+    return spec
+
+
+# Model specification of the template definition: formula blocks expanded to date lists
+def template_to_specification(template):
+    spec = dict(template)
+    dates = spec['PastDates'] + spec['FutureDates']
+    formulas = {}
+    for row, blocks in spec['Formulas'].items():
+        row_formulas = [None] * len(dates)
+        for start_date, formula in blocks:
+            start = dates.index(start_date)
+            row_formulas[start:] = [formula] * (len(dates) - start)
+        formulas[row] = row_formulas
+    spec['Formulas'] = formulas
+    return spec
+
+
+# Is the file a YAML definition
+def _is_yaml(path):
+    return os.path.splitext(path)[1].lower() in ('.yaml', '.yml')
+
+
+# Save model template definition to a JSON or YAML file
+def save_template(model, path):
+    template = model_to_template(model)
+    if template is None:
+        return -1
+    with open(path, 'w', encoding='utf-8') as file:
+        if _is_yaml(path):
+            if yaml is None:
+                raise ImportError("PyYAML is required for YAML templates")
+            yaml.safe_dump(template, file, sort_keys=False, allow_unicode=True)
+        else:
+            json.dump(template, file, indent=2, ensure_ascii=False)
+    return 0
+
+
+# Read model template definition from a JSON or YAML file
+def read_template(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        if _is_yaml(path):
+            if yaml is None:
+                raise ImportError("PyYAML is required for YAML templates")
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+# Compiled model of the template definition
+def build_template_model(template):
+    model = DCFModel.from_specification(template_to_specification(template))
+    model.compile_model()
+    return model
+
+
+# Hash of the sources of the pickled model modules
+def _get_code_hash():
+    global _code_hash
+    if _code_hash is None:
+        code_hash = hashlib.sha1()
+        for module in [dcf, dcfeval, sys.modules[__name__]]:
+            with open(module.__file__, 'rb') as file:
+                code_hash.update(file.read())
+        _code_hash = code_hash.hexdigest()
+    return _code_hash
+
+
+"""
+Loading compiled template model
+the definition is parsed and compiled only when the cache file is missing or outdated,
+cache_dir - directory of the cache files (the definition directory if None), use_cache=False disables the cache
+the returned model is a copy, so that its values may be set without affecting other loads
+"""
+def load_template(path, cache_dir=None, use_cache=True):
+    with open(path, 'rb') as file:
+        source = file.read()
+    key = hashlib.sha1(source + sys.version.encode() + str(cacheFormat).encode() +
+                       _get_code_hash().encode()).hexdigest()
+
+    # template loaded in the process
+    if path in _loaded_templates and _loaded_templates[path][0] == key:
+        return pickle.loads(_loaded_templates[path][1])
+
+    cache_path = os.path.join(cache_dir if cache_dir is not None else os.path.dirname(os.path.abspath(path)),
+                              os.path.basename(path) + cacheExtension)
+    data = None
+    if use_cache and os.path.exists(cache_path):
+        with open(cache_path, 'rb') as file:
+            cached = pickle.load(file)
+        if cached.get('Key') == key:
+            data = cached['Model']
+    if data is None:
+        data = pickle.dumps(build_template_model(read_template(path)), protocol=pickle.HIGHEST_PROTOCOL)
+        if use_cache:
+            # atomic replacement of the cache file
+            with open(cache_path + '.tmp', 'wb') as file:
+                pickle.dump({'Key': key, 'Model': data}, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_path + '.tmp', cache_path)
+    _loaded_templates[path] = (key, data)
+    return pickle.loads(data)
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Asset_Valuation'))
+from dcf import DCFModel
+from dcfscen import DCFScenarios
+from dcfbatch import DCFBatch
+
+
+# Synthetic model: chain of cost rows driven by sales, the cash flow row sums the costs
+def make_model(cost_num, year_num):
+    dates = [str(date.date()) for date in pd.date_range('2020-12-31', periods=year_num + 2, freq='YE')]
+    rows = ['Sales'] + ['Cost%03d' % ind for ind in range(cost_num)] + ['FCFF']
+    constants = ['growth', 'wacc', 'tg', 'net_debt', 'shares'] + ['c%03d' % ind for ind in range(cost_num)]
+
+    model = DCFModel()
+    model.set_valuation_calendar(dates[:2], dates[1], dates[2:])
+    model.specify_model(rows, ['inflation'], constants)
+    model.create_model_template()
+    model.set_general_row_formula('Sales', dates[2], 'Sales[-1] * (1 + growth + inflation)')
+    for ind in range(cost_num):
+        model.set_general_row_formula('Cost%03d' % ind, dates[2], 'Sales * c%03d' % ind)
+    model.set_general_row_formula('FCFF', dates[2], 'Sales - ' + ' - '.join(rows[1:-1]) if cost_num > 0 else 'Sales')
+    model.set_time_series('inflation', [0.04] * year_num)
+    for name, value in [('growth', 0.03), ('wacc', 0.15), ('tg', 0.03), ('net_debt', 100), ('shares', 10)]:
+        model.set_constant(name, value)
+    for ind in range(cost_num):
+        model.set_constant('c%03d' % ind, 0.5 / cost_num)
+    model.set_actual_values('Sales', [900, 1000])
+    model.set_valuation('FCFF', 'wacc', 'tg', 'net_debt', 'shares')
+    return model
+
+
+# Time compilation, full and incremental evaluation, scenarios and batch valuation
+def run(cost_num, year_num, scenario_num=10000, company_num=10000):
+    timings = {}
+    model = make_model(cost_num, year_num)
+
+    start = time.perf_counter()
+    model.compile_model()
+    timings['compile'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.evaluate_model()
+    model.value_model()
+    timings['evaluate'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.set_constant('c000', 0.01)
+    model.value_model()
+    timings['incremental'] = time.perf_counter() - start
+
+    scenarios = DCFScenarios(model)
+    scenarios.set_normal('growth', 0.03, 0.01)
+    scenarios.set_normal('inflation', 0.04, 0.01)
+    start = time.perf_counter()
+    scenarios.run(scenario_num, seed=0)
+    timings['scenarios'] = time.perf_counter() - start
+
+    batch = DCFBatch()
+    batch.add_template('synthetic', model)
+    for ind in range(company_num):
+        batch.add_company(ind, 'synthetic', constants={'growth': 0.01 + ind % 5 / 100},
+                          actual_values={'Sales': [900, 1000 + ind % 100]})
+    start = time.perf_counter()
+    batch.run(workers=1)
+    timings['batch'] = time.perf_counter() - start
+    return timings
+
+
+if __name__ == '__main__':
+    print('%6s %6s %12s %12s %12s %14s %14s' %
+          ('rows', 'years', 'compile', 'evaluate', 'incremental', '10k scenarios', '10k companies'))
+    for cost_num, year_num in [(5, 5), (50, 10), (200, 30)]:
+        t = run(cost_num, year_num)
+        print('%6d %6d %10.2fms %10.2fms %10.2fms %12.2fms %12.2fms' %
+              (cost_num + 2, year_num, 1000 * t['compile'], 1000 * t['evaluate'], 1000 * t['incremental'],
+               1000 * t['scenarios'], 1000 * t['batch']))
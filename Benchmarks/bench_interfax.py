@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data_Loading'))
+import fixtures
+from mockserver import MockServer
+from ifxdata import InterfaxData
+
+
+# Time Interfax request and parsing of the Bond/Coupons and Info/Calendar responses
+def run(server, fin_tool_num, event_num):
+    server.server.eventNum = event_num
+    ifx_data = InterfaxData()
+    ifx_data.get_token()
+    timings = {}
+
+    ifx_data.ifxIds = {fin_tool_id: None for fin_tool_id in range(1, fin_tool_num + 1)}
+    start = time.perf_counter()
+    ifx_data.get_interfax_data('Bond', 'Coupons')
+    timings['coupons_request'] = time.perf_counter() - start
+    start = time.perf_counter()
+    ifx_data.parsers['Bond']['Coupons'](ifx_data)
+    timings['coupons_parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ifx_data.get_interfax_data('Info', 'Calendar')
+    timings['calendar_request'] = time.perf_counter() - start
+    start = time.perf_counter()
+    ifx_data.parsers['Info']['Calendar'](ifx_data)
+    timings['calendar_parse'] = time.perf_counter() - start
+
+    ifx_data.free_token()
+    return timings
+
+
+if __name__ == '__main__':
+    with MockServer() as mock_server:
+        InterfaxData.baseurl = mock_server.url + '/v2'
+        print('%10s %8s %16s %14s %16s %14s' %
+              ('fin_tools', 'events', 'coupons_request', 'coupons_parse', 'calendar_request', 'calendar_parse'))
+        for fin_tool_num, event_num in [(10, 100), (100, 1000), (1000, 10000)]:
+            t = run(mock_server, fin_tool_num, event_num)
+            print('%10d %8d %14.2fms %12.2fms %14.2fms %12.2fms' %
+                  (fin_tool_num, event_num, 1000 * t['coupons_request'], 1000 * t['coupons_parse'],
+                   1000 * t['calendar_request'], 1000 * t['calendar_parse']))
+
+    # parsing of the large synthetic responses without http
+    ifx_data = InterfaxData()
+    ifx_data.roughData = fixtures.ifx_bond_coupons(range(10000))
+    start = time.perf_counter()
+    ifx_data.parsers['Bond']['Coupons'](ifx_data)
+    print('parse %d coupons: %.2fms' % (len(ifx_data.roughData), 1000 * (time.perf_counter() - start)))
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import datetime as dt
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data_Loading'))
+from sqlitedb import SQLiteConnection
+from mockserver import MockServer
+from moexdata import MOEXData
+from tradecal import set_calendar
+
+
+# SQLite database with the synthetic MOEX instruments: shares on TQBR, bonds on TQOB and the IMOEX index
+def make_database(share_num, bond_num):
+    db_conn = SQLiteConnection()
+    codes = ['SHR%05d' % ind for ind in range(share_num)] + ['SU%05dRMFS0' % ind for ind in range(bond_num)]
+    db_conn.insert_rows('dbo.DCT_Assets', [(ind + 1, code, 'TQBR' if ind < share_num else 'TQOB', 1)
+                                           for ind, code in enumerate(codes)])
+    db_conn.insert_rows('dbo.IND_Indices', [(1, 'IMOEX')])
+    return db_conn, ['IMOEX'] + codes
+
+
+# Time loading of the instruments for the period through the mock ISS server
+def run(server, share_num, bond_num, from_date, to_date):
+    db_conn, codes = make_database(share_num, bond_num)
+    # instrument metadata of the previous database are not valid
+    MOEXData.clear_instrument_cache()
+    set_calendar(None)
+    mxd = MOEXData()
+    mxd.url_template = server.iss_url_template()
+    mxd.dbConn = db_conn
+    mxd.set_dates(from_date, to_date)
+    timings = {'get_http_data': 0.0, 'save_data': 0.0}
+    request_num = server.server.requestNum
+    for code in codes:
+        start = time.perf_counter()
+        mxd.get_http_data(code)
+        timings['get_http_data'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        mxd.save_data()
+        timings['save_data'] += time.perf_counter() - start
+    timings['requests'] = server.server.requestNum - request_num
+    timings['rows'] = db_conn.count('dbo.MD_SecurityQuotes') + db_conn.count('dbo.MD_IndexPrices')
+    db_conn.close()
+    return timings
+
+
+if __name__ == '__main__':
+    with MockServer() as mock_server:
+        print('%8s %8s %9s %14s %14s' % ('codes', 'years', 'requests', 'get_http_data', 'save_data'))
+        for instrument_num, year_num in [(10, 1), (50, 1), (50, 4)]:
+            t = run(mock_server, instrument_num * 4 // 5, instrument_num // 5,
+                    dt.date(2023 - year_num, 1, 1), dt.date(2022, 12, 31))
+            print('%8d %8d %9d %12.2fms %12.2fms   %d rows' %
+                  (instrument_num + 1, year_num, t['requests'], 1000 * t['get_http_data'], 1000 * t['save_data'],
+                   t['rows']))
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Portfolio_Management'))
+import fixtures
+from sqlitedb import SQLiteConnection
+from ofz import OFZ
+
+
+# Time loading of the curve coefficients, yields calculation and PCA
+def run(year_num, term_num):
+    from_date, to_date = '%d-01-01' % (2023 - year_num), '2022-12-31'
+    days, coeffs = fixtures.ofz_curve_coefficients(from_date, to_date)
+    db_conn = SQLiteConnection()
+    db_conn.insert_rows('dbo.MOEX_SpotCurveCoeffs',
+                        [(str(day),) + tuple(row) for day, row in zip(days, coeffs.tolist())])
+
+    ofz = OFZ()
+    ofz.dbConn = db_conn
+    ofz.set_dates(from_date, to_date)
+    terms = [0.25 + 30 * ind / term_num for ind in range(term_num)]
+    timings = {}
+
+    start = time.perf_counter()
+    ofz.get_spot_curve_coefficients()
+    timings['coefficients'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ofz.calculate_yields(terms)
+    timings['yields'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ofz.pca(terms)
+    timings['pca'] = time.perf_counter() - start
+    db_conn.close()
+    return timings
+
+
+if __name__ == '__main__':
+    print('%8s %8s %14s %14s %14s' % ('days', 'terms', 'coefficients', 'yields', 'pca'))
+    for year_num, term_num in [(1, 10), (4, 10), (4, 60), (20, 10)]:
+        t = run(year_num, term_num)
+        print('%8d %8d %12.2fms %12.2fms %12.2fms' %
+              (len(pd.bdate_range('%d-01-01' % (2023 - year_num), '2022-12-31')), term_num,
+               1000 * t['coefficients'], 1000 * t['yields'], 1000 * t['pca']))
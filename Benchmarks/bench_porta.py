@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Portfolio_Management'))
+from porta import Portfolio
+
+
+# Synthetic portfolio with the specified number of shares and bonds
+def make_portfolio(share_num, bond_num, day_num=500, seed=0):
+    rng = np.random.default_rng(seed)
+    tickers = ['SHR%05d' % ind for ind in range(share_num)] + ['SU%05dRMFS0' % ind for ind in range(bond_num)]
+    ast_num = len(tickers)
+
+    port = Portfolio()
+    port.portfolioId = 0
+    port.set_dates(pd.Timestamp('2021-01-01'), pd.Timestamp('2021-01-01') + pd.Timedelta(days=day_num - 1))
+    port.set_portfolio_data(np.arange(ast_num), tickers, rng.integers(1, 1000, ast_num), np.zeros(ast_num),
+                            durations=[np.nan] * share_num + list(rng.uniform(0.5, 10, bond_num)))
+
+    # geometric random walk prices with some missing quotes
+    dates = pd.date_range(port.fromDate, port.toDate, freq='D')
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (day_num, ast_num)), axis=0))
+    prices[rng.random(prices.shape) < 0.02] = np.nan
+    return port, pd.DataFrame(prices, index=dates, columns=tickers)
+
+
+# Time risk calculation steps for the portfolio
+def run(share_num, bond_num):
+    port, prices = make_portfolio(share_num, bond_num)
+    timings = {}
+
+    start = time.perf_counter()
+    port.set_market_data(prices)
+    timings['market_data'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    port.calculate_covariance()
+    timings['covariance'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    port.calculate_intra_risk_metrics()
+    timings['risk_metrics'] = time.perf_counter() - start
+    return timings
+
+
+if __name__ == '__main__':
+    print('%8s %14s %14s %14s' % ('assets', 'market_data', 'covariance', 'risk_metrics'))
+    for asset_num in [10, 100, 1000, 3000]:
+        t = run(asset_num * 4 // 5, asset_num // 5)
+        print('%8d %12.2fms %12.2fms %12.2fms' %
+              (asset_num, 1000 * t['market_data'], 1000 * t['covariance'], 1000 * t['risk_metrics']))
@@ -0,0 +1,39 @@
+import os
+import sys
+import subprocess
+
+root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# heavy packages expected to be imported on first use only
+heavyModules = ['numpy', 'pandas', 'requests', 'pyodbc', 'yfinance']
+
+# code run in a fresh interpreter: import time of the module and heavy packages imported by it
+probeTemplate = """
+import sys, time
+sys.path[:0] = [%r, %r]
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(name for name in %r if name in sys.modules) or '-')
+"""
+
+
+# Time import of the statement in a fresh interpreter (best of the runs)
+def run(statement, run_num=5):
+    code = probeTemplate % (os.path.join(root_dir, 'Data_Loading'), os.path.join(root_dir, 'Portfolio_Management'),
+                            statement, heavyModules)
+    timings = []
+    for ind in range(run_num):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        elapsed, loaded = output.split()
+        timings.append(float(elapsed))
+    return min(timings), loaded
+
+
+if __name__ == '__main__':
+    print('%-42s %12s   %s' % ('statement', 'time', 'heavy modules imported'))
+    for statement in ['import moexdata', 'import ifxdata', 'import yfin', 'import dbpool', 'import porta',
+                      'import ofz', 'import porta, ofz, moexdata, ifxdata, yfin',
+                      'import ifxdata; ifxdata.InterfaxData()',
+                      'import pandas, requests  # eager reference']:
+        elapsed, loaded = run(statement)
+        print('%-42s %10.2fms   %s' % (statement, 1000 * elapsed, loaded))
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fixtures
+from sqlitedb import SQLiteConnection
+from bench_porta import Portfolio
+
+
+# SQLite database with a synthetic portfolio of shares and their quotes
+def make_database(port_id, share_num, from_date, to_date):
+    db_conn = SQLiteConnection()
+    tickers = ['SHR%05d' % ind for ind in range(share_num)]
+    db_conn.insert_rows('dbo.DCT_Assets', [(ind + 1, ticker, 'TQBR', 1) for ind, ticker in enumerate(tickers)])
+    rng = np.random.default_rng(port_id)
+    db_conn.insert_rows('dbo.PM_Structures', [(port_id, ind + 1, float(rng.integers(1, 1000)), 0.0)
+                                              for ind in range(share_num)])
+    for ind, ticker in enumerate(tickers):
+        data = fixtures.iss_history('shares', 'TQBR', ticker, from_date, to_date)['history']['data']
+        db_conn.insert_rows('dbo.MD_SecurityQuotes',
+                            [(ind + 1, row[1], row[6], row[7], row[8], row[11], None, None) for row in data])
+    return db_conn
+
+
+# Time the end-to-end VAR calculation of the portfolio stored in DB
+def run(share_num, from_date='2021-01-01', to_date='2022-12-31'):
+    db_conn = make_database(1, share_num, from_date, to_date)
+    port = Portfolio()
+    port.dbConn = db_conn
+    port.set_dates(from_date, to_date)
+    timings = {}
+
+    start = time.perf_counter()
+    port.set_portfolio_by_id(1)
+    port.get_market_data()
+    timings['load'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    port.reshape_as_weekly()
+    port.calculate_covariance()
+    port.calculate_intra_risk_metrics()
+    timings['var'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    port.save_data()
+    timings['save'] = time.perf_counter() - start
+    timings['rows'] = db_conn.count('dbo.RM_VARs')
+    db_conn.close()
+    return timings
+
+
+if __name__ == '__main__':
+    print('%8s %12s %12s %12s' % ('assets', 'load', 'var', 'save'))
+    for asset_num in [10, 100, 500]:
+        t = run(asset_num)
+        print('%8d %10.2fms %10.2fms %10.2fms' % (asset_num, 1000 * t['load'], 1000 * t['var'], 1000 * t['save']))
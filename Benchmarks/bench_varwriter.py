@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [bench_dir, os.path.join(bench_dir, '..', 'Portfolio_Management')]
+from bench_porta import make_portfolio
+from varwriter import VARWriter
+
+
+# Calculated synthetic portfolios
+def make_portfolios(port_num, asset_num):
+    ports = []
+    for ind in range(port_num):
+        port, prices = make_portfolio(asset_num, 0, day_num=60, seed=ind)
+        port.portfolioId = ind
+        port.set_market_data(prices)
+        port.calculate_covariance()
+        port.calculate_intra_risk_metrics()
+        ports.append(port)
+    return ports
+
+
+# Row by row writing with a commit per row (previous Portfolio.save_data behaviour)
+def save_row_by_row(db_conn, writer):
+    for key in writer.keys:
+        db_conn.execute("delete from RM_VARs where PortfolioId = %d and StartDate = '%s' and EndDate = '%s' "
+                        "and Frequency = '%s'" % (key[0], key[1].date(), key[2].date(), key[3]))
+        db_conn.commit()
+    for row in writer.rows:
+        db_conn.execute("insert into RM_VARs values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        row[:2] + (str(row[2].date()), str(row[3].date())) + row[4:])
+        db_conn.commit()
+
+
+if __name__ == '__main__':
+    for port_num in [10, 100, 500]:
+        writer = VARWriter()
+        for port in make_portfolios(port_num, 50):
+            writer.add_portfolio(port)
+
+        db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        db_conn = sqlite3.connect(db_path)
+        writer.save_to_sqlite(db_conn)
+        start = time.perf_counter()
+        save_row_by_row(db_conn, writer)
+        row_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        writer.save_to_sqlite(db_conn)
+        bulk_time = time.perf_counter() - start
+        row_num = db_conn.execute("select count(*) from RM_VARs").fetchone()[0]
+        db_conn.close()
+        os.remove(db_path)
+        print('%5d portfolios %7d rows: row by row %9.2fms, bulk %9.2fms' %
+              (port_num, row_num, 1000 * row_time, 1000 * bulk_time))
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data_Loading'))
+import fixtures
+from sqlitedb import SQLiteConnection
+from yfin import yfin
+
+
+# SQLite database with the Yahoo tickers and a MOEX security sharing the first ticker
+def make_database(tickers):
+    db_conn = SQLiteConnection()
+    db_conn.insert_rows('dbo.DCT_Assets', [(ind + 1, ticker, None, 2) for ind, ticker in enumerate(tickers)] +
+                        [(len(tickers) + 1, tickers[0], 'TQBR', 1)])
+    return db_conn
+
+
+# Check and time loading of the recorded yfinance data: tickers are resolved in DB, the recorded frame is
+# normalized and saved twice (repeated loads replace the stored quotes)
+# the asserts are smoke checks of the benchmark run (the repository has no test suite)
+def run(ticker_num, year_num, flat=False):
+    tickers = ['TCK%04d' % ind for ind in range(ticker_num)]
+    from_date, to_date = '%d-01-01' % (2023 - year_num), '2022-12-31'
+    raw_data = fixtures.yahoo_history(tickers, from_date, to_date, flat)
+    db_conn = make_database(tickers)
+    timings = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'yahoo.pkl')
+        recorder = yfin()
+        recorder.rawData = raw_data
+        recorder.record_data(path)
+
+        loader = yfin()
+        loader.dbConn = db_conn
+        # unknown tickers are skipped
+        asset_ids = loader.set_tickers(tickers + ['UNKNOWN'])
+        assert asset_ids[tickers[0]] == 1 and asset_ids['UNKNOWN'] is None, asset_ids
+        start = time.perf_counter()
+        quotes = loader.load_recorded_data(path)
+        timings['normalize'] = time.perf_counter() - start
+    # days without close prices are dropped
+    expected = int(raw_data['Close'].notna().to_numpy().sum())
+    assert len(quotes) == expected, (len(quotes), expected)
+    assert list(quotes.columns) == yfin.columns and quotes['Date'].dt.tz is None
+
+    start = time.perf_counter()
+    loader.save_data()
+    timings['save_data'] = time.perf_counter() - start
+    loader.save_data()
+    timings['rows'] = db_conn.count('dbo.MD_SecurityQuotes')
+    assert timings['rows'] == expected, (timings['rows'], expected)
+    db_conn.close()
+    return timings
+
+
+if __name__ == '__main__':
+    print('%8s %8s %12s %12s' % ('tickers', 'years', 'normalize', 'save_data'))
+    for ticker_num, year_num, flat in [(1, 1, True), (10, 1, False), (100, 4, False)]:
+        t = run(ticker_num, year_num, flat)
+        print('%8d %8d %10.2fms %10.2fms   %d rows' %
+              (ticker_num, year_num, 1000 * t['normalize'], 1000 * t['save_data'], t['rows']))
@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import datetime as dt
+import numpy as np
+
+"""
+HTTP fixtures of the ISS and Interfax responses
+Recorded responses are stored as JSON files in the fixtures directory keyed by the request (method, path, body);
+requests without a recorded response are answered by the synthetic generators, which scale
+to any number of instruments and dates
+"""
+
+fixturesDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# ISS history columns of the shares / bonds / indices boards (subset used by the modules)
+issShareColumns = ['BOARDID', 'TRADEDATE', 'SHORTNAME', 'SECID', 'NUMTRADES', 'VALUE', 'OPEN', 'LOW', 'HIGH',
+                   'LEGALCLOSEPRICE', 'WAPRICE', 'CLOSE', 'VOLUME']
+issBondColumns = issShareColumns + ['YIELDCLOSE', 'ACCINT']
+issIndexColumns = ['BOARDID', 'SECID', 'TRADEDATE', 'SHORTNAME', 'NAME', 'CLOSE', 'OPEN', 'HIGH', 'LOW', 'VALUE']
+
+
+# Fixture file name of the request
+def fixture_name(method, path, body=None):
+    key = method + ' ' + path + ' ' + json.dumps(body, sort_keys=True, default=str)
+    return hashlib.sha1(key.encode()).hexdigest() + '.json'
+
+
+# Recorded response of the request or None
+def load_fixture(method, path, body=None):
+    file_path = os.path.join(fixturesDir, fixture_name(method, path, body))
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+# Record response of the request
+def record_fixture(method, path, body, response):
+    os.makedirs(fixturesDir, exist_ok=True)
+    with open(os.path.join(fixturesDir, fixture_name(method, path, body)), 'w', encoding='utf-8') as file:
+        json.dump(response, file)
+
+
+# Deterministic random generator of the item
+def item_rng(item):
+    return np.random.default_rng(int(hashlib.md5(str(item).encode()).hexdigest()[:8], 16))
+
+
+# Business days of the period
+def business_days(from_date, till_date):
+    days = np.arange(np.datetime64(from_date), np.datetime64(till_date) + 1)
+    return days[np.is_busday(days)]
+
+
+# Synthetic ISS history response of the instrument for the period
+def iss_history(asset_class, board, code, from_date, till_date):
+    days = business_days(from_date, till_date)
+    rng = item_rng(code)
+    # the price level is the same for any requested period
+    level = 100 * np.exp(rng.normal(0, 0.5))
+    offsets = (days - np.datetime64('2000-01-03')).astype(int)
+    closes = level * np.exp(0.01 * np.sin(offsets / 20 + rng.uniform(0, 6)) + 0.001 * (offsets % 7))
+    data = []
+    for day, close in zip(days.astype(str), closes):
+        open_price, low, high = close * 0.995, close * 0.99, close * 1.01
+        if asset_class == 'index':
+            data.append([board, code, day, code, code, close, open_price, high, low, 1e9])
+        else:
+            row = [board, day, code, code, int(rng.integers(0, 1000)), 1e6, open_price, low, high, close,
+                   close, close, 10000]
+            if asset_class == 'bonds':
+                row += [round(8 + close / 100, 2), round(rng.uniform(0, 40), 2)]
+            data.append(row)
+    columns = issIndexColumns if asset_class == 'index' else \
+        issBondColumns if asset_class == 'bonds' else issShareColumns
+    return {'history': {'columns': columns, 'data': data}}
+
+
+# Synthetic Interfax Bond/Coupons response of the fin tools
+def ifx_bond_coupons(fin_tool_ids, coupon_num=20):
+    data = []
+    for fin_tool_id in fin_tool_ids:
+        rng = item_rng(fin_tool_id)
+        start = dt.date(2015, 1, 1) + dt.timedelta(days=int(rng.integers(0, 365)))
+        rate = round(rng.uniform(5, 15), 2)
+        for ind in range(coupon_num):
+            begin, end = start + dt.timedelta(days=182 * ind), start + dt.timedelta(days=182 * (ind + 1))
+            data.append({'id_fintool': fin_tool_id, 'id_coupon': ind + 1,
+                         'begin_period': begin.isoformat() + 'T00:00:00', 'end_period': end.isoformat() + 'T00:00:00',
+                         'pay_per_bond': round(1000 * rate / 200, 2), 'coupon_rate': rate})
+    return data
+
+
+# Synthetic Interfax MOEX/Securities response of the codes
+def ifx_moex_securities(codes):
+    return [{'secid': code, 'fintoolid': 100000 + ind, 'isin': 'RU%010d' % ind, 'id_iss': 200000 + ind}
+            for ind, code in enumerate(codes)]
+
+
+# Synthetic Interfax Info/Calendar response
+def ifx_info_calendar(event_num):
+    today = dt.date.today()
+    return {'timeTableFields': [{'isiNcode': 'RU%010d' % ind, 'nickname': 'Company %d' % ind,
+                                 'recomendFixDate': (today + dt.timedelta(days=ind % 90)).isoformat()}
+                                for ind in range(event_num)]}
+
+
+# Synthetic OFZ spot curve coefficients (MOEX_SpotCurveCoeffs) for the business days of the period
+def ofz_curve_coefficients(from_date, till_date, seed=0):
+    days = business_days(from_date, till_date)
+    rng = np.random.default_rng(seed)
+    day_num = len(days)
+    walk = np.cumsum(rng.normal(0, 5, (day_num, 3)), axis=0)
+    coeffs = np.column_stack([800 + walk[:, 0], -100 + walk[:, 1], -50 + walk[:, 2], np.full(day_num, 1.5),
+                              rng.normal(0, 20, (day_num, 9))])
+    return days.astype('datetime64[D]').astype(object), coeffs
+
+
+# Synthetic yfinance download (group_by='column'): dates x (field, ticker) columns, the last day of each ticker
+# is missing (NaN); flat - plain field columns as returned for one ticker by the older yfinance versions
+def yahoo_history(tickers, from_date, till_date, flat=False):
+    import pandas as pd
+    days = business_days(from_date, till_date)
+    frames = {}
+    for ticker in tickers:
+        rng = item_rng(ticker)
+        closes = 100 * np.exp(rng.normal(0, 0.5) + np.cumsum(rng.normal(0, 0.01, len(days))))
+        closes[-1] = np.nan
+        frames[ticker] = pd.DataFrame({'Adj Close': closes, 'Close': closes, 'High': closes * 1.01,
+                                       'Low': closes * 0.99, 'Open': closes * 0.995,
+                                       'Volume': rng.integers(0, 10 ** 6, len(days))},
+                                      index=pd.DatetimeIndex(days, name='Date'))
+    if flat:
+        return frames[tickers[0]]
+    frame = pd.concat(frames, axis=1).swaplevel(0, 1, axis=1).sort_index(axis=1)
+    frame.columns.names = ['Price', 'Ticker']
+    return frame
@@ -0,0 +1,110 @@
+import re
+import json
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import fixtures
+
+"""
+Local mock server replaying ISS and Interfax responses
+    MOEXData:     mxd.url_template = server.iss_url_template()
+    InterfaxData: InterfaxData.baseurl = server.url + '/v2'
+"""
+
+# ISS history request path
+issPattern = re.compile(r'^/iss/history/engines/stock/markets/(\w+)/boards/(\w+)/securities/([\w.-]+)/securities\.json$')
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    # send JSON response
+    def __respond(self, response, status=200):
+        content = json.dumps(response, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        self.server.requestNum += 1
+        self.server.sentBytes += len(content)
+
+    def do_GET(self):
+        response = fixtures.load_fixture('GET', self.path)
+        if response is None:
+            url = urlsplit(self.path)
+            match = issPattern.match(url.path)
+            if match is None:
+                return self.__respond({'error': 'unknown path'}, 404)
+            query = parse_qs(url.query)
+            response = fixtures.iss_history(match.group(1), match.group(2), match.group(3),
+                                            query['from'][0], query['till'][0])
+        self.__respond(response)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length)) if length > 0 else None
+        response = fixtures.load_fixture('POST', self.path, body)
+        if response is None:
+            response = self.__interfax_response(self.path, body or {})
+        if response is None:
+            return self.__respond({'error': 'unknown path'}, 404)
+        self.__respond(response)
+
+    # synthetic response of the Interfax action
+    def __interfax_response(self, path, body):
+        action = path.split('/v2/')[-1]
+        if action == 'Account/Login':
+            return {'token': 'mock-token'}
+        if action == 'Account/Logoff':
+            return {}
+        if action == 'Bond/Coupons':
+            return fixtures.ifx_bond_coupons([int(item) for item in re.findall(r'\d+', body.get('filter', ''))],
+                                             self.server.couponNum)
+        if action == 'MOEX/Securities':
+            return fixtures.ifx_moex_securities(re.findall(r"'([^']+)'", body.get('filter', '')))
+        if action == 'Info/Calendar':
+            return fixtures.ifx_info_calendar(self.server.eventNum)
+        return None
+
+    # no request logging
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer:
+
+    def __init__(self, port=0, coupon_num=20, event_num=1000):
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), MockRequestHandler)
+        self.server.daemon_threads = True
+        # size of the synthetic Interfax responses
+        self.server.couponNum = coupon_num
+        self.server.eventNum = event_num
+        # served requests / bytes
+        self.server.requestNum = self.server.sentBytes = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    # MOEXData url template of the server
+    def iss_url_template(self):
+        return self.url + '/iss/history/engines/stock/markets/%s/boards/%s/securities/%s/' \
+                          'securities.json?iss.meta=off&from=%s&till=%s'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
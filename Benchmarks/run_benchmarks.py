@@ -0,0 +1,36 @@
+import os
+import sys
+import glob
+import runpy
+import time
+
+"""
+Offline benchmark suite: HTTP requests are served by the local mock server (mockserver.py)
+from recorded or synthetic fixtures (fixtures.py), databases are SQLite stand-ins (sqlitedb.py)
+Usage: python run_benchmarks.py [--profile PREFIX] [name ...]  e.g. python run_benchmarks.py moex dcf
+--profile - print the timing spans of each benchmark and dump them to the pstats file PREFIX_<name>.prof
+"""
+
+if __name__ == '__main__':
+    bench_dir = os.path.dirname(os.path.abspath(__file__))
+    names = sys.argv[1:]
+    profile_path = None
+    if '--profile' in names:
+        pos = names.index('--profile')
+        profile_path = names[pos + 1]
+        names = names[:pos] + names[pos + 2:]
+        sys.path.insert(0, os.path.join(bench_dir, '..', 'Data_Loading'))
+        import profiling
+        profiling.enable()
+    for path in sorted(glob.glob(os.path.join(bench_dir, 'bench_*.py'))):
+        name = os.path.basename(path)[len('bench_'):-len('.py')]
+        if len(names) > 0 and name not in names:
+            continue
+        print('----- %s -----' % name)
+        start = time.perf_counter()
+        runpy.run_path(path, run_name='__main__')
+        print('%s: %.1fs\n' % (name, time.perf_counter() - start))
+        if profile_path is not None:
+            print(profiling.summary().to_string(float_format='%.4f'), '\n')
+            profiling.dump_stats('%s_%s.prof' % (profile_path, name))
+            profiling.reset()
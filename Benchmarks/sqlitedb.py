@@ -0,0 +1,125 @@
+import re
+import ast
+import sqlite3
+
+"""
+SQLite stand-in for the pyodbc connection to the Analysis database
+Tables are created in the attached 'dbo' schema, so the module queries run unchanged;
+stored procedures called by 'exec dbo.Name args' are replaced by the equivalent select statements
+"""
+
+# tables of the Analysis database used by the modules
+tableScripts = [
+    "create table dbo.DCT_Assets (Id integer primary key, Ticker text, BoardCode text, ExchangeId integer)",
+    "create table dbo.IND_Indices (Id integer primary key, [Name] text)",
+    "create table dbo.IND_Structures (IndexId integer, SecurityId integer)",
+    "create table dbo.MD_SecurityQuotes (AssetId integer, [Date] text, [Open] real, Low real, High real, "
+    "[Close] real, YTM_Close real, Accrued real)",
+    "create index dbo.IX_MD_SecurityQuotes on MD_SecurityQuotes (AssetId, [Date])",
+    "create table dbo.MD_IndexPrices (IndexId integer, [Date] text, [Open] real, Low real, High real, [Close] real)",
+    "create index dbo.IX_MD_IndexPrices on MD_IndexPrices (IndexId, [Date])",
+    "create table dbo.PM_Structures (PortfolioId integer, AssetId integer, Quantity real, Weight real)",
+    "create table dbo.RM_VARs (PortfolioId integer, SecurityId integer, StartDate text, EndDate text, "
+    "Frequency text, udVAR real, VAR real, mVAR real, cVAR real)",
+    "create table dbo.MOEX_SpotCurveCoeffs ([Date] text, B1 real, B2 real, B3 real, T1 real, G1 real, G2 real, "
+    "G3 real, G4 real, G5 real, G6 real, G7 real, G8 real, G9 real)",
+    "create table dbo.ACF_Coupons (FintoolId integer, CouponPeriod integer, StartDate text, EndDate text, "
+    "[Value] real)"]
+
+# stored procedures: name -> select statement with the procedure parameters
+procedures = {
+    'dbo.AssetPriceSeries':
+        "select [Date], [Close] from dbo.MD_SecurityQuotes where AssetId = ? and [Date] between ? and ? "
+        "order by [Date]",
+    'dbo.PortfolioStructure':
+        "select ast.Id, ast.Ticker, str.Quantity, str.Weight from dbo.PM_Structures str "
+        "join dbo.DCT_Assets ast on ast.Id = str.AssetId where str.PortfolioId = ? order by ast.Id"}
+
+# procedure call: exec name [arguments]
+execPattern = re.compile(r'^\s*exec\s+([\w.]+)\s*(.*?)\s*$', re.IGNORECASE | re.DOTALL)
+
+
+# Cursor with the pyodbc cursor interface
+class SQLiteCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.conn.cursor()
+        # pyodbc option accepted for compatibility
+        self.fast_executemany = False
+
+    # translate procedure calls to select statements
+    @staticmethod
+    def translate(sql, params):
+        match = execPattern.match(sql)
+        if match is None:
+            return sql, params
+        name, arguments = match.group(1), match.group(2)
+        if name not in procedures:
+            raise sqlite3.OperationalError("Unknown procedure %s" % name)
+        # literal arguments are passed as parameters
+        if len(arguments) > 0 and '?' not in arguments:
+            params = list(ast.literal_eval('(' + arguments + ',)'))
+        return procedures[name], params
+
+    # pyodbc passes parameters as a sequence or as separate arguments
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        sql, params = self.translate(sql, list(params))
+        self.cursor.execute(sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self.cursor.executemany(sql, seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.cursor.close()
+
+
+# Connection with the pyodbc connection interface
+class SQLiteConnection:
+
+    def __init__(self, database=':memory:'):
+        self.conn = sqlite3.connect(database, check_same_thread=False)
+        self.conn.execute("attach database ? as dbo", (':memory:' if database == ':memory:' else database + '.dbo',))
+        for script in tableScripts:
+            self.conn.execute(script.replace('create table', 'create table if not exists')
+                              .replace('create index', 'create index if not exists'))
+        self.conn.commit()
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+    # fill the table by rows
+    def insert_rows(self, table, rows):
+        if len(rows) == 0:
+            return
+        self.conn.executemany("insert into %s values (%s)" % (table, ', '.join(['?'] * len(rows[0]))), rows)
+        self.conn.commit()
+
+    # number of the table rows
+    def count(self, table):
+        return self.conn.execute("select count(*) from %s" % table).fetchone()[0]
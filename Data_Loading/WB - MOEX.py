@@ -1,23 +1,17 @@
-import pyodbc
 from datetime import date
 import importlib
 import sys
 # from moexdata import MOEXData
+from jobstate import JobState
 
 
 MOEXData = importlib.reload(sys.modules['moexdata']).MOEXData
 
-dbConn = pyodbc.connect(
-    "Driver={SQL Server Native Client 11.0};Server=LAPTOP-QBI0SKOK\\LOCALDB; Database=Analysis;Trusted_Connection=yes;")
-cursor = dbConn.cursor()
-cursor.execute(
-    "select ast.ticker from dbo.DCT_Assets ast join dbo.IND_Structures ins on ast.Id = ins.SecurityId "
-    "where ins.IndexId = 1")
-indexSecurities = cursor.fetchall()
-dbConn.close()
-
 mxd = MOEXData()
 mxd.open_db_conn()
+# metadata of all instruments and constituents of the index with IndexId = 1
+mxd.preload_instruments()
+indexSecurities = mxd.resolve_index_constituents(1)
 fromDate = date(2019, 9, 1)
 toDate = date(2023, 4, 21)
 mxd.set_dates(fromDate, toDate)
@@ -26,9 +20,12 @@ mxd.set_dates(fromDate, toDate)
 data = mxd.get_http_data('RU000A102ZH2')
 mxd.save_data()
 
-for sct in indexSecurities:
-    data = mxd.get_http_data(sct[0])
-    mxd.save_data()
+# yearly windows of the securities are checkpointed: rerun after a failure loads the unfinished windows only
+jobState = JobState('backfill.db', 'MOEX IMOEX 2019-09-01 2023-04-21')
+failed = mxd.backfill(indexSecurities, jobState)
+jobState.close()
+for sct, windowFrom, windowTo, error in failed:
+    print("%s %s - %s failed: %r" % (sct, windowFrom, windowTo, error))
 print("Done")
 
 mxd.close_db_conn()
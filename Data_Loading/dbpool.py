@@ -0,0 +1,158 @@
+import os
+import threading
+from contextlib import contextmanager
+from lazyimport import lazy_import
+
+pyodbc = lazy_import('pyodbc')
+
+"""
+Shared DB connections: one pool per database, connections are borrowed by MOEXData, yfin, InterfaxData,
+Portfolio and OFZ instead of connecting on every call
+Connection strings are configured by the environment variables INVESTTOOLS_<DATABASE>_DSN
+(e.g. INVESTTOOLS_ANALYSIS_DSN="DSN=Analysis;Trusted_Connection=yes;") or by set_connection_string
+    with get_pool('Analysis').transaction() as db_conn:
+        db_conn.cursor().execute(...)
+"""
+
+# default connection strings of the databases
+connectionStrings = {
+    'Analysis': "Driver={SQL Server Native Client 11.0};Server=LAPTOP-QBI0SKOK\\LOCALDB;"
+                "Database=Analysis;Trusted_Connection=yes;",
+    'AnalyticDev': "Driver={SQL Server Native Client 11.0};Server=CLSDB3034\\CLSDB3034;"
+                   "Database=AnalyticDev;Trusted_Connection=yes;"}
+
+# connection strings set by set_connection_string (override the environment variables)
+_connStrings = {}
+# pools of the databases: database -> ConnectionPool
+_pools = {}
+_poolsLock = threading.Lock()
+
+
+class ConnectionPool:
+
+    # connect - connection factory called with the connection string (pyodbc.connect by default)
+    def __init__(self, conn_string, max_size=16, connect=None, timeout=60):
+        self.connString = conn_string
+        self.maxSize = max_size
+        self.connect = connect
+        # waiting time for a free connection (seconds)
+        self.timeout = timeout
+
+        # idle connections and number of the opened connections
+        self.idle = []
+        self.openedNum = 0
+        self.condition = threading.Condition()
+
+    # borrow connection: an idle one, a new one within the pool size or the first released one
+    def acquire(self):
+        with self.condition:
+            while len(self.idle) == 0 and self.openedNum >= self.maxSize:
+                if not self.condition.wait(self.timeout):
+                    raise TimeoutError("No free connection in the pool for %d seconds" % self.timeout)
+            if len(self.idle) > 0:
+                return self.idle.pop()
+            self.openedNum += 1
+        try:
+            # pyodbc is imported by the first opened connection
+            connect = self.connect if self.connect is not None else pyodbc.connect
+            return connect(self.connString)
+        except Exception:
+            with self.condition:
+                self.openedNum -= 1
+                self.condition.notify()
+            raise
+
+    # return connection to the pool: uncommitted changes are rolled back, broken connections are closed
+    def release(self, db_conn, broken=False):
+        if db_conn is None:
+            return
+        if not broken:
+            try:
+                db_conn.rollback()
+            except Exception:
+                broken = True
+        with self.condition:
+            if broken:
+                self.openedNum -= 1
+            else:
+                self.idle.append(db_conn)
+            self.condition.notify()
+        if broken:
+            try:
+                db_conn.close()
+            except Exception:
+                pass
+
+    # borrowed connection within the block
+    @contextmanager
+    def connection(self):
+        db_conn = self.acquire()
+        try:
+            yield db_conn
+        finally:
+            self.release(db_conn)
+
+    # transaction within the block: commit on success, rollback on exception
+    @contextmanager
+    def transaction(self):
+        db_conn = self.acquire()
+        try:
+            yield db_conn
+            db_conn.commit()
+        except Exception:
+            db_conn.rollback()
+            raise
+        finally:
+            self.release(db_conn)
+
+    # close idle connections
+    def close_all(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.openedNum -= len(idle)
+        for db_conn in idle:
+            db_conn.close()
+
+
+# connection string of the database: the set one, environment variable or the default one
+def get_connection_string(database):
+    if database in _connStrings:
+        return _connStrings[database]
+    return os.environ.get('INVESTTOOLS_%s_DSN' % database.upper(), connectionStrings.get(database))
+
+
+# set connection string of the database (the existing pool is closed)
+def set_connection_string(database, conn_string):
+    _connStrings[database] = conn_string
+    with _poolsLock:
+        pool = _pools.pop(database, None)
+    if pool is not None:
+        pool.close_all()
+
+
+# shared pool of the database
+def get_pool(database='Analysis', max_size=16, connect=None):
+    with _poolsLock:
+        if database not in _pools:
+            conn_string = get_connection_string(database)
+            if conn_string is None:
+                raise KeyError("Connection string of the database %s is not set" % database)
+            _pools[database] = ConnectionPool(conn_string, max_size, connect)
+        return _pools[database]
+
+
+# replace the pool of the database (e.g. by a pool of local SQLite connections)
+def set_pool(database, pool):
+    with _poolsLock:
+        previous = _pools.get(database)
+        _pools[database] = pool
+    if previous is not None and previous is not pool:
+        previous.close_all()
+
+
+# close idle connections of all pools
+def close_pools():
+    with _poolsLock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
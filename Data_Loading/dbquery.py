@@ -0,0 +1,119 @@
+"""
+Parameterized SQL statements of the modules and their prepared execution
+Each statement is executed by its own cursor: pyodbc prepares the statement once and re-executes
+the prepared handle while the cursor receives the same SQL text, so the server caches one plan per statement
+    queries = prepared_queries(db_conn)
+    queries.fetchall('AssetPriceSeries', asset_id, from_date, to_date)
+Round-trips are timed by the profiling spans 'SQL.<statement name>'
+"""
+import profiling
+
+# statements: name -> SQL text with ? parameters
+statements = {
+    # MOEX instruments
+    'FindIndex': "select Id from dbo.IND_Indices where [Name] = ?",
+    'FindSecurity': "select Id, BoardCode from dbo.DCT_Assets where ExchangeId = 1 and Ticker = ?",
+    'AllIndices': "select [Name], Id from dbo.IND_Indices",
+    'AllSecurities': "select Ticker, Id, BoardCode from dbo.DCT_Assets where ExchangeId = 1",
+    # securities of the other exchanges (Yahoo Finance tickers)
+    'ExchangeSecurities': "select Ticker, Id from dbo.DCT_Assets where ExchangeId = ?",
+    'IndexConstituentsById':
+        "select ast.Ticker, ast.Id, ast.BoardCode from dbo.DCT_Assets ast "
+        "join dbo.IND_Structures ins on ast.Id = ins.SecurityId where ast.ExchangeId = 1 and ins.IndexId = ? "
+        "order by ast.Ticker",
+    'IndexConstituentsByName':
+        "select ast.Ticker, ast.Id, ast.BoardCode from dbo.DCT_Assets ast "
+        "join dbo.IND_Structures ins on ast.Id = ins.SecurityId "
+        "join dbo.IND_Indices ind on ind.Id = ins.IndexId where ast.ExchangeId = 1 and ind.[Name] = ? "
+        "order by ast.Ticker",
+    # market data
+    'TradingDays':
+        "select distinct prc.[Date] from dbo.MD_IndexPrices prc join dbo.IND_Indices ind on ind.Id = prc.IndexId "
+        "where ind.[Name] = ? order by prc.[Date]",
+    'DeleteIndexPrices': "delete from dbo.MD_IndexPrices where IndexId = ? and [Date] between ? and ?",
+    'DeleteSecurityQuotes': "delete from dbo.MD_SecurityQuotes where AssetId = ? and [Date] between ? and ?",
+    'InsertIndexPrices':
+        "insert into dbo.MD_IndexPrices (IndexId, [Date], [Open], Low, High, [Close]) values (?, ?, ?, ?, ?, ?)",
+    'InsertSecurityQuotes':
+        "insert into dbo.MD_SecurityQuotes (AssetId, [Date], [Open], Low, High, [Close], YTM_Close, Accrued) "
+        "values (?, ?, ?, ?, ?, ?, ?, ?)",
+    'LastIndexPriceDates': "select IndexId, max([Date]) from dbo.MD_IndexPrices group by IndexId",
+    'LastSecurityQuoteDates': "select AssetId, max([Date]) from dbo.MD_SecurityQuotes group by AssetId",
+    # portfolios
+    'PortfolioStructure': "exec dbo.PortfolioStructure ?",
+    'AssetPriceSeries': "exec dbo.AssetPriceSeries ?, ?, ?",
+    'ExtendedAssetPriceSeries': "exec dbo.ExtendedAssetPriceSeries ?, ?, ?",
+    # OFZ curve
+    'SpotCurveCoefficients':
+        "select [Date], B1, B2, B3, T1, G1, G2, G3, G4, G5, G6, G7, G8, G9 from dbo.MOEX_SpotCurveCoeffs "
+        "where [Date] between ? and ? order by [Date]",
+    # Interfax coupons
+    'DeleteCoupons': "delete from dbo.ACF_Coupons where FintoolId = ?",
+    'InsertCoupons':
+        "insert into dbo.ACF_Coupons (FintoolId, CouponPeriod, StartDate, EndDate, [Value]) values (?, ?, ?, ?, ?)"}
+
+
+class PreparedQueries:
+
+    def __init__(self, db_conn):
+        self.dbConn = db_conn
+        # cursors of the executed statements: name -> cursor
+        self.cursors = {}
+
+    # cursor of the statement
+    def cursor(self, name):
+        if name not in self.cursors:
+            self.cursors[name] = self.dbConn.cursor()
+        return self.cursors[name]
+
+    # execute statement with the parameters
+    def execute(self, name, *params):
+        cursor = self.cursor(name)
+        with profiling.span('SQL.' + name):
+            cursor.execute(statements[name], *params)
+        return cursor
+
+    # rows of the statement
+    def fetchall(self, name, *params):
+        cursor = self.execute(name, *params)
+        with profiling.span('SQL.' + name + '.fetch') as span:
+            rows = cursor.fetchall()
+            span.add(rows=len(rows))
+        return rows
+
+    # first row of the statement (None - no rows): the results are read to the end, as SQL Server without MARS
+    # does not execute other cursors of the connection while this cursor has pending results
+    def fetchone(self, name, *params):
+        rows = self.fetchall(name, *params)
+        return rows[0] if len(rows) > 0 else None
+
+    # execute statement for each parameters row (one round-trip with pyodbc fast_executemany)
+    def executemany(self, name, rows):
+        if len(rows) == 0:
+            return 0
+        cursor = self.cursor(name)
+        if hasattr(cursor, 'fast_executemany'):
+            cursor.fast_executemany = True
+        with profiling.span('SQL.' + name) as span:
+            cursor.executemany(statements[name], rows)
+            span.add(rows=len(rows))
+        return len(rows)
+
+    # close statement cursors
+    def close(self):
+        for cursor in self.cursors.values():
+            # cursors of a closed connection are already released
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self.cursors = {}
+
+
+# prepared queries of the connection: the passed ones are reused while they belong to the connection
+def prepared_queries(db_conn, queries=None):
+    if queries is not None and queries.dbConn is db_conn:
+        return queries
+    if queries is not None:
+        queries.close()
+    return PreparedQueries(db_conn)
@@ -1,10 +1,15 @@
 # import numpy as np
-import pandas as pd
-import pyodbc
-import requests
-from datetime import date, timedelta
+import profiling
+from datetime import date
 from collections.abc import Iterable
 import math
+from dbpool import get_pool
+from dbquery import PreparedQueries
+from tradecal import trading_offset
+from lazyimport import lazy_import
+
+pd = lazy_import('pandas')
+requests = lazy_import('requests')
 
 
 # Class for getting data from InterFax Web API
@@ -15,9 +20,12 @@ class InterfaxData:
     # interfax login & password
     login = 'rencred-api2'
     password = '137Qwd'
-    # SQL DB connection string
-    sqlConnectString = """Driver={SQL Server Native Client 11.0};Server=CLSDB3034\\CLSDB3034;
-Database=AnalyticDev;Trusted_Connection=yes;"""
+    # SQL DB of the shared connection pool (connection string is configured in dbpool)
+    database = 'AnalyticDev'
+
+    # registry of the realized actions built once for the class by init_registry:
+    # controller -> action -> function setting the request body / parsing the response / saving data
+    controllers = parsers = db_manager = None
 
     def __init__(self):
         # http request url
@@ -27,18 +35,10 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
         # sql connection
         self.sql_conn = None
 
-        # initialize controller set        
-        self.__init_controllers()
-        # initialize realized action methods for each controller
-        self.__init_archive_actions()
-        self.__init_bond_actions()
-        self.__init_emitent_actions()
-        self.__init_moex_actions()
-        self.__init_info_actions()
-
         self.proxies = self.body = None
-        self.toDate = date.today() - timedelta(days=1)
-        self.fromDate = self.toDate - timedelta(days=7)
+        # last trading week by the shared MOEX calendar (default calendar days if it is not built)
+        self.toDate = trading_offset(date.today(), -1)
+        self.fromDate = trading_offset(self.toDate, -5)
         
         # link for saving data to DB
         # used in called function save_data_to_db()
@@ -61,21 +61,26 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
 
         self.pageNum = self.pageSize = None
 
-    # Init controller set
-    def __init_controllers(self):
+    # Init controller set and realized action methods for each controller (called once at the module import)
+    @classmethod
+    def init_registry(cls):
+        names = ['Archive', 'Bond', 'CorporateAction', 'Emitent', 'Indicator', 'Info', 'Rating', 'MOEX']
         # set of functions getting InterFax data
-        self.controllers = {'Archive': {}, 'Bond': {}, 'CorporateAction': {},
-                            'Emitent': {}, 'Indicator': {}, 'Info': {}, 'Rating': {}, 'MOEX': {}}
+        cls.controllers = {name: {} for name in names}
         # set of parsers
-        self.parsers = {'Archive': {}, 'Bond': {}, 'CorporateAction': {},
-                        'Emitent': {}, 'Indicator': {}, 'Info': {}, 'Rating': {}, 'MOEX': {}}
-    
+        cls.parsers = {name: {} for name in names}
         # set of saving functions
-        self.db_manager = {'Archive': {}, 'Bond': {}, 'CorporateAction': {},
-                           'Emitent': {}, 'Indicator': {}, 'Info': {}, 'Rating': {}, 'MOEX': {}}
+        cls.db_manager = {name: {} for name in names}
+
+        cls.__init_archive_actions()
+        cls.__init_bond_actions()
+        cls.__init_emitent_actions()
+        cls.__init_moex_actions()
+        cls.__init_info_actions()
 
-    # Return controller names
-    def controllers(self):
+    # Return controller names (InterfaxData.controllers is the registry dict: controller -> action -> body setter,
+    # the former controllers() method was shadowed by it and is replaced by this one)
+    def controller_names(self):
         return self.controllers.keys()
 
     # Return action names for the specified controller
@@ -92,13 +97,13 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
     def sql_connect(self):
         if self.sql_conn is not None:
             return
-        self.sql_conn = pyodbc.connect(InterfaxData.sqlConnectString)
+        self.sql_conn = get_pool(InterfaxData.database).acquire()
 
     # Disconnect from SQL DB
     def sql_disconnect(self):
         if self.sql_conn is None:
             return
-        self.sql_conn.close()
+        get_pool(InterfaxData.database).release(self.sql_conn)
         self.sql_conn = None
 
     # Set Http[s] proxy params
@@ -130,6 +135,7 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
         self.__do_post_request()
 
     # ------- MAIN FUNCTION FOR REQUESTING DATA -------
+    @profiling.profiled('InterfaxData.get_interfax_data')
     def get_interfax_data(self, controller, action, parse=False):
         # check controller name
         if controller not in self.controllers:
@@ -139,13 +145,13 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
             return -2
         self.url = InterfaxData.baseurl + '/%s/%s' % (controller, action)
         # set requested method body
-        self.controllers[controller][action]()
+        self.controllers[controller][action](self)
         # get requested data
         self.roughData = self.__do_post_request()
         # init the saving link
         # self.__saveDataToDB = self.db_manager[controller][action]
         # return data
-        return self.parsers[controller][action]() if parse else self.roughData
+        return self.parsers[controller][action](self) if parse else self.roughData
 
     # Make http POST request
     def __do_post_request(self):
@@ -153,8 +159,14 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
             self.headers = {'Content-Type': 'application/json'}
         else:
             self.headers = {'authorization': 'Bearer ' + self.token, 'Content-Type': 'application/json'}
-        response = requests.post(self.url, json=self.body, headers=self.headers, proxies=self.proxies, verify=False)
-        return response.json() if response.status_code == 200 else None
+        with profiling.span('Interfax.request') as span:
+            response = requests.post(self.url, json=self.body, headers=self.headers, proxies=self.proxies,
+                                     verify=False)
+            span.add(bytes=len(response.content))
+        if response.status_code != 200:
+            return None
+        with profiling.span('Interfax.parse_json'):
+            return response.json()
 
     # Method called for saving data to DB
     def save_data_to_db(self):
@@ -234,9 +246,10 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
     # ------------------------------------------
     
     # Init all realized methods for Archive controller
-    def __init_archive_actions(self):
-        self.controllers['Archive']['History'] = self.__set_archive_history_body
-        self.controllers['Archive']['CurrencyRateHistory'] = self.__set_archive_currencyratehistory_body
+    @classmethod
+    def __init_archive_actions(cls):
+        cls.controllers['Archive']['History'] = cls.__set_archive_history_body
+        cls.controllers['Archive']['CurrencyRateHistory'] = cls.__set_archive_currencyratehistory_body
 
     #  set request body for Archive/History method
     def __set_archive_history_body(self):
@@ -255,15 +268,16 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
     # ---------------------------------------
     
     # Init all realized methods for Bond controller
-    def __init_bond_actions(self):
+    @classmethod
+    def __init_bond_actions(cls):
         # action methods
-        self.controllers['Bond']['AuctionData'] = self.__set_bond_auction_body
-        self.controllers['Bond']['Coupons'] = self.__set_bond_coupons_body
-        self.controllers['Bond']['Convertation'] = self.__set_bond_convertation_body
+        cls.controllers['Bond']['AuctionData'] = cls.__set_bond_auction_body
+        cls.controllers['Bond']['Coupons'] = cls.__set_bond_coupons_body
+        cls.controllers['Bond']['Convertation'] = cls.__set_bond_convertation_body
         # parsers
-        self.parsers['Bond']['Coupons'] = self.__parse_bond_coupons_response
+        cls.parsers['Bond']['Coupons'] = cls.__parse_bond_coupons_response
         # savers
-        self.db_manager['Bond']['Coupons'] = self.__save_bond_coupons_from_rough_data
+        cls.db_manager['Bond']['Coupons'] = cls.__save_bond_coupons_from_rough_data
 
     # Init request body for Bond/Auction method
     def __set_bond_auction_body(self):
@@ -283,16 +297,12 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
     def __parse_bond_coupons_response(self):
         if self.roughData is None:
             return None
-        dct = {'FinToolId': {}, 'CouponPeriod': {}, 'PeriodFrom': {}, 'PeriodTo': {}, 'PayPerBond': {},
-               'CouponRate': {}}
-        self.parsedData = pd.DataFrame(dct)
-
-        for datum in self.roughData:
-            row = {'FinToolId': int(datum['id_fintool']), 'CouponPeriod': datum['id_coupon'],
-                   'PeriodFrom': datum['begin_period'], 'PeriodTo': datum['end_period'],
-                   'PayPerBond': datum['pay_per_bond'], 'CouponRate': datum['coupon_rate']}
-
-            self.parsedData = self.parsedData.append(row, ignore_index=True)
+        columns = ['FinToolId', 'CouponPeriod', 'PeriodFrom', 'PeriodTo', 'PayPerBond', 'CouponRate']
+        # data frame is built once from the response rows
+        self.parsedData = pd.DataFrame(
+            [(int(datum['id_fintool']), datum['id_coupon'], datum['begin_period'], datum['end_period'],
+              datum['pay_per_bond'], datum['coupon_rate']) for datum in self.roughData], columns=columns)
+        self.parsedData['PayPerBond'] = self.parsedData['PayPerBond'].astype(float)
 
         # init the saving link
         # self.__saveDataToDB = self.db_manager['Bond']['Coupons']
@@ -302,52 +312,28 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
     # Saving data to DB from Bond/Coupons method from rough data
     # Used for setting self.__saveDataToDB link in get_interfax_data method
     def __save_bond_coupons_from_rough_data(self):
-        # connect to db
-        self.sql_connect()
-        
-        # list of instruments Ids
-        ids = str(list(self.ifxIds.keys())).replace('[', '(').replace(']', ')')        
-
-        # delete existed data
-        cursor = self.sql_conn.cursor()
-        cursor.execute("delete from dbo.ACF_Coupons where FintoolId in %s" % ids)
-        cursor.commit()
-
-        # disconnect from db
-        self.sql_disconnect()
+        # delete existed data of the instruments in the transaction of the pooled connection
+        with get_pool(InterfaxData.database).transaction() as sql_conn:
+            queries = PreparedQueries(sql_conn)
+            queries.executemany('DeleteCoupons', [(fin_tool_id,) for fin_tool_id in self.ifxIds])
+            queries.close()
 
     # Saving data to DB from Bond/Coupons method from parsed data
     def __save_bond_coupons_from_parsed_data(self):
 
         self.savedData = self.parsedData
 
-        # connect to db
-        self.sql_connect()
+        # inserted rows of the parsed data set without empty data
+        rows = [(int(row.FinToolId), int(row.CouponPeriod), row.PeriodFrom[:10], row.PeriodTo[:10],
+                 float(row.PayPerBond)) for row in self.savedData.itertuples(index=False)
+                if not math.isnan(row.PayPerBond)]
 
-        # list of instruments Ids
-        ids = str(list(self.ifxIds.keys())).replace('[', '(').replace(']', ')')
-
-        # delete existed data
-        cursor = self.sql_conn.cursor()
-        cursor.execute("delete from dbo.ACF_Coupons where FintoolId in %s" % ids)
-        cursor.commit()
-
-        # from "insert" script template
-        ins_sql = "insert into dbo.ACF_Coupons (FintoolId, CouponPeriod, StartDate, EndDate, [Value]" \
-                  " values(%s, %s, '%s', '%s', %f)"
-
-        # insert data from parsed data set
-        for index, row in self.savedData.iterrows():
-            # skip empty data
-            if math.isnan(row['PayPerBond']):
-                continue
-            # from end execute sql command
-            cursor.execute(ins_sql % (row['FinToolId'], row['CouponPeriod'], row['PeriodFrom'][:10],
-                                      row['PeriodTo'][:10], row['PayPerBond']))
-            cursor.commit()
-
-        # disconnect from db
-        self.sql_disconnect()
+        # replace existed data in one transaction of the pooled connection
+        with get_pool(InterfaxData.database).transaction() as sql_conn:
+            queries = PreparedQueries(sql_conn)
+            queries.executemany('DeleteCoupons', [(fin_tool_id,) for fin_tool_id in self.ifxIds])
+            queries.executemany('InsertCoupons', rows)
+            queries.close()
 
         # reset the saving link
         self.__saveDataToDB = None
@@ -357,10 +343,11 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
     # ------------------------------------------
 
     # Init all realized methods for Emitent controller
-    def __init_emitent_actions(self):
-        self.controllers['Emitent']['Companies'] = self.__set_emitent_companies_body
-        self.controllers['Emitent']['Find'] = self.__set_emitent_find_body
-        self.controllers['Emitent']['Multipliers'] = self.__set_emitent_multipliers_body
+    @classmethod
+    def __init_emitent_actions(cls):
+        cls.controllers['Emitent']['Companies'] = cls.__set_emitent_companies_body
+        cls.controllers['Emitent']['Find'] = cls.__set_emitent_find_body
+        cls.controllers['Emitent']['Multipliers'] = cls.__set_emitent_multipliers_body
 
     # Set request body for Emitent/Companies method
     def __set_emitent_companies_body(self):
@@ -384,9 +371,10 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
     # ---------------------------------------
 
     # Init all realized methods for MOEX controller
-    def __init_moex_actions(self):
-        self.controllers['MOEX']['Securities'] = self.__set_moex_securities_body
-        self.controllers['MOEX']['Futures'] = self.__set_moex_futures_body
+    @classmethod
+    def __init_moex_actions(cls):
+        cls.controllers['MOEX']['Securities'] = cls.__set_moex_securities_body
+        cls.controllers['MOEX']['Futures'] = cls.__set_moex_futures_body
 
     # Init request body for MOEX/Securities method
     def __set_moex_securities_body(self):
@@ -413,10 +401,11 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
     # ---------------------------------------
 
     # Init all realized methods for Info controller
-    def __init_info_actions(self):
-        self.controllers['Info']['Calendar'] = self.__set_info_calendar_body
+    @classmethod
+    def __init_info_actions(cls):
+        cls.controllers['Info']['Calendar'] = cls.__set_info_calendar_body
 
-        self.parsers['Info']['Calendar'] = self.__parse_info_calendar_response
+        cls.parsers['Info']['Calendar'] = cls.__parse_info_calendar_response
 
     def __set_info_calendar_body(self):
         today = date.today()
@@ -428,11 +417,12 @@ Database=AnalyticDev;Trusted_Connection=yes;"""
     def __parse_info_calendar_response(self):
         if self.roughData is None:
             return None
-        dct = {'Isin': {}, 'name': {}, 'recomendFixDate': {}}
-        self.parsedData = pd.DataFrame(dct)
-        
-        for datum in self.roughData['timeTableFields']:
-            row = {'Isin': datum['isiNcode'], 'name': datum['nickname'], 'recomendFixDate': datum['recomendFixDate']}
-            self.parsedData = self.parsedData.append(row, ignore_index=True)
-        
+        # data frame is built once from the response rows
+        self.parsedData = pd.DataFrame(
+            [(datum['isiNcode'], datum['nickname'], datum['recomendFixDate'])
+             for datum in self.roughData['timeTableFields']], columns=['Isin', 'name', 'recomendFixDate'])
+
         return self.parsedData
+
+
+InterfaxData.init_registry()
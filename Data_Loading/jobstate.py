@@ -0,0 +1,102 @@
+import json
+import sqlite3
+import threading
+import datetime as dt
+
+"""
+Checkpoints of the bulk loads: finished items (ticker, window) of the named jobs are recorded in a local
+SQLite file after their data are committed, so a restarted job skips the finished work and loads the rest
+    state = JobState('backfill.db', 'MOEX IMOEX')
+    for from_date, to_date in backfill_windows(date(2019, 9, 1), date(2023, 4, 21)):
+        if not state.is_done('SBER', from_date, to_date):
+            ... load and commit the window ...
+            state.mark_done('SBER', from_date, to_date)
+    state.finish()
+Parameters of the job (e.g. its tasks dates) are saved by its first run and reused by the restarted ones
+Items are recorded after the commit of their data: an item interrupted between the commit and the record
+is loaded again, which is safe as the window data are replaced (deleted and inserted) in one transaction
+"""
+
+
+# backfill windows of the period aligned to the calendar months: a moved start date changes the first window
+# only, the following windows keep their bounds
+def backfill_windows(from_date, to_date, months=12):
+    windows = []
+    start = from_date
+    while start <= to_date:
+        month_num = start.year * 12 + start.month - 1
+        month_num += months - month_num % months
+        end = min(dt.date(month_num // 12, month_num % 12 + 1, 1) - dt.timedelta(days=1), to_date)
+        windows.append((start, end))
+        start = end + dt.timedelta(days=1)
+    return windows
+
+
+class JobState:
+
+    # path - SQLite file of the checkpoints (':memory:' - checkpoints of the current process only)
+    def __init__(self, path, job):
+        self.path = path
+        self.job = job
+        # records are written from the pipeline sink thread
+        self.dbConn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.dbConn.execute("create table if not exists Jobs (Job text primary key, Params text not null)")
+        self.dbConn.execute("create table if not exists JobItems (Job text not null, Item text not null, "
+                            "FromDate text not null, ToDate text not null, Finished text not null, "
+                            "primary key (Job, Item, FromDate, ToDate))")
+        self.dbConn.commit()
+        # finished items of the job loaded once: (item, from date, to date)
+        self.done = {tuple(row) for row in self.dbConn.execute(
+            "select Item, FromDate, ToDate from JobItems where Job = ?", (self.job,))}
+        # number of the items finished before the current run
+        self.resumedNum = len(self.done)
+        # parameters saved by the first run of the job (None - new job)
+        row = self.dbConn.execute("select Params from Jobs where Job = ?", (self.job,)).fetchone()
+        self.params = json.loads(row[0]) if row is not None else None
+
+    # save parameters of the job (JSON serializable)
+    def save_params(self, params):
+        with self.lock:
+            self.dbConn.execute("insert or replace into Jobs values (?, ?)", (self.job, json.dumps(params)))
+            self.dbConn.commit()
+            self.params = params
+
+    # item key: dates in ISO format, empty strings for items without dates
+    @staticmethod
+    def __key(item, from_date=None, to_date=None):
+        return (str(item), from_date.isoformat() if from_date is not None else '',
+                to_date.isoformat() if to_date is not None else '')
+
+    # item is finished in the current or the previous runs of the job
+    def is_done(self, item, from_date=None, to_date=None):
+        return self.__key(item, from_date, to_date) in self.done
+
+    # record finished item
+    def mark_done(self, item, from_date=None, to_date=None):
+        self.mark_many([(item, from_date, to_date)])
+
+    # record finished items in one transaction: items - list of (item, from date, to date)
+    def mark_many(self, items):
+        keys = [self.__key(*item) for item in items]
+        finished = dt.datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            self.dbConn.executemany("insert or replace into JobItems values (?, ?, ?, ?, ?)",
+                                    [(self.job,) + key + (finished,) for key in keys])
+            self.dbConn.commit()
+            self.done.update(keys)
+
+    # drop the checkpoints of the completed job: the next run of the job starts from scratch
+    def finish(self):
+        with self.lock:
+            self.dbConn.execute("delete from JobItems where Job = ?", (self.job,))
+            self.dbConn.execute("delete from Jobs where Job = ?", (self.job,))
+            self.dbConn.commit()
+            self.done = set()
+            self.params = None
+
+    def close(self):
+        if self.dbConn is None:
+            return
+        self.dbConn.close()
+        self.dbConn = None
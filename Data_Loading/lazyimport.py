@@ -0,0 +1,34 @@
+import sys
+import types
+import importlib
+
+"""
+Heavy dependencies (pyodbc, numpy, pandas, requests, yfinance) are imported on the first attribute access,
+so importing the modules and short command line runs do not pay for the packages they do not use
+    pd = lazy_import('pandas')
+    pd.DataFrame(...)              # pandas is imported here
+A missing package raises ImportError on the first use instead of the module import
+"""
+
+
+class LazyModule(types.ModuleType):
+
+    def __init__(self, name):
+        super().__init__(name)
+
+    # the module is imported on the first access to its attributes
+    def __getattr__(self, item):
+        module = importlib.import_module(self.__name__)
+        # attributes are copied once, so the next accesses do not call __getattr__
+        self.__dict__.update(module.__dict__)
+        return getattr(module, item)
+
+    def __repr__(self):
+        return "<lazy module '%s'>" % self.__name__
+
+
+# module imported on first use (the imported one is returned at once)
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
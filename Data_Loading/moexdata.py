@@ -1,10 +1,20 @@
-import requests
-import pyodbc
 import datetime as dt
+import profiling
+from dbpool import get_pool
+from dbquery import prepared_queries
+from tradecal import get_calendar, invalidate_calendar
+from jobstate import backfill_windows
+from lazyimport import lazy_import
+
+requests = lazy_import('requests')
 
 
 class MOEXData:
 
+    # instrument metadata resolved in the session:
+    # connection string -> {'index' / 'security': {moex code: (instrument id, trading board)}}
+    instrumentCache = {}
+
     def __init__(self):
         # url template for requesting data
         self.url_template =\
@@ -14,35 +24,21 @@ class MOEXData:
         self.url = None
         # historical dates diapason
         self.fromDate = self.toDate = None
+        # trading days requested at once (ISS returns up to 100 history rows per request)
+        self.windowSize = 90
         # http request header
         self.headers = {'Content-Type': 'application/json'}
 
-        # db connection string
-        self.dbConnString = "Driver={SQL Server Native Client 11.0};Server=LAPTOP-QBI0SKOK\\LOCALDB;" \
-                            "Database=Analysis;Trusted_Connection=yes;"
+        # database of the shared connection pool (connection string is configured in dbpool)
+        self.database = 'Analysis'
         # db connection
         self.dbConn = None
 
-        # index finding string
-        self.findIndTemplate =\
-            "select id from dbo.IND_Indices where [Name] = '%s'"
-        # security finding string
-        self.findSecTemplate =\
-            "select Id, BoardCode from dbo.DCT_Assets where ExchangeId = 1 and Ticker = '%s'"
-
-        # index data deleting string
-        self.delIndTemplate = "delete from dbo.MD_IndexPrices where IndexId = %d and [Date] between '%s' and '%s'"
-        # security data deleting string
-        self.delSecTemplate = "delete from dbo.MD_SecurityQuotes where AssetId = %d and [Date] between '%s' and '%s'"
-        # index data inserting string
-        self.indInsTemplate =\
-            "insert into dbo.MD_IndexPrices (IndexId, Date, [Open], Low, High, [Close]) " \
-            "values(%d, '%s' ,%f, %f, %f, %f)"
-        # security data inserting string
-        self.secInsTemplate =\
-            "insert into dbo.MD_SecurityQuotes " \
-            "(AssetId, Date, [Open], Low, High, [Close], YTM_Close, Accrued) " \
-            "values(%d,'%s',%f, %f, %f, %f, %s, %s)"
+        # prepared statements of the connection (SQL texts are in dbquery.statements)
+        self.queries = None
+
+        # quotes validator (quotecheck.QuoteValidator): quotes with errors are not saved
+        self.validator = None
 
         # moex indices boards
         self.indexBoards =\
@@ -55,18 +51,23 @@ class MOEXData:
         self.moexCode = self.instrumentId = self.boardName = None
         # returned json data
         self.jsColumns = self.jsData = None
+        # failed requests of the last download: (url, http status)
+        self.failedRequests = []
 
     # open db connection
     def open_db_conn(self):
         if self.dbConn is not None:
             return
-        self.dbConn = pyodbc.connect(self.dbConnString)
+        self.dbConn = get_pool(self.database).acquire()
 
     # close db connection
     def close_db_conn(self):
         if self.dbConn is None:
             return
-        self.dbConn.close()
+        if self.queries is not None:
+            self.queries.close()
+            self.queries = None
+        get_pool(self.database).release(self.dbConn)
         self.dbConn = None
 
     # set dates period
@@ -81,7 +82,6 @@ class MOEXData:
             from_date = self.fromDate
         if to_date is None:
             to_date = self.toDate
-        self.__get_ticker_info()
         # defining trading board
         if moex_code in self.indexBoards:
             board = self.indexBoards[moex_code]
@@ -98,65 +98,176 @@ class MOEXData:
                                  from_date.strftime("%Y-%m-%d"), to_date.strftime("%Y-%m-%d"))
 
     # make http request
+    @profiling.profiled('MOEXData.get_http_data', rows=lambda result, self, *args, **kwargs: len(self.jsData))
     def get_http_data(self, moex_code, moex_board=None):
         self.moexCode = moex_code
         self.jsData = []
-        # get data by 2 months blocks
-        from_date = self.fromDate
-        to_date = min(self.toDate, from_date + dt.timedelta(days=60))
-        while from_date <= self.toDate:
+        self.failedRequests = []
+        # instrument id and board are resolved once per download
+        self.__get_ticker_info()
+        # get data by windows of trading days of the shared calendar (no requests for non trading periods)
+        for from_date, to_date in get_calendar(self.dbConn).windows(self.fromDate, self.toDate, self.windowSize):
             # make requested url
             self.__make_url_string(moex_code, moex_board, from_date, to_date)
             # request data
-            response = requests.get(self.url, headers={'Content-Type': 'application/json'})
+            with profiling.span('ISS.request') as span:
+                response = requests.get(self.url, headers={'Content-Type': 'application/json'})
+                span.add(bytes=len(response.content))
             # extract data from http response
             if response.status_code == 200:
-                self.jsColumns = response.json()['history']['columns']
-                self.jsData.extend(response.json()['history']['data'])
-            from_date = to_date + dt.timedelta(days=1)
-            to_date = min(self.toDate, from_date + dt.timedelta(days=60))
+                with profiling.span('ISS.parse_json') as span:
+                    history = response.json()['history']
+                    span.add(rows=len(history['data']))
+                self.jsColumns = history['columns']
+                self.jsData.extend(history['data'])
+            else:
+                self.failedRequests.append((self.url, response.status_code))
         return self.jsData
 
-    # get info for requested MOEX code
+    # prepared statements of the current connection
+    def __get_queries(self):
+        self.queries = prepared_queries(self.dbConn, self.queries)
+        return self.queries
+
+    # instrument metadata of the connected database: indices and securities are kept apart (codes may coincide)
+    def __get_instruments(self, kind):
+        instruments = MOEXData.instrumentCache.setdefault(get_pool(self.database).connString,
+                                                          {'index': {}, 'security': {}})
+        return instruments[kind]
+
+    # kind of the instrument: codes of the index boards are indices
+    def __kind(self, moex_code):
+        return 'index' if moex_code in self.indexBoards else 'security'
+
+    # metadata of the resolved instruments: moex code -> (instrument id, trading board), unknown codes are skipped
+    def get_instruments(self, moex_codes):
+        instruments = {}
+        for code in moex_codes:
+            info = self.__get_instruments(self.__kind(code)).get(code)
+            if info is not None:
+                instruments[code] = info
+        return instruments
+
+    # drop cached instrument metadata (e.g. after new instruments are added to DB)
+    @staticmethod
+    def clear_instrument_cache():
+        MOEXData.instrumentCache = {}
+
+    # load metadata of all indices and securities by one query each
+    def preload_instruments(self):
+        if self.dbConn is None:
+            return -1
+        indices, securities = self.__get_instruments('index'), self.__get_instruments('security')
+        queries = self.__get_queries()
+        indices.update({name: (index_id, self.indexBoards.get(name))
+                        for name, index_id in queries.fetchall('AllIndices')})
+        securities.update({ticker: (asset_id, board) for ticker, asset_id, board in queries.fetchall('AllSecurities')})
+        return len(indices) + len(securities)
+
+    # tickers of the index constituents (index id or name) with their metadata memoized
+    def resolve_index_constituents(self, index):
+        if self.dbConn is None:
+            return None
+        statement = 'IndexConstituentsById' if isinstance(index, int) else 'IndexConstituentsByName'
+        rows = self.__get_queries().fetchall(statement, index)
+        self.__get_instruments('security').update({ticker: (asset_id, board) for ticker, asset_id, board in rows})
+        return [row[0] for row in rows]
+
+    # last stored dates of the instruments resolved in the session: moex code -> date (None - no stored data)
+    def last_dates(self, moex_codes):
+        if self.dbConn is None:
+            return None
+        queries = self.__get_queries()
+        index_dates = dict(queries.fetchall('LastIndexPriceDates'))
+        security_dates = dict(queries.fetchall('LastSecurityQuoteDates'))
+        dates = {}
+        for code, info in self.get_instruments(moex_codes).items():
+            last_date = (index_dates if code in self.indexBoards else security_dates).get(info[0])
+            dates[code] = None if last_date is None else dt.date.fromisoformat(str(last_date)[:10])
+        return dates
+
+    # get info for requested MOEX code: DB is queried once per code in the session
     def __get_ticker_info(self):
         if self.dbConn is None or self.moexCode is None:
             return
-        cursor = self.dbConn.cursor()
-        # get data for index ticker
-        if self.moexCode in self.indexBoards:
-            cursor.execute(self.findIndTemplate % self.moexCode)
-            self.instrumentId = cursor.fetchone()[0]
-        # get data for security ticker
-        else:
-            cursor.execute(self.findSecTemplate % self.moexCode)
-            self.instrumentId, self.boardName = cursor.fetchone()
-        cursor.close()
+        instruments = self.__get_instruments(self.__kind(self.moexCode))
+        if self.moexCode not in instruments:
+            # get data for index ticker
+            if self.moexCode in self.indexBoards:
+                row = self.__get_queries().fetchone('FindIndex', self.moexCode)
+                info = (row[0], self.indexBoards[self.moexCode]) if row is not None else None
+            # get data for security ticker
+            else:
+                row = self.__get_queries().fetchone('FindSecurity', self.moexCode)
+                info = tuple(row) if row is not None else None
+            if info is None:
+                raise LookupError("%s is not found in DB" % self.moexCode)
+            instruments[self.moexCode] = info
+        self.instrumentId, board = instruments[self.moexCode]
+        if self.moexCode not in self.indexBoards:
+            self.boardName = board
+
+    """
+    Loading the codes for the dates period by the backfill windows (months long, aligned to the calendar):
+    every window of a code is replaced in its own transaction and recorded in the job state (jobstate.JobState),
+    so a restarted backfill loads only the unfinished windows; windows with failed requests are not saved,
+    the rest windows of the failed code are skipped; the job checkpoints are dropped when all codes are loaded
+    returns list of the failed windows: (moex code, from date, to date, error)
+    """
+    def backfill(self, moex_codes, job_state=None, months=12):
+        if self.dbConn is None:
+            return None
+        from_date, to_date = self.fromDate, self.toDate
+        failed = []
+        try:
+            for moex_code in moex_codes:
+                for window_from, window_to in backfill_windows(from_date, to_date, months):
+                    if job_state is not None and job_state.is_done(moex_code, window_from, window_to):
+                        continue
+                    self.set_dates(window_from, window_to)
+                    try:
+                        self.get_http_data(moex_code)
+                        if len(self.failedRequests) > 0:
+                            raise ConnectionError("ISS returned %d for %s" % self.failedRequests[0][::-1])
+                        self.save_data()
+                    except Exception as error:
+                        failed.append((moex_code, window_from, window_to, error))
+                        break
+                    if job_state is not None:
+                        job_state.mark_done(moex_code, window_from, window_to)
+        finally:
+            self.set_dates(from_date, to_date)
+        if job_state is not None and len(failed) == 0:
+            job_state.finish()
+        return failed
 
     # delete market data for transferred ticker
     def __delete_market_data(self):
-        cursor = self.dbConn.cursor()
-        # delete index data
-        if self.moexCode in self.indexBoards:
-            cursor.execute(self.delIndTemplate % (self.instrumentId,
-                           self.fromDate.strftime("%Y-%m-%d"), self.toDate.strftime("%Y-%m-%d")))
-        # delete security data
-        else:
-            cursor.execute(self.delSecTemplate % (self.instrumentId,
-                           self.fromDate.strftime("%Y-%m-%d"), self.toDate.strftime("%Y-%m-%d")))
-        cursor.close()
+        statement = 'DeleteIndexPrices' if self.moexCode in self.indexBoards else 'DeleteSecurityQuotes'
+        self.__get_queries().execute(statement, self.instrumentId,
+                                     self.fromDate.strftime("%Y-%m-%d"), self.toDate.strftime("%Y-%m-%d"))
 
-    # save data to db
+    # save data to db: stored data of the period are replaced in one transaction
+    @profiling.profiled('MOEXData.save_data', rows=lambda result, self, *args, **kwargs: len(self.jsData or []))
     def save_data(self):
         if self.dbConn is None or self.jsData is None:
             return
-        # delete market data
-        self.__delete_market_data()
-        # save index prices
-        if self.moexCode in self.indexBoards:
-            self.__save_index_prices()
-        # save security quotes
-        else:
-            self.__save_security_quotes()
+        try:
+            # delete market data
+            self.__delete_market_data()
+            # save index prices
+            if self.moexCode in self.indexBoards:
+                self.__save_index_prices()
+            # save security quotes
+            else:
+                self.__save_security_quotes()
+            self.dbConn.commit()
+        except Exception:
+            self.dbConn.rollback()
+            raise
+        # trading days of the shared calendar are the IMOEX dates
+        if self.moexCode == 'IMOEX':
+            invalidate_calendar()
 
     # save security quotes
     def __save_security_quotes(self):
@@ -167,18 +278,13 @@ class MOEXData:
         ytm_pos = self.jsColumns.index('YIELDCLOSE') if 'YIELDCLOSE' in self.jsColumns else None
         acr_pos = self.jsColumns.index('ACCINT') if 'ACCINT' in self.jsColumns else None
 
-        for sct in self.jsData:
-            # check number of trades
-            if sct[4] <= 0:
-                continue
-            cursor = self.dbConn.cursor()
-            sql_script = self.secInsTemplate % (
-                self.instrumentId, sct[date_pos], sct[open_pos], sct[low_pos], sct[high_pos], sct[close_pos],
-                sct[ytm_pos] if ytm_pos is not None else 'NULL',
-                sct[acr_pos] if acr_pos is not None else 'NULL')
-            cursor.execute(sql_script)
-            cursor.commit()
-            cursor.close()
+        # quotes with trades are inserted by one prepared statement
+        rows = [(self.instrumentId, sct[date_pos], sct[open_pos], sct[low_pos], sct[high_pos], sct[close_pos],
+                 sct[ytm_pos] if ytm_pos is not None else None, sct[acr_pos] if acr_pos is not None else None)
+                for sct in self.jsData if sct[4] > 0]
+        if self.validator is not None:
+            rows = self.validator.filter_rows(rows, self.boardClasses.get(self.boardName) == 'bonds')
+        self.__get_queries().executemany('InsertSecurityQuotes', rows)
         return self.instrumentId
 
     # save index prices
@@ -188,11 +294,7 @@ class MOEXData:
             self.jsColumns.index('TRADEDATE'), self.jsColumns.index('OPEN'), self.jsColumns.index('LOW'), \
             self.jsColumns.index('HIGH'), self.jsColumns.index('CLOSE')
 
-        for ind in self.jsData:
-            cursor = self.dbConn.cursor()
-            sql_script = self.indInsTemplate % (
-                self.instrumentId, ind[date_pos], ind[open_pos], ind[low_pos], ind[high_pos], ind[close_pos])
-            cursor.execute(sql_script)
-            cursor.commit()
-            cursor.close()
+        rows = [(self.instrumentId, ind[date_pos], ind[open_pos], ind[low_pos], ind[high_pos], ind[close_pos])
+                for ind in self.jsData]
+        self.__get_queries().executemany('InsertIndexPrices', rows)
         return self.instrumentId
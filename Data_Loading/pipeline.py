@@ -0,0 +1,451 @@
+import time
+import asyncio
+import threading
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from moexdata import MOEXData
+from ifxdata import InterfaxData
+from yfin import yfin
+from dbpool import get_pool
+from dbquery import PreparedQueries
+from quotecheck import QuoteValidator
+from jobstate import backfill_windows
+from tradecal import invalidate_calendar
+from lazyimport import lazy_import
+
+pd = lazy_import('pandas')
+
+"""
+Market data ingestion pipeline: fetch -> transform -> sink stages connected by bounded queues
+Blocking HTTP requests run in the fetch thread pool, parsing in the transform thread and bulk DB writes
+in the sink thread, so fetching of the next instruments overlaps parsing and writing of the previous ones
+Sources plug in as adapters over MOEXData, InterfaxData and yfin:
+    tasks()                    - fetched items (tickers, ticker batches, requests)
+    fetch(task)                - blocking request of the task data (called from several threads)
+    transform(task, data)      - parsed data of the task: (delete keys, insert rows) or None
+    write(db_conn, batches)    - bulk write of the transformed tasks in one transaction
+    checkpoint(task)           - optional (item, from date, to date) key of the task in the job state:
+                                 written tasks are recorded and skipped by the restarted pipeline
+"""
+
+
+# Bulk delete / insert of the batches in one transaction: batches - list of (delete keys, insert rows)
+# del_statement, ins_statement - names of the dbquery statements
+def bulk_write(db_conn, del_statement, ins_statement, batches):
+    keys = [key for batch_keys, rows in batches for key in batch_keys]
+    rows = [row for batch_keys, batch_rows in batches for row in batch_rows]
+    queries = PreparedQueries(db_conn)
+    try:
+        queries.executemany(del_statement, keys)
+        queries.executemany(ins_statement, rows)
+        db_conn.commit()
+    except Exception:
+        db_conn.rollback()
+        raise
+    finally:
+        queries.close()
+    return len(rows)
+
+
+# MOEX ISS history adapter: one task per MOEX code and backfill window
+class MOEXAdapter:
+
+    name = 'MOEX'
+
+    # moex_codes - list of codes or dictionary code -> (instrument id, trading board)
+    # instruments not listed in the dictionary are found in DB by MOEXData of the fetching thread
+    # validator - quotecheck.QuoteValidator run in the transform stage (securities quotes with errors are skipped)
+    # months - length of the backfill windows aligned to the calendar months (None - whole period at once)
+    def __init__(self, moex_codes, from_date, to_date, use_db=True, validator=None, months=None):
+        self.instruments = dict(moex_codes) if isinstance(moex_codes, dict) else {code: None for code in moex_codes}
+        self.fromDate, self.toDate = from_date, to_date
+        self.months = months
+        self.useDB = use_db
+        self.validator = validator
+        # MOEXData objects of the fetching threads (pooled connections are returned by close)
+        self.loaders = threading.local()
+        self.opened = []
+
+    # tasks: (moex code, window from date, window to date)
+    def tasks(self):
+        windows = [(self.fromDate, self.toDate)] if self.months is None else \
+            backfill_windows(self.fromDate, self.toDate, self.months)
+        return [(code, from_date, to_date) for code in self.instruments for from_date, to_date in windows]
+
+    def checkpoint(self, task):
+        return task
+
+    # MOEXData of the current thread
+    def __loader(self):
+        if not hasattr(self.loaders, 'moex'):
+            self.loaders.moex = MOEXData()
+            if self.useDB:
+                self.loaders.moex.open_db_conn()
+            self.opened.append(self.loaders.moex)
+        return self.loaders.moex
+
+    # return connections of the fetching threads to the pool
+    def close(self):
+        for loader in self.opened:
+            loader.close_db_conn()
+        self.opened = []
+        self.loaders = threading.local()
+
+    def fetch(self, task):
+        moex_code, from_date, to_date = task
+        loader = self.__loader()
+        loader.set_dates(from_date, to_date)
+        instrument = self.instruments[moex_code]
+        data = loader.get_http_data(moex_code, instrument[1] if instrument is not None else None)
+        # partially downloaded windows are not written
+        if len(loader.failedRequests) > 0:
+            raise ConnectionError("ISS returned %d for %s" % loader.failedRequests[0][::-1])
+        instrument_id = instrument[0] if instrument is not None else loader.instrumentId
+        return moex_code in loader.indexBoards, instrument_id, loader.jsColumns, data
+
+    # empty downloads are finished tasks, quotes of the instruments not found in DB are errors
+    def transform(self, task, data):
+        is_index, instrument_id, columns, rows = data
+        if columns is None:
+            return None
+        if instrument_id is None:
+            raise LookupError("%s is not found in DB" % task[0])
+        frame = pd.DataFrame(rows, columns=columns)
+        # securities quotes without trades are skipped
+        if not is_index and 'NUMTRADES' in frame.columns:
+            frame = frame[frame['NUMTRADES'] > 0]
+        if not is_index and self.validator is not None and len(frame) > 0:
+            quotes = frame.reindex(columns=['TRADEDATE', 'OPEN', 'LOW', 'HIGH', 'CLOSE', 'YIELDCLOSE'])
+            quotes.columns = ['Date', 'Open', 'Low', 'High', 'Close', 'YTM_Close']
+            quotes.insert(0, 'AssetId', instrument_id)
+            bonds = {instrument_id} if 'YIELDCLOSE' in frame.columns else None
+            frame = frame[self.validator.validate(quotes, bonds)]
+        # missing bond items of the securities are written as NULL
+        items = ['TRADEDATE', 'OPEN', 'LOW', 'HIGH', 'CLOSE'] + ([] if is_index else ['YIELDCLOSE', 'ACCINT'])
+        frame = frame.reindex(columns=items).astype(object)
+        frame = frame.where(frame.notna(), None)
+        keys = [(instrument_id, task[1].strftime("%Y-%m-%d"), task[2].strftime("%Y-%m-%d"))]
+        return is_index, (keys, [(instrument_id,) + row for row in frame.itertuples(index=False, name=None)])
+
+    # indices and securities are written to their tables
+    def write(self, db_conn, batches):
+        row_num = 0
+        for is_index in [True, False]:
+            items = [batch for index_flag, batch in batches if index_flag == is_index]
+            if len(items) == 0:
+                continue
+            if is_index:
+                row_num += bulk_write(db_conn, 'DeleteIndexPrices', 'InsertIndexPrices', items)
+                # the shared calendar is reloaded with the new IMOEX dates
+                invalidate_calendar()
+            else:
+                row_num += bulk_write(db_conn, 'DeleteSecurityQuotes', 'InsertSecurityQuotes', items)
+        return row_num
+
+
+# Interfax adapter: one task per request key
+class InterfaxAdapter:
+
+    name = 'Interfax'
+
+    # requests - dictionary key -> setup(ifx_data) setting the request params and returning (controller, action)
+    # parse(key, rough_data) - delete keys and insert rows of the response
+    # del_statement, ins_statement - names of the dbquery statements writing the rows
+    def __init__(self, requests, parse, del_statement, ins_statement, proxies=None):
+        self.requests = requests
+        self.parse = parse
+        self.delStatement, self.insStatement = del_statement, ins_statement
+        self.proxies = proxies
+        # authorized InterfaxData objects of the fetching threads
+        self.loaders = threading.local()
+        self.opened = []
+
+    # Bond/Coupons requests of the fin tools written to dbo.ACF_Coupons
+    @staticmethod
+    def bond_coupons(fin_tool_ids, proxies=None):
+        def setup(fin_tool_id):
+            def set_request(ifx_data):
+                ifx_data.ifxIds = {fin_tool_id: None}
+                return 'Bond', 'Coupons'
+            return set_request
+
+        def parse(fin_tool_id, rough_data):
+            rows = [(int(datum['id_fintool']), datum['id_coupon'], datum['begin_period'][:10],
+                     datum['end_period'][:10], datum['pay_per_bond'])
+                    for datum in rough_data if datum['pay_per_bond'] is not None]
+            return [(fin_tool_id,)], rows
+
+        return InterfaxAdapter({fin_tool_id: setup(fin_tool_id) for fin_tool_id in fin_tool_ids}, parse,
+                               'DeleteCoupons', 'InsertCoupons', proxies)
+
+    def tasks(self):
+        return list(self.requests)
+
+    def checkpoint(self, key):
+        return key, None, None
+
+    # InterfaxData of the current thread
+    def __loader(self):
+        if not hasattr(self.loaders, 'ifx'):
+            self.loaders.ifx = InterfaxData()
+            self.loaders.ifx.proxies = self.proxies
+            self.loaders.ifx.get_token()
+            self.opened.append(self.loaders.ifx)
+        return self.loaders.ifx
+
+    # free tokens of the fetching threads
+    def close(self):
+        for loader in self.opened:
+            loader.free_token()
+        self.opened = []
+        self.loaders = threading.local()
+
+    def fetch(self, key):
+        loader = self.__loader()
+        controller, action = self.requests[key](loader)
+        return loader.get_interfax_data(controller, action)
+
+    def transform(self, key, data):
+        if data is None or not isinstance(data, (list, dict)):
+            return None
+        return self.parse(key, data)
+
+    def write(self, db_conn, batches):
+        return bulk_write(db_conn, self.delStatement, self.insStatement, batches)
+
+
+# Yahoo Finance adapter: one task per batch of tickers
+class YahooAdapter:
+
+    name = 'Yahoo'
+
+    # tickers - dictionary Yahoo ticker -> asset id
+    # validator - quotecheck.QuoteValidator run in the transform stage (quotes with errors are skipped)
+    def __init__(self, tickers, from_date, to_date, batch_size=100, validator=None):
+        self.tickers = dict(tickers)
+        self.fromDate, self.toDate = from_date, to_date
+        self.batchSize = batch_size
+        self.validator = validator
+
+    def tasks(self):
+        tickers = list(self.tickers)
+        return [tuple(tickers[ind:ind + self.batchSize]) for ind in range(0, len(tickers), self.batchSize)]
+
+    def fetch(self, tickers):
+        loader = yfin()
+        loader.set_dates(self.fromDate, self.toDate)
+        loader.set_tickers({ticker: self.tickers[ticker] for ticker in tickers})
+        return loader.get_data()
+
+    def transform(self, tickers, data):
+        if data is not None and self.validator is not None and len(data) > 0:
+            data = data[self.validator.validate(data)]
+        return data if data is not None and len(data) > 0 else None
+
+    # yfin writes the concatenated quotes in one transaction
+    def write(self, db_conn, batches):
+        loader = yfin()
+        loader.quotes = pd.concat(batches, ignore_index=True)
+        return loader.save_data(db_conn)
+
+
+# Stage throughput statistics
+class StageStats:
+
+    def __init__(self, name):
+        self.name = name
+        # processed items / rows, errors, busy time of the stage workers
+        self.items = self.rows = self.errors = 0
+        self.busyTime = 0.0
+
+    # add processed item
+    def add(self, start_time, rows=0):
+        self.items += 1
+        self.rows += rows
+        self.busyTime += time.perf_counter() - start_time
+
+
+class IngestionPipeline:
+
+    # job_state - jobstate.JobState of the checkpointed tasks (None - all tasks are run)
+    def __init__(self, fetch_workers=8, queue_size=32, write_batch=50, job_state=None):
+        # number of the fetching threads
+        self.fetchWorkers = fetch_workers
+        # size of the bounded queues between the stages
+        self.queueSize = queue_size
+        # number of the transformed tasks written in one transaction
+        self.writeBatch = write_batch
+
+        # source adapters
+        self.adapters = []
+        # db connection used by the sink thread (None - data are fetched and parsed only)
+        self.dbConn = None
+        # checkpoints of the written tasks and number of the tasks skipped as finished in the previous runs
+        self.jobState = job_state
+        self.skippedNum = 0
+
+        # stage statistics, pipeline wall time and failed tasks: (adapter name, task, stage, error)
+        self.stats = None
+        self.wallTime = None
+        self.errors = []
+
+    # add source adapter
+    def add_adapter(self, adapter):
+        self.adapters.append(adapter)
+
+    # set db connection of the sink stage (used from the sink thread only,
+    # sqlite connections should be opened with check_same_thread=False)
+    def set_db_conn(self, db_conn):
+        self.dbConn = db_conn
+
+    # run the pipeline
+    def run(self):
+        return asyncio.run(self.run_async())
+
+    async def run_async(self):
+        self.stats = {stage: StageStats(stage) for stage in ['Fetch', 'Transform', 'Sink']}
+        self.errors = []
+        self.skippedNum = 0
+        start_time = time.perf_counter()
+        tasks = asyncio.Queue()
+        for adapter in self.adapters:
+            for task in adapter.tasks():
+                key = self.__checkpoint(adapter, task)
+                if key is not None and self.jobState.is_done(*key):
+                    self.skippedNum += 1
+                    continue
+                tasks.put_nowait((adapter, task))
+        fetched = asyncio.Queue(self.queueSize)
+        transformed = asyncio.Queue(self.queueSize)
+
+        with ThreadPoolExecutor(self.fetchWorkers) as fetch_pool, ThreadPoolExecutor(1) as transform_pool, \
+                ThreadPoolExecutor(1) as sink_pool:
+            fetchers = [asyncio.create_task(self.__fetch(tasks, fetched, fetch_pool))
+                        for ind in range(self.fetchWorkers)]
+            transformer = asyncio.create_task(self.__transform(fetched, transformed, transform_pool))
+            sink = asyncio.create_task(self.__sink(transformed, sink_pool))
+            await asyncio.gather(*fetchers)
+            await fetched.put(None)
+            await transformer
+            await sink
+        for adapter in self.adapters:
+            if hasattr(adapter, 'close'):
+                adapter.close()
+        self.wallTime = time.perf_counter() - start_time
+        return self.report()
+
+    # fetch stage worker
+    async def __fetch(self, tasks, fetched, pool):
+        loop = asyncio.get_running_loop()
+        while not tasks.empty():
+            adapter, task = tasks.get_nowait()
+            start_time = time.perf_counter()
+            try:
+                data = await loop.run_in_executor(pool, adapter.fetch, task)
+            except Exception as error:
+                self.__add_error(adapter, task, 'Fetch', error)
+                continue
+            self.stats['Fetch'].add(start_time)
+            await fetched.put((adapter, task, data))
+
+    # transform stage
+    async def __transform(self, fetched, transformed, pool):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await fetched.get()
+            if item is None:
+                break
+            adapter, task, data = item
+            start_time = time.perf_counter()
+            try:
+                batch = await loop.run_in_executor(pool, adapter.transform, task, data)
+            except Exception as error:
+                self.__add_error(adapter, task, 'Transform', error)
+                continue
+            self.stats['Transform'].add(start_time)
+            if batch is not None:
+                await transformed.put((adapter, task, batch))
+            # tasks without data to write are finished
+            elif self.jobState is not None:
+                await loop.run_in_executor(pool, self.__mark_done, adapter, [task], 'Transform')
+        await transformed.put(None)
+
+    # sink stage: transformed tasks are written by adapters in batches
+    async def __sink(self, transformed, pool):
+        loop = asyncio.get_running_loop()
+        pending = {}
+        finished = False
+        while not finished:
+            item = await transformed.get()
+            if item is None:
+                finished = True
+            else:
+                pending.setdefault(item[0], []).append(item[1:])
+            # pending tasks are written when the batch is full, the queue is drained or the pipeline finished
+            for adapter, items in list(pending.items()):
+                if len(items) < self.writeBatch and not finished and not transformed.empty():
+                    continue
+                del pending[adapter]
+                if self.dbConn is None:
+                    continue
+                start_time = time.perf_counter()
+                try:
+                    rows = await loop.run_in_executor(pool, adapter.write, self.dbConn,
+                                                      [batch for task, batch in items])
+                except Exception as error:
+                    for task, batch in items:
+                        self.__add_error(adapter, task, 'Sink', error)
+                    continue
+                self.stats['Sink'].add(start_time, rows)
+                # written tasks are recorded after the commit
+                if self.jobState is not None:
+                    await loop.run_in_executor(pool, self.__mark_done, adapter, [task for task, batch in items],
+                                               'Sink')
+
+    # record finished tasks in the job state: failed records are task errors (the tasks are run again on restart)
+    def __mark_done(self, adapter, tasks, stage):
+        keys = [self.__checkpoint(adapter, task) for task in tasks]
+        if len(keys) == 0 or keys[0] is None:
+            return
+        try:
+            self.jobState.mark_many(keys)
+        except Exception as error:
+            for task in tasks:
+                self.__add_error(adapter, task, stage, error)
+
+    # job state key of the task: items of the adapters are prefixed by the adapter names
+    def __checkpoint(self, adapter, task):
+        if self.jobState is None or not hasattr(adapter, 'checkpoint'):
+            return None
+        item, from_date, to_date = adapter.checkpoint(task)
+        return '%s %s' % (adapter.name, item), from_date, to_date
+
+    # register failed task
+    def __add_error(self, adapter, task, stage, error):
+        self.stats[stage].errors += 1
+        self.errors.append((adapter.name, task, stage, repr(error)))
+
+    # stage throughput report
+    def report(self):
+        if self.stats is None:
+            return None
+        report = pd.DataFrame([(stats.name, stats.items, stats.rows, stats.errors, stats.busyTime)
+                               for stats in self.stats.values()],
+                              columns=['Stage', 'Items', 'Rows', 'Errors', 'BusyTime']).set_index('Stage')
+        report['ItemsPerSec'] = report['Items'] / self.wallTime if self.wallTime else None
+        report['RowsPerSec'] = report['Rows'] / self.wallTime if self.wallTime else None
+        return report
+
+
+if __name__ == '__main__':
+    pipeline = IngestionPipeline(fetch_workers=8)
+    validator = QuoteValidator()
+    pipeline.add_adapter(MOEXAdapter(['IMOEX', 'SBER', 'GAZP', 'LKOH'], dt.date(2023, 1, 1), dt.date(2023, 4, 21),
+                                     validator=validator))
+    pipeline.add_adapter(YahooAdapter({'EURUSD=X': 101, 'SPY': 102}, dt.date(2023, 1, 1), dt.date(2023, 4, 21),
+                                      validator=validator))
+    with get_pool('Analysis').connection() as db_conn:
+        pipeline.set_db_conn(db_conn)
+        print(pipeline.run())
+        print(pipeline.errors)
+    print(validator.summary())
@@ -0,0 +1,213 @@
+import os
+import time
+import atexit
+import marshal
+import threading
+import functools
+
+"""
+Timing spans of the load, transform and risk stages: call counts, wall / own time, rows and bytes by span name
+Spans are recorded only when profiling is enabled (profiling.enable() or the environment variable
+INVESTTOOLS_PROFILE=1, any other value is a file the stats are dumped to at exit); disabled spans are
+a shared no-op object and decorated functions are called directly
+    with profiling.span('ISS.request') as span:
+        response = requests.get(url)
+        span.add(bytes=len(response.content))
+    @profiling.profiled(rows=lambda result, self, *args, **kwargs: len(self.jsData))
+    def get_http_data(self, moex_code): ...
+    profiling.summary()                    # data frame of the spans
+    profiling.dump_stats('load.prof')      # pstats / snakeviz compatible file
+"""
+
+enabled = False
+# cProfile profiler running together with the spans (enable(cprofile=True))
+profiler = None
+
+# span stats: name -> SpanStats
+_stats = {}
+_statsLock = threading.Lock()
+# active spans of the threads
+_active = threading.local()
+
+
+class SpanStats:
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        # wall time including / excluding the nested spans
+        self.wallTime = self.ownTime = 0.0
+        self.maxTime = 0.0
+        self.rows = self.bytes = 0
+        # calls by the enclosing spans: name -> [calls, own time, wall time]
+        self.callers = {}
+
+
+class Span:
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = self.bytes = 0
+        self.startTime = self.childTime = 0.0
+        self.parent = None
+
+    # add processed rows / bytes
+    def add(self, rows=0, bytes=0):
+        self.rows += rows
+        self.bytes += bytes
+
+    def __enter__(self):
+        stack = _active.__dict__.setdefault('stack', [])
+        self.parent = stack[-1] if len(stack) > 0 else None
+        stack.append(self)
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self.startTime
+        _active.stack.pop()
+        if self.parent is not None:
+            self.parent.childTime += wall_time
+        own_time = wall_time - self.childTime
+        with _statsLock:
+            stats = _stats.get(self.name)
+            if stats is None:
+                stats = _stats[self.name] = SpanStats(self.name)
+            stats.calls += 1
+            stats.wallTime += wall_time
+            stats.ownTime += own_time
+            stats.maxTime = max(stats.maxTime, wall_time)
+            stats.rows += self.rows
+            stats.bytes += self.bytes
+            caller = stats.callers.setdefault(self.parent.name if self.parent is not None else None, [0, 0.0, 0.0])
+            caller[0] += 1
+            caller[1] += own_time
+            caller[2] += wall_time
+        return False
+
+
+# span of the disabled profiling
+class NullSpan:
+
+    def add(self, rows=0, bytes=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_nullSpan = NullSpan()
+
+
+# timing span of the code block
+def span(name):
+    if not enabled:
+        return _nullSpan
+    return Span(name)
+
+
+"""
+Decorator of the timed function (the span name is the function qualified name by default)
+rows / bytes - functions of the result and the call arguments (positional and keyword) returning the processed
+rows / bytes: rows(result, *args, **kwargs)
+"""
+def profiled(name=None, rows=None, bytes=None):
+    def decorate(func):
+        span_name = name if name is not None else func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with Span(span_name) as current:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    current.add(rows=rows(result, *args, **kwargs))
+                if bytes is not None:
+                    current.add(bytes=bytes(result, *args, **kwargs))
+            return result
+        return wrapper
+    return decorate
+
+
+# enable spans (cprofile - run cProfile together with the spans, its stats are added to the dump)
+def enable(cprofile=False):
+    global enabled, profiler
+    enabled = True
+    if cprofile and profiler is None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+
+# disable spans and stop cProfile (the next enable(cprofile=True) starts a new profiler)
+def disable():
+    global enabled, profiler
+    enabled = False
+    if profiler is not None:
+        profiler.disable()
+        profiler = None
+
+
+# drop recorded stats
+def reset():
+    with _statsLock:
+        _stats.clear()
+    if profiler is not None:
+        profiler.clear()
+
+
+# recorded stats: name -> SpanStats
+def stats():
+    with _statsLock:
+        return dict(_stats)
+
+
+# data frame of the spans sorted by wall time
+def summary():
+    import pandas as pd
+    frame = pd.DataFrame([(item.name, item.calls, item.wallTime, item.ownTime, item.maxTime, item.rows, item.bytes)
+                          for item in stats().values()],
+                         columns=['Span', 'Calls', 'WallTime', 'OwnTime', 'MaxTime', 'Rows', 'Bytes'])
+    frame['AvgTime'] = frame['WallTime'] / frame['Calls']
+    frame['RowsPerSec'] = frame['Rows'] / frame['WallTime'].where(frame['WallTime'] > 0)
+    return frame.sort_values('WallTime', ascending=False).set_index('Span')
+
+
+# pstats key of the span
+def _span_key(name):
+    return 'investtools', 0, name
+
+
+"""
+Dump stats in the cProfile (marshalled pstats) format: spans are written as functions of the 'investtools' file,
+the cProfile stats are included when it runs together with the spans
+    python -m pstats load.prof
+"""
+def dump_stats(path):
+    if profiler is not None:
+        # create_stats stops the profiler
+        profiler.create_stats()
+        profile_stats = dict(profiler.stats)
+        if enabled:
+            profiler.enable()
+    else:
+        profile_stats = {}
+    for item in stats().values():
+        callers = {_span_key(caller): (calls, calls, own_time, wall_time)
+                   for caller, (calls, own_time, wall_time) in item.callers.items() if caller is not None}
+        profile_stats[_span_key(item.name)] = (item.calls, item.calls, item.ownTime, item.wallTime, callers)
+    with open(path, 'wb') as file:
+        marshal.dump(profile_stats, file)
+    return len(profile_stats)
+
+
+# environment configuration: 1 - enabled, other value - dump file written at exit
+_environ = os.environ.get('INVESTTOOLS_PROFILE', '')
+if _environ not in ('', '0'):
+    enable()
+    if _environ != '1':
+        atexit.register(dump_stats, _environ)
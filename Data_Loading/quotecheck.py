@@ -0,0 +1,188 @@
+from tradecal import get_calendar
+from lazyimport import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+"""
+Data quality checks of the loaded quotes in the MD_SecurityQuotes layout
+(AssetId, Date, Open, Low, High, Close[, YTM_Close, Accrued]); all checks are vectorized over the quotes
+sorted by asset and date, the asset boundaries are handled by masks instead of group-by loops
+    Errors (rows are excluded from saving): MissingClose, NonPositive, OHLC
+    Warnings (rows are saved and reported):  Jump, Stale, Gap, MissingYTM
+"""
+
+
+class QuoteValidator:
+
+    # exceptions report columns
+    columns = ['AssetId', 'Date', 'Check', 'Value']
+    # checks excluding rows from saving
+    errorChecks = ('MissingClose', 'NonPositive', 'OHLC')
+
+    def __init__(self, jump_window=20, jump_threshold=6.0, min_periods=10, min_jump=0.01, stale_days=5,
+                 max_gap_days=5):
+        # jump outliers: log return deviating from the rolling mean of the previous returns by more than
+        # threshold x their volatility and not less than min_jump (quiet series are not flagged on tiny moves)
+        self.jumpWindow = jump_window
+        self.jumpThreshold = jump_threshold
+        self.minPeriods = min_periods
+        self.minJump = min_jump
+        # number of the equal closes forming a stale run
+        self.staleDays = stale_days
+        # trading days (shared MOEX calendar) between consecutive quotes treated as a calendar gap
+        self.maxGapDays = max_gap_days
+
+        # exceptions of the validated quotes
+        self.exceptions = []
+        self.rowNum = 0
+
+    # reset exceptions report
+    def reset(self):
+        self.exceptions = []
+        self.rowNum = 0
+
+    """
+    Validating quotes: bond_ids - ids of the bonds checked for missing YTM
+    returns boolean series of the rows without errors (aligned with the quotes index)
+    """
+    def validate(self, quotes, bond_ids=None):
+        valid = pd.Series(True, index=quotes.index)
+        if len(quotes) == 0:
+            return valid
+        quotes = quotes.sort_values(['AssetId', 'Date'])
+        assets = quotes['AssetId'].to_numpy()
+        dates = pd.to_datetime(quotes['Date']).to_numpy().astype('datetime64[D]')
+        prices = {item: quotes[item].to_numpy(dtype=float) for item in ['Open', 'Low', 'High', 'Close']}
+        close = prices['Close']
+        row_num = len(quotes)
+
+        # previous row belongs to the same asset
+        same = np.zeros(row_num, dtype=bool)
+        same[1:] = assets[1:] == assets[:-1]
+        prev_close = np.full(row_num, np.nan)
+        prev_close[1:] = close[:-1]
+        prev_close[~same] = np.nan
+
+        checks = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # errors
+            checks['MissingClose'] = (np.isnan(close), close)
+            non_positive = np.zeros(row_num, dtype=bool)
+            for values in prices.values():
+                non_positive |= values <= 0
+            checks['NonPositive'] = (non_positive, close)
+            low = np.fmin(prices['Low'], close)
+            high = np.fmax(prices['High'], close)
+            tolerance = 1e-9 * np.abs(close)
+            ohlc = (prices['Low'] > prices['High']) | \
+                (prices['Low'] > np.fmin(prices['Open'], close) + tolerance) | \
+                (prices['High'] < np.fmax(prices['Open'], close) - tolerance)
+            checks['OHLC'] = (ohlc & ~np.isnan(low) & ~np.isnan(high), close)
+
+            # warnings
+            returns = np.log(close / prev_close)
+            z_scores = self.__jump_scores(returns, same)
+            checks['Jump'] = ((np.abs(z_scores) > self.jumpThreshold) & (np.abs(returns) >= self.minJump), z_scores)
+            checks['Stale'] = self.__stale_runs(close, prev_close)
+            prev_dates = np.empty_like(dates)
+            prev_dates[1:] = dates[:-1]
+            prev_dates[0] = dates[0]
+            # trading days of the shared MOEX calendar from the previous quote up to the quote
+            gaps = np.where(same, get_calendar().count(prev_dates, dates) - 1, 0)
+            checks['Gap'] = (gaps > self.maxGapDays, gaps)
+            if bond_ids is not None and 'YTM_Close' in quotes.columns:
+                ytm = pd.to_numeric(quotes['YTM_Close'], errors='coerce').to_numpy(dtype=float)
+                checks['MissingYTM'] = (np.isin(assets, list(bond_ids)) & np.isnan(ytm), ytm)
+
+        # exceptions report and valid rows
+        frames = []
+        errors = np.zeros(row_num, dtype=bool)
+        for check, (mask, values) in checks.items():
+            if not mask.any():
+                continue
+            frames.append(pd.DataFrame({'AssetId': assets[mask], 'Date': dates[mask], 'Check': check,
+                                        'Value': np.asarray(values, dtype=float)[mask]}))
+            if check in QuoteValidator.errorChecks:
+                errors |= mask
+        if len(frames) > 0:
+            self.exceptions.append(pd.concat(frames, ignore_index=True))
+        self.rowNum += row_num
+        valid[quotes.index[errors]] = False
+        return valid
+
+    # rows of the InsertSecurityQuotes statement without errors
+    def filter_rows(self, rows, bonds=False):
+        if len(rows) == 0:
+            return rows
+        quotes = pd.DataFrame(rows, columns=['AssetId', 'Date', 'Open', 'Low', 'High', 'Close', 'YTM_Close',
+                                             'Accrued'])
+        valid = self.validate(quotes, set(quotes['AssetId']) if bonds else None)
+        return [row for row, is_valid in zip(rows, valid.to_numpy()) if is_valid]
+
+    """
+    Close price series (dates x tickers) with the error values replaced by NaN
+    columns - validated price columns (all by default): placeholder columns (e.g. bonds and cash) are passed as is
+    Only non-positive closes are removed here, as the OHLC check needs separate prices;
+    jumps, stale runs and gaps are reported and left in the series
+    """
+    def clean_series(self, price_series, columns=None):
+        validated = price_series if columns is None else price_series[list(columns)]
+        closes = validated.stack().dropna().rename('Close')
+        if len(closes) == 0:
+            return price_series
+        closes.index.names = ['Date', 'AssetId']
+        quotes = closes.reset_index()
+        quotes['Open'] = quotes['Low'] = quotes['High'] = quotes['Close']
+        valid = self.validate(quotes)
+        if valid.all():
+            return price_series
+        errors = quotes.loc[~valid, ['Date', 'AssetId']]
+        price_series = price_series.copy()
+        for ticker, dates in errors.groupby('AssetId')['Date']:
+            price_series.loc[dates.to_numpy(), ticker] = np.nan
+        return price_series
+
+    # z-scores of the returns against the volatility of the previous window returns of the asset
+    def __jump_scores(self, returns, same):
+        row_num = len(returns)
+        known = ~np.isnan(returns)
+        values = np.where(known, returns, 0.0)
+        # cumulative sums: the window sums are differences between the window bounds
+        sums = np.concatenate([[0.0], np.cumsum(values)])
+        squares = np.concatenate([[0.0], np.cumsum(values ** 2)])
+        counts = np.concatenate([[0], np.cumsum(known)])
+        # the window starts not before the first row of the asset
+        starts = np.flatnonzero(~same)
+        first_rows = starts[np.cumsum(~same) - 1]
+        rows = np.arange(row_num)
+        lower = np.maximum(first_rows, rows - self.jumpWindow)
+        num = counts[rows] - counts[lower]
+        total = sums[rows] - sums[lower]
+        variance = (squares[rows] - squares[lower] - total ** 2 / np.maximum(num, 1)) / np.maximum(num - 1, 1)
+        volatility = np.sqrt(np.maximum(variance, 0.0))
+        mean = total / np.maximum(num, 1)
+        return np.where((num >= self.minPeriods) & (volatility > 0), (returns - mean) / volatility, np.nan)
+
+    # stale runs of equal closes: flagged at the last row of the run, the value is the run length
+    def __stale_runs(self, close, prev_close):
+        equal = close == prev_close
+        run_ids = np.cumsum(~equal)
+        lengths = np.bincount(run_ids)[run_ids]
+        last = np.ones(len(close), dtype=bool)
+        last[:-1] = run_ids[1:] != run_ids[:-1]
+        return last & (lengths >= self.staleDays), lengths.astype(float)
+
+    # exceptions of all validated quotes
+    def report(self):
+        if len(self.exceptions) == 0:
+            return pd.DataFrame(columns=QuoteValidator.columns)
+        return pd.concat(self.exceptions, ignore_index=True)
+
+    # number of exceptions and affected assets by check
+    def summary(self):
+        report = self.report()
+        summary = report.groupby('Check').agg(Rows=('AssetId', 'size'), Assets=('AssetId', 'nunique'))
+        summary['Share'] = summary['Rows'] / max(self.rowNum, 1)
+        summary['Error'] = [check in QuoteValidator.errorChecks for check in summary.index]
+        return summary
@@ -0,0 +1,205 @@
+import datetime as dt
+import threading
+from dbquery import PreparedQueries
+from lazyimport import lazy_import
+
+np = lazy_import('numpy')
+
+"""
+Shared MOEX trading calendar: sorted datetime64[D] array of the trading days
+Days stored in DB (dates of the IMOEX prices) are used within their range, outside of it and within the gaps
+of the stored history (partial loads) the calendar is extended by the weekdays without the fixed public holidays;
+all lookups are binary searches
+    calendar = get_calendar(db_conn)
+    calendar.offset(dt.date.today(), -1)                  # last completed trading day
+    calendar.period_ends(from_date, to_date, 'W-FRI')     # last trading days of the weeks
+    calendar.windows(from_date, to_date, 90)              # request windows of 90 trading days
+The DB calendar is reloaded by the next get_calendar call with connection after invalidate_calendar
+(called when the IMOEX prices are saved)
+"""
+
+# fixed public holidays of the default calendar (month, day)
+defaultHolidays = [(1, 1), (1, 2), (1, 7), (2, 23), (3, 8), (5, 1), (5, 9), (6, 12), (11, 4)]
+# stored days more than two weeks apart (longer than the New Year holidays) are a gap of the stored history
+maxStoredGap = 14
+
+# shared calendar
+_calendar = None
+_calendarLock = threading.Lock()
+# DB calendar is out of date (new trading days are stored)
+_calendarStale = False
+
+
+# date / datetime / string / pandas timestamp as datetime64[D] (numpy arrays as arrays of days)
+def to_day(value):
+    if isinstance(value, np.ndarray):
+        return value.astype('datetime64[D]')
+    if hasattr(value, 'to_datetime64'):
+        value = value.to_datetime64()
+    return np.datetime64(value, 'D')
+
+
+class TradingCalendar:
+
+    # pandas period codes accepted by period_ends
+    frequencies = ('D', 'W-FRI', 'M', 'Q', 'Y')
+
+    # trading_days - stored trading days (any order, duplicates allowed)
+    def __init__(self, trading_days=None, start='1990-01-01', end='2100-12-31'):
+        days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+        # weekdays without the fixed holidays
+        months = days.astype('datetime64[M]')
+        month_days = (days - months).astype(int) + 1
+        month_nums = months.astype(int) % 12 + 1
+        holidays = np.zeros(len(days), dtype=bool)
+        for month, day in defaultHolidays:
+            holidays |= (month_nums == month) & (month_days == day)
+        days = days[np.is_busday(days) & ~holidays]
+        # stored days replace the default ones within their range except the gaps of the stored history
+        if trading_days is not None and len(trading_days) > 0:
+            stored_days = np.unique(np.array([to_day(day) for day in trading_days], dtype='datetime64[D]'))
+            gaps = np.flatnonzero(np.diff(stored_days).astype(int) > maxStoredGap)
+            gap_days = [days[(days > stored_days[ind]) & (days < stored_days[ind + 1])] for ind in gaps]
+            days = np.sort(np.concatenate([days[days < stored_days[0]], stored_days, days[days > stored_days[-1]]]
+                                          + gap_days))
+        self.days = days
+        # calendar is loaded from DB
+        self.fromDB = False
+
+    # calendar of the days stored in DB (the default one if no days are stored)
+    @staticmethod
+    def from_db(db_conn, index_name='IMOEX'):
+        queries = PreparedQueries(db_conn)
+        try:
+            rows = queries.fetchall('TradingDays', index_name)
+        finally:
+            queries.close()
+        calendar = TradingCalendar([row[0] for row in rows])
+        calendar.fromDB = True
+        return calendar
+
+    # check if the date is a trading day
+    def is_trading_day(self, date):
+        day = to_day(date)
+        pos = np.searchsorted(self.days, day)
+        return bool(pos < len(self.days) and self.days[pos] == day)
+
+    # last trading day not later than the date
+    def previous(self, date):
+        pos = np.searchsorted(self.days, to_day(date), side='right') - 1
+        return self.days[pos].astype(dt.date) if pos >= 0 else None
+
+    # first trading day not earlier than the date
+    def next(self, date):
+        pos = np.searchsorted(self.days, to_day(date), side='left')
+        return self.days[pos].astype(dt.date) if pos < len(self.days) else None
+
+    # trading day shifted by num trading days: a non trading date is rolled forward first (numpy busday_offset
+    # with roll='following'), so offset(today, -1) is the last trading day before today
+    def offset(self, date, num):
+        pos = np.searchsorted(self.days, to_day(date), side='left') + num
+        if pos < 0 or pos >= len(self.days):
+            raise IndexError("Date %s shifted by %d trading days is out of the calendar" % (date, num))
+        return self.days[pos].astype(dt.date)
+
+    # positions of the trading days of the period [from_date, to_date]
+    def __bounds(self, from_date, to_date):
+        return np.searchsorted(self.days, to_day(from_date), side='left'), \
+            np.searchsorted(self.days, to_day(to_date), side='right')
+
+    # trading days of the period (datetime64[D] array)
+    def trading_days(self, from_date, to_date):
+        start, end = self.__bounds(from_date, to_date)
+        return self.days[start:end]
+
+    # number of the trading days of the period (or of the periods given by the arrays of dates)
+    def count(self, from_date, to_date):
+        start, end = self.__bounds(from_date, to_date)
+        return np.maximum(end - start, 0)
+
+    """
+    Last trading days of the periods (pandas codes: D, W-FRI, M, Q, Y) within [from_date, to_date]
+    complete - the last period is skipped if it ends after to_date
+    """
+    def period_ends(self, from_date, to_date, frequency, complete=True):
+        days = self.trading_days(from_date, to_date)
+        if frequency == 'D' or len(days) == 0:
+            return days
+        periods, period_end = self.__periods(days, frequency)
+        last = np.append(np.flatnonzero(periods[1:] != periods[:-1]), len(periods) - 1)
+        if complete and period_end > to_day(to_date):
+            last = last[:-1]
+        return days[last]
+
+    # period codes of the days and calendar end of the last period
+    @staticmethod
+    def __periods(days, frequency):
+        if frequency == 'W-FRI':
+            # weeks from Saturday to Friday (1970-01-03 is Saturday)
+            periods = (days.astype(int) - 2) // 7
+            return periods, np.datetime64(int(periods[-1]) * 7 + 8, 'D')
+        if frequency in ('M', 'Q', 'Y'):
+            unit = {'M': 1, 'Q': 3, 'Y': 12}[frequency]
+            periods = days.astype('datetime64[M]').astype(int) // unit
+            return periods, (np.datetime64((int(periods[-1]) + 1) * unit, 'M') - np.timedelta64(1, 'D')).astype(
+                'datetime64[D]')
+        raise ValueError("Frequency %s is not supported" % frequency)
+
+    # boundaries (from date, to date) of the consecutive windows of at most size trading days covering the period:
+    # windows are split on trading days and adjoin each other (days missing in the calendar are not lost),
+    # no windows are returned for a period without trading days
+    def windows(self, from_date, to_date, size):
+        days = self.trading_days(from_date, to_date)
+        ends = [days[ind].astype(dt.date) for ind in range(size - 1, len(days) - 1, size)]
+        if len(days) == 0:
+            return []
+        starts = [from_date] + [end + dt.timedelta(days=1) for end in ends]
+        return list(zip(starts, ends + [to_date]))
+
+
+# shared calendar: loaded from DB on the first call with connection (and after invalidation),
+# the default one without it
+def get_calendar(db_conn=None):
+    global _calendar, _calendarStale
+    with _calendarLock:
+        if _calendar is None or (db_conn is not None and (not _calendar.fromDB or _calendarStale)):
+            _calendar = TradingCalendar.from_db(db_conn) if db_conn is not None else TradingCalendar()
+            _calendarStale = _calendarStale and db_conn is None
+        return _calendar
+
+
+# weekday without the fixed holidays (default calendar day)
+def _is_default_trading_day(day):
+    return day.weekday() < 5 and (day.month, day.day) not in defaultHolidays
+
+
+# date shifted by num trading days of the shared calendar if it is built, otherwise by the default calendar days
+# stepped in Python (the numpy calendar is not built for lightweight callers, e.g. default dates of the loaders)
+def trading_offset(date, num):
+    with _calendarLock:
+        calendar = _calendar
+    if calendar is not None:
+        return calendar.offset(date, num)
+    day = date
+    while not _is_default_trading_day(day):
+        day += dt.timedelta(days=1)
+    step = dt.timedelta(days=1 if num > 0 else -1)
+    for ind in range(abs(num)):
+        day += step
+        while not _is_default_trading_day(day):
+            day += step
+    return day
+
+
+# mark the DB calendar out of date: it is reloaded by the next call of get_calendar with connection
+def invalidate_calendar():
+    global _calendarStale
+    with _calendarLock:
+        _calendarStale = True
+
+
+# replace the shared calendar (None - rebuilt on the next call)
+def set_calendar(calendar):
+    global _calendar
+    with _calendarLock:
+        _calendar = calendar
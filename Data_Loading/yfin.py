@@ -1,7 +1,172 @@
-import yfinance as yf
+import datetime as dt
+from dbpool import get_pool
+from dbquery import PreparedQueries, prepared_queries
+from lazyimport import lazy_import
 
+pd = lazy_import('pandas')
+yf = lazy_import('yfinance')
 
+
+# Loader of Yahoo Finance quotes (FX, global indices, ADRs) into dbo.MD_SecurityQuotes
 class yfin:
 
-    def __init__(self):
-        pass;
+    # quote columns in the dbo.MD_SecurityQuotes order
+    columns = ['AssetId', 'Date', 'Open', 'Low', 'High', 'Close', 'YTM_Close', 'Accrued']
+
+    # exchange_id - DCT_Assets.ExchangeId of the Yahoo tickers (MOEX securities are stored with ExchangeId = 1,
+    # the same ticker may be listed on both)
+    def __init__(self, exchange_id=2):
+        # historical dates diapason
+        self.fromDate = self.toDate = None
+        # number of tickers requested in one batch and number of download threads
+        self.batchSize = 100
+        self.threads = 8
+
+        # database of the shared connection pool (connection string is configured in dbpool)
+        self.database = 'Analysis'
+        # db connection
+        self.dbConn = None
+        # prepared statements of the connection (SQL texts are in dbquery.statements)
+        self.queries = None
+
+        # exchange id of the Yahoo tickers in DCT_Assets
+        self.exchangeId = exchange_id
+
+        # requested tickers: Yahoo ticker -> asset id
+        self.tickers = {}
+        # downloaded data: dates x (field, ticker) columns as returned by yfinance
+        self.rawData = None
+        # normalized quotes in the columns order
+        self.quotes = None
+
+    # open db connection
+    def open_db_conn(self):
+        if self.dbConn is not None:
+            return
+        self.dbConn = get_pool(self.database).acquire()
+
+    # close db connection
+    def close_db_conn(self):
+        if self.dbConn is None:
+            return
+        if self.queries is not None:
+            self.queries.close()
+            self.queries = None
+        get_pool(self.database).release(self.dbConn)
+        self.dbConn = None
+
+    # set dates period
+    def set_dates(self, from_date, to_date):
+        self.fromDate = from_date
+        self.toDate = to_date
+
+    # prepared statements of the current connection
+    def __get_queries(self):
+        self.queries = prepared_queries(self.dbConn, self.queries)
+        return self.queries
+
+    # set requested tickers: list of Yahoo tickers or dictionary ticker -> asset id
+    # asset ids of the listed tickers are found among the exchange securities with one query
+    def set_tickers(self, tickers):
+        self.tickers = dict(tickers) if isinstance(tickers, dict) else {ticker: None for ticker in tickers}
+        unknown = [ticker for ticker, asset_id in self.tickers.items() if asset_id is None]
+        if len(unknown) > 0 and self.dbConn is not None:
+            securities = dict(self.__get_queries().fetchall('ExchangeSecurities', self.exchangeId))
+            for ticker in unknown:
+                self.tickers[ticker] = securities.get(ticker)
+        return self.tickers
+
+    # set the start date to the day after the earliest last stored quote of the tickers (incremental loading)
+    def set_incremental_dates(self, to_date=None):
+        asset_ids = [asset_id for asset_id in self.tickers.values() if asset_id is not None]
+        if self.dbConn is None or len(asset_ids) == 0:
+            return -1
+        stored_dates = dict(self.__get_queries().fetchall('LastSecurityQuoteDates'))
+        last_dates = {asset_id: pd.Timestamp(stored_dates[asset_id]).date()
+                      for asset_id in asset_ids if stored_dates.get(asset_id) is not None}
+        # tickers without stored quotes keep the current start date
+        if len(last_dates) == len(asset_ids):
+            self.fromDate = min(last_dates.values()) + dt.timedelta(days=1)
+        self.toDate = to_date if to_date is not None else dt.date.today()
+        return 0
+
+    # download quotes of all tickers in batches, each batch is fetched by yfinance threads
+    def get_data(self):
+        tickers = list(self.tickers)
+        frames = []
+        for ind in range(0, len(tickers), self.batchSize):
+            frame = yf.download(tickers[ind:ind + self.batchSize], start=self.fromDate,
+                                end=self.toDate + dt.timedelta(days=1), group_by='column', auto_adjust=False,
+                                actions=False, threads=self.threads, progress=False)
+            if frame is not None and len(frame) > 0:
+                frames.append(frame)
+        self.rawData = pd.concat(frames, axis=1) if len(frames) > 0 else None
+        self.quotes = self.normalize(self.rawData, self.tickers)
+        return self.quotes
+
+    # record downloaded data (offline fixtures)
+    def record_data(self, path):
+        if self.rawData is None:
+            return -1
+        self.rawData.to_pickle(path)
+        return 0
+
+    # load recorded data instead of downloading
+    def load_recorded_data(self, path):
+        self.rawData = pd.read_pickle(path)
+        self.quotes = self.normalize(self.rawData, self.tickers)
+        return self.quotes
+
+    """
+    Normalizing yfinance data frame (dates x (field, ticker) columns) to quotes rows:
+    AssetId, Date, Open, Low, High, Close, YTM_Close, Accrued sorted by asset and date,
+    days without close prices are dropped, tickers without asset ids are skipped
+    """
+    @staticmethod
+    def normalize(raw_data, tickers):
+        if raw_data is None or len(raw_data) == 0:
+            return pd.DataFrame(columns=yfin.columns)
+        frame = raw_data
+        # single ticker data frame has plain field columns
+        if not isinstance(frame.columns, pd.MultiIndex):
+            frame = pd.concat({next(iter(tickers)): frame}, axis=1).swaplevel(0, 1, axis=1)
+        # fields are expected at the first column level
+        if 'Close' not in frame.columns.get_level_values(0):
+            frame = frame.swaplevel(0, 1, axis=1)
+        frame = frame[['Open', 'Low', 'High', 'Close']].stack(level=1, future_stack=True)
+        frame.index.names = ['Date', 'Ticker']
+        frame = frame.dropna(subset=['Close']).reset_index()
+        frame.columns.name = None
+        frame['AssetId'] = frame['Ticker'].map(tickers)
+        frame = frame.dropna(subset=['AssetId'])
+        frame['AssetId'] = frame['AssetId'].astype(int)
+        frame['Date'] = pd.to_datetime(frame['Date']).dt.tz_localize(None).dt.normalize()
+        frame['YTM_Close'] = frame['Accrued'] = None
+        return frame[yfin.columns].sort_values(['AssetId', 'Date']).reset_index(drop=True)
+
+    """
+    Saving normalized quotes in one transaction: stored quotes are replaced
+    within the downloaded date range of each asset, so repeated loads are idempotent
+    """
+    def save_data(self, db_conn=None):
+        db_conn = db_conn if db_conn is not None else self.dbConn
+        if db_conn is None or self.quotes is None or len(self.quotes) == 0:
+            return 0
+        dates = self.quotes['Date'].dt.strftime('%Y-%m-%d')
+        ranges = self.quotes.assign(Date=dates).groupby('AssetId')['Date'].agg(['min', 'max'])
+        keys = [(int(asset_id), start, end) for asset_id, start, end in ranges.itertuples()]
+        rows = list(self.quotes.assign(Date=dates).astype(object).where(self.quotes.notna(), None)
+                    .itertuples(index=False, name=None))
+
+        # the passed connection may differ from the loader one (pipeline sink)
+        queries = PreparedQueries(db_conn)
+        try:
+            queries.executemany('DeleteSecurityQuotes', keys)
+            queries.executemany('InsertSecurityQuotes', rows)
+            db_conn.commit()
+        except Exception:
+            db_conn.rollback()
+            raise
+        finally:
+            queries.close()
+        return len(rows)
@@ -5,6 +5,8 @@ import importlib
 import sys
 import porta
 import ofz
+import optimizer
+import stress
 
 # portfolio class
 Portfolio = importlib.reload(sys.modules['porta']).Portfolio
@@ -33,6 +35,13 @@ port.calculate_intra_risk_metrics()
 
 port.save_data()
 
+# portfolio optimization
+importlib.reload(sys.modules['optimizer'])
+opt = optimizer.PortfolioOptimizer()
+opt.set_asset_bounds('CASH', 0, 0.1)
+opt.risk_parity(port)
+port.calculate_intra_risk_metrics()
+
 
 
 
@@ -55,3 +64,12 @@ gcurve.close_db_conn()
 terms = [1 ,2, 3, 4, 5, 7, 10]
 gcurve.calculate_yields(terms)
 gcurve.pca(terms)
+
+# stress testing of the portfolio positions
+importlib.reload(sys.modules['stress'])
+tester = stress.StressTester(gcurve)
+tester.add_portfolio(port)
+tester.add_shock_scenario('Curve +200bp', parallel=200)
+tester.add_shock_scenario('Equity -20%, curve twist', index_move=-0.2, slope=300)
+tester.run()
+print(tester.portfolioPnL)
@@ -1,26 +1,32 @@
-import pyodbc
-import numpy as np
-from numpy.linalg import eig
-import pandas as pd
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data_Loading'))
+import profiling
+from dbpool import get_pool
+from dbquery import prepared_queries
+from lazyimport import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
 
 # OFZ curve functionality
 class OFZ:
 
     def __init__(self, connect_db=False):
-        # db connection string
-        self.dbConnString = "Driver={SQL Server Native Client 11.0};Server=LAPTOP-QBI0SKOK\\LOCALDB;" \
-                            "Database=Analysis;Trusted_Connection=yes;"
+        # database of the shared connection pool (connection string is configured in dbpool)
+        self.database = 'Analysis'
 
         # price dates diapason
         self.fromDate = self.toDate = None
         # data frequency
         self.Frequency = 'Daily'
 
-        # db connection
-        self.dbConn = None
+        # db connection and its prepared statements
+        self.dbConn = self.queries = None
         if connect_db:
-            self.dbConn = pyodbc.connect(self.dbConnString)
+            self.open_db_conn()
 
         # OFZ spot curve static coefficient names
         self.OFZ_A = np.zeros(9)
@@ -46,15 +52,23 @@ class OFZ:
     def open_db_conn(self):
         if self.dbConn is not None:
             return
-        self.dbConn = pyodbc.connect(self.dbConnString)
+        self.dbConn = get_pool(self.database).acquire()
 
     # Close db connection
     def close_db_conn(self):
         if self.dbConn is None:
             return
-        self.dbConn.close()
+        if self.queries is not None:
+            self.queries.close()
+            self.queries = None
+        get_pool(self.database).release(self.dbConn)
         self.dbConn = None
 
+    # prepared statements of the current connection
+    def get_queries(self):
+        self.queries = prepared_queries(self.dbConn, self.queries)
+        return self.queries
+
     # set dates period
     def set_dates(self, date_from, date_to):
         self.fromDate = date_from
@@ -76,54 +90,50 @@ class OFZ:
         self.OFZCVals = pd.DataFrame()
         if self.dbConn is None:
             return
-        for cf in self.OFZCNames:
-            cursor = self.dbConn.cursor()
-            cursor.execute(
-                "select [Date], %s from dbo.MOEX_SpotCurveCoeffs where [Date] between '%s' and '%s'" %
-                (cf, self.fromDate, self.toDate))
-            rows = cursor.fetchall()
-            series = {row[0]: row[1] for row in rows}
-            self.OFZCVals[cf] = pd.Series(list(series.values()), index=pd.to_datetime(list(series.keys())))
+        # all coefficients are loaded by one prepared statement
+        rows = self.get_queries().fetchall('SpotCurveCoefficients', str(self.fromDate), str(self.toDate))
+        self.OFZCVals = pd.DataFrame([tuple(row[1:]) for row in rows], columns=self.OFZCNames,
+                                     index=pd.to_datetime([row[0] for row in rows]), dtype=float)
 
     # OFZ yield value for specified term
     def ofz_spot_rate(self, date, term):
         if date not in self.OFZCVals.index:
             return None
-        cfs = self.OFZCVals.loc[date]
+        return float(self.g_curve_rates(self.OFZCVals.loc[date], term))
+
+    # OFZ yields for the curve coefficients and terms (numpy broadcasting between coefficients and terms)
+    def g_curve_rates(self, cfs, terms):
+        terms = np.asarray(terms, dtype=float)
         g_t = 0
         for ind in range(0, 9, 1):
-            g_t += cfs['G' + str(ind + 1)] * np.exp(-((term - self.OFZ_A[ind]) ** 2) / (self.OFZ_B[ind] ** 2))
-        g_t += \
-            cfs['B1'] + \
-            (cfs['B2'] + cfs['B3']) * cfs['T1'] / term * (1 - np.exp(-term / cfs['T1'])) - \
-            cfs['B3'] * np.exp(-term / cfs['T1'])
+            g_i = np.asarray(cfs['G' + str(ind + 1)])
+            g_t = g_t + g_i * np.exp(-((terms - self.OFZ_A[ind]) ** 2) / (self.OFZ_B[ind] ** 2))
+        b1, b2, b3, t1 = (np.asarray(cfs[cf]) for cf in ['B1', 'B2', 'B3', 'T1'])
+        g_t = g_t + b1 + (b2 + b3) * t1 / terms * (1 - np.exp(-terms / t1)) - b3 * np.exp(-terms / t1)
         # continuous compounding rate in basis points
         # rate = 10000 * (np.exp(g_t / 10000) - 1)
-        rate = np.exp(g_t / 10000) - 1
-        return rate
+        return np.exp(g_t / 10000) - 1
 
     # Calculate yields for specified terms
+    @profiling.profiled('OFZ.calculate_yields', rows=lambda result, self, *args, **kwargs: self.OFZYields.size)
     def calculate_yields(self, terms):
-        # empty data frame
-        self.OFZYields = pd.DataFrame()
-        # for each term fill & add ofz yields time series
-        for term in terms:
-            t_series = [self.ofz_spot_rate(dt, term) for dt in self.OFZCVals.index]
-            self.OFZYields[term] = pd.Series(list(t_series), index=self.OFZCVals.index)
+        terms = list(terms)
+        # yields of all dates and terms at once: coefficients as column vectors broadcast against the terms row
+        cfs = {name: self.OFZCVals[name].to_numpy(dtype=float)[:, np.newaxis] for name in self.OFZCNames}
+        rates = self.g_curve_rates(cfs, np.asarray(terms, dtype=float)[np.newaxis, :])
+        self.OFZYields = pd.DataFrame(rates, index=self.OFZCVals.index, columns=terms)
 
     # Perform PCA
     def pca(self, terms):
         yield_change = self.OFZYields / self.OFZYields.shift(-1) - 1
         yield_change.dropna(inplace=True)
         self.cov = yield_change.cov()
-        self.eval, self.evec = eig(self.cov)
+        self.eval, self.evec = np.linalg.eig(self.cov)
 
     def g_spread(self, isins):
         for ind in range(len(isins)):
-            cursor = self.dbConn.cursor()
-            cursor.execute("exec dbo.ExtendedAssetPriceSeries '%s', '%s', '%s'" %
-                           (isins[ind], self.fromDate, self.toDate))
-            rows = cursor.fetchall()
+            rows = self.get_queries().fetchall('ExtendedAssetPriceSeries', isins[ind],
+                                               str(self.fromDate), str(self.toDate))
             series = {row[1]: self.ofz_spot_rate(row[1], 5) for row in rows}
             print(series)
             # self.YTMSeries[self.tickers[ind]] =\
@@ -0,0 +1,149 @@
+import numpy as np
+from scipy.optimize import minimize
+
+
+# Portfolio weights optimization using the covariance matrix of the Portfolio class
+class PortfolioOptimizer:
+
+    def __init__(self, long_only=True):
+        # restriction to non-negative weights
+        self.longOnly = long_only
+        # per-asset weight bounds: ticker -> (lower, upper)
+        self.assetBounds = {}
+        # risk free rate per return period (used by max-Sharpe)
+        self.riskFreeRate = 0.0
+
+        # solver settings
+        self.tolerance = 1e-10
+        self.maxIterations = 500
+        # last solutions used as warm starts: (portfolio id, method, tickers) -> weights
+        self.warmStarts = {}
+
+        # last optimization result
+        self.result = None
+
+    # set risk free rate per return period
+    def set_risk_free_rate(self, rate):
+        self.riskFreeRate = rate
+
+    # set weight bounds for the asset, None means unbounded side
+    def set_asset_bounds(self, ticker, lower=None, upper=None):
+        self.assetBounds[ticker] = (lower, upper)
+
+    # reset asset bounds
+    def reset_asset_bounds(self):
+        self.assetBounds = {}
+
+    # reset warm starts
+    def reset_warm_starts(self):
+        self.warmStarts = {}
+
+    # minimum variance weights
+    def min_variance(self, port):
+        return self.__optimize(port, 'MinVariance', self.__variance)
+
+    # risk parity weights (equal component VARs)
+    # riskless assets (zero variance, e.g. CASH) have no risk contribution and get zero weights
+    def risk_parity(self, port):
+        if port.covMatrix is None:
+            return None
+        variances = np.diag(port.covMatrix.loc[port.tickers, port.tickers].to_numpy())
+        tickers = [ticker for ticker, variance in zip(port.tickers, variances) if variance > 0]
+        if len(tickers) == 0:
+            return None
+        # without asset bounds the convex log-barrier problem gives the exact solution
+        if not any(ticker in self.assetBounds for ticker in tickers):
+            return self.__optimize(port, 'RiskParity', self.__risk_parity_barrier, tickers=tickers)
+        return self.__optimize(port, 'RiskParity', self.__risk_parity_gap, tickers=tickers)
+
+    # maximum Sharpe ratio weights
+    def max_sharpe(self, port):
+        if port.returnSeries is None:
+            return None
+        mean_returns = port.returnSeries[port.tickers].to_numpy().mean(axis=0) - self.riskFreeRate
+        return self.__optimize(port, 'MaxSharpe', self.__negative_sharpe, mean_returns)
+
+    # ----- OBJECTIVE FUNCTIONS (value and analytic gradient) -----
+
+    # portfolio variance
+    @staticmethod
+    def __variance(weights, cov):
+        cw = cov @ weights
+        return weights @ cw, 2 * cw
+
+    # squared deviations of risk contributions from their mean
+    @staticmethod
+    def __risk_parity_gap(weights, cov):
+        cw = cov @ weights
+        contributions = weights * cw
+        # gaps scaled by the asset number to keep the objective magnitude independent of the portfolio size
+        scale = len(weights) ** 2
+        gap = contributions - contributions.mean()
+        # sum of the gaps is zero, so the portfolio variance term drops out of the gradient
+        return scale * (gap @ gap), 2 * scale * (gap * cw + cov @ (weights * gap))
+
+    # log-barrier risk parity problem solved over unnormalized weights
+    @staticmethod
+    def __risk_parity_barrier(weights, cov):
+        cw = cov @ weights
+        return 0.5 * (weights @ cw) - np.log(weights).mean(), cw - 1 / (len(weights) * weights)
+
+    # negative Sharpe ratio
+    @staticmethod
+    def __negative_sharpe(weights, cov, mean_returns):
+        cw = cov @ weights
+        volat = np.sqrt(weights @ cw)
+        excess = mean_returns @ weights
+        return -excess / volat, -(mean_returns / volat - excess * cw / volat ** 3)
+
+    # ----- SOLVER -----
+
+    # weight bounds in the portfolio assets order
+    def __bounds(self, tickers):
+        default = (0.0, None) if self.longOnly else (None, None)
+        return [self.assetBounds.get(ticker, default) for ticker in tickers]
+
+    # initial weights: last solution of the same problem or equal weights
+    def __initial_weights(self, key, ast_num):
+        if key in self.warmStarts:
+            return self.warmStarts[key]
+        return np.full(ast_num, 1.0 / ast_num)
+
+    # solve the optimization problem and write the weights back to the portfolio
+    # tickers - optimized assets (all portfolio assets by default), other assets get zero weights
+    def __optimize(self, port, method, objective, *args, tickers=None):
+        if port.covMatrix is None:
+            return None
+        tickers = port.tickers if tickers is None else tickers
+        cov = port.covMatrix.loc[tickers, tickers].to_numpy()
+        # scaling the covariance matrix for solver conditioning
+        scale = np.mean(np.diag(cov))
+        scale = scale if scale > 0 else 1.0
+        cov = cov / scale
+        if method == 'MaxSharpe':
+            args = (args[0] / np.sqrt(scale),)
+
+        key = (port.portfolioId, method, tuple(tickers))
+        initial_weights = self.__initial_weights(key, len(tickers))
+        if objective is self.__risk_parity_barrier:
+            # positive weights without the budget constraint, normalized after solving
+            self.result = minimize(objective, initial_weights, args=(cov,), jac=True, method='L-BFGS-B',
+                                   bounds=[(1e-12, None)] * len(initial_weights),
+                                   options={'ftol': self.tolerance, 'maxiter': self.maxIterations})
+        else:
+            ones = np.ones(len(initial_weights))
+            self.result = minimize(objective, initial_weights, args=(cov,) + args,
+                                   jac=True, method='SLSQP', bounds=self.__bounds(tickers),
+                                   constraints=[{'type': 'eq', 'fun': lambda w: w.sum() - 1, 'jac': lambda w: ones}],
+                                   options={'ftol': self.tolerance, 'maxiter': self.maxIterations})
+        if not self.result.success:
+            return None
+        self.warmStarts[key] = self.result.x
+        weights = np.zeros(len(port.tickers))
+        weights[[port.tickers.index(ticker) for ticker in tickers]] = self.result.x / self.result.x.sum()
+
+        # update portfolio weights and volumes
+        port.weights = weights.copy()
+        if port.portVolume is not None:
+            port.volumes = port.portVolume * port.weights
+        return port.weights
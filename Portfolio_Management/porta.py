@@ -1,48 +1,60 @@
-import numpy as np
-import pandas as pd
-import pyodbc
+import os
+import sys
+import threading
+import itertools
+from collections import OrderedDict
 # from collections.abc import Iterable
 # import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data_Loading'))
+import profiling
+from dbpool import get_pool
+from dbquery import prepared_queries
+from tradecal import get_calendar
+from lazyimport import lazy_import
+from varwriter import VARWriter
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
 
 class Portfolio:
 
+    # pandas period codes of the price series frequencies
+    resampleFrequencies = {'Daily': None, 'Weekly': 'W-FRI', 'Monthly': 'M'}
+    # resampled price series shared between portfolios:
+    # (data source, validator, tickers, from date, to date, frequency) -> price series
+    # the least recently used series are evicted above the cache size, portfolios of the threads share the cache
+    resampleCache = OrderedDict()
+    resampleCacheSize = 64
+    resampleLock = threading.Lock()
+    # ids of the price data set by set_market_data (external data are never shared)
+    externalSourceIds = itertools.count()
+
     def __init__(self):
-        # db connection string
-        self.dbConnString = "Driver={SQL Server Native Client 11.0};Server=LAPTOP-QBI0SKOK\\LOCALDB;" \
-                            "Database=Analysis;Trusted_Connection=yes;"
-        # db connection
+        # database of the shared connection pool (connection string is configured in dbpool)
+        self.database = 'Analysis'
+        # db connection and its prepared statements
         self.dbConn = None
-
-        # delete portfolio VAR template
-        self.portDelTemplate =\
-            "delete from dbo.RM_VARs where PortfolioId = %d and SecurityId is Null " \
-            "and StartDate = '%s' and EndDate = '%s' and Frequency = '%s'"
-        # portfolio insert template
-        self.portInsTemplate =\
-            "insert into dbo.RM_VARs (PortfolioId, StartDate, EndDate, Frequency, udVAR, VAR) " \
-            "values (%d, '%s', '%s', '%s', %f, %f)"
-
-        # security delete template
-        self.secDelTemplate =\
-            "delete from dbo.RM_VARs where PortfolioId = %d and SecurityId = %d " \
-            "and StartDate = '%s' and EndDate = '%s' and Frequency = '%s'"
-        # security insert template
-        self.secInsTemplate =\
-            "insert into dbo.RM_VARs (PortfolioId, SecurityId, StartDate, EndDate, Frequency, udVAR, mVAR, cVAR) " \
-            "values (%d, %d, '%s', '%s', '%s', %f, %f, %f)"
+        self.queries = None
 
         # portfolio Id / volume / asset num
         self.portfolioId = self.portVolume = self.ast_num = None
-        # set of the portfolio securities
+        # set of the portfolio securities (tickers list, other items as numpy arrays)
         self.ids = self.tickers = self.quantities = self.weights = self.volumes = self.durations = \
-            self.covs = self.betas = self.VARs = self.mVARs = self.cVARs = None
+            self.convexities = self.covs = self.betas = self.VARs = self.mVARs = self.cVARs = None
 
         # price dates diapason
         self.fromDate = self.toDate = None
         # data frequency
         self.Frequency = 'Daily'
 
+        # quotes validator (quotecheck.QuoteValidator): non-positive prices are filled as missing ones,
+        # jumps / stale runs / gaps are reported only
+        self.validator = None
+
+        # source of the rough prices: ('db', connection string) or ('external', id) of the set market data
+        self.dataSource = None
         # quotes / returns data frame
         self.roughPriceSeries = self.priceSeries = self.returnSeries = None
         # covariance / correlation matrix
@@ -59,15 +71,23 @@ class Portfolio:
     def open_db_conn(self):
         if self.dbConn is not None:
             return
-        self.dbConn = pyodbc.connect(self.dbConnString)
+        self.dbConn = get_pool(self.database).acquire()
 
     # close db connection
     def close_db_conn(self):
         if self.dbConn is None:
             return
-        self.dbConn.close()
+        if self.queries is not None:
+            self.queries.close()
+            self.queries = None
+        get_pool(self.database).release(self.dbConn)
         self.dbConn = None
 
+    # prepared statements of the current connection
+    def get_queries(self):
+        self.queries = prepared_queries(self.dbConn, self.queries)
+        return self.queries
+
     # set dates period
     def set_dates(self, date_from, date_to):
         self.fromDate = date_from
@@ -75,11 +95,13 @@ class Portfolio:
 
     # reset portfolio data
     def reset_portfolio_data(self):
-        self.ids = []
+        self.ids = np.zeros(0, dtype=np.int64)
         self.tickers = []
-        self.quantities = []
-        self.weights = []
-        self.durations = []
+        self.quantities = np.zeros(0)
+        self.weights = np.zeros(0)
+        # NaN durations / convexities for non-bond assets
+        self.durations = np.zeros(0)
+        self.convexities = np.zeros(0)
 
     # reset portfolio metrics
     def reset_portfolio_metrics(self):
@@ -93,41 +115,55 @@ class Portfolio:
 
     # add cash asset to portfolio
     def add_cash_asset(self):
-        self.ids.append(-1)
+        self.ids = np.append(self.ids, -1)
         self.tickers.append('CASH')
-        self.quantities.append(0)
-        self.weights.append(0)
-        self.weights[-1] = 1 - np.array(self.weights[:-1]).sum()
-        self.durations.append(None)
+        self.quantities = np.append(self.quantities, 0.0)
+        self.weights = np.append(self.weights, 1 - self.weights.sum())
+        self.durations = np.append(self.durations, np.nan)
+        self.convexities = np.append(self.convexities, np.nan)
+
+    # bond flags of the portfolio assets
+    def is_bond(self):
+        return ~np.isnan(self.durations)
+
+    # initialize portfolio by the passed arrays
+    def set_portfolio_data(self, ids, tickers, quantities, weights, durations=None, convexities=None,
+                           with_cash=False):
+        self.reset_portfolio_data()
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.tickers = list(tickers)
+        self.quantities = np.asarray(quantities, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        # init durations by zeros for bonds
+        if durations is None:
+            durations = [0.0 if tkr[:2] in ('RU', 'SU') else np.nan for tkr in self.tickers]
+        self.durations = np.array([np.nan if d is None else d for d in durations], dtype=float)
+        # init convexities by zeros for bonds
+        if convexities is None:
+            self.convexities = np.where(self.is_bond(), 0.0, np.nan)
+        else:
+            self.convexities = np.array([np.nan if c is None else c for c in convexities], dtype=float)
+
+        # add cash asset to portfolio
+        if with_cash:
+            self.add_cash_asset()
+
+        # create empty arrays
+        self.reset_portfolio_metrics()
 
     # initialize portfolio by Id
     def set_portfolio_by_id(self, port_id, with_cash=False, port_volume=None):
         if self.dbConn is None:
             return
         self.portVolume = port_volume
-        self.reset_portfolio_data()
 
         # get data from db
         self.portfolioId = port_id
-        cursor = self.dbConn.cursor()
-        cursor.execute("exec dbo.PortfolioStructure %d" % port_id)
-        data = cursor.fetchall()
+        data = self.get_queries().fetchall('PortfolioStructure', int(port_id))
 
         # add securities to portfolio
-        for itm in data:
-            self.ids.append(itm[0])
-            self.tickers.append(itm[1])
-            self.quantities.append(itm[2])
-            self.weights.append(itm[3])
-            # init durations by zeros for bonds
-            self.durations.append(0 if (itm[1][:2] == 'RU' or itm[1][:2] == 'SU') else None)
-
-        # add cash asset to portfolio
-        if with_cash:
-            self.add_cash_asset()
-
-        # create empty arrays
-        self.reset_portfolio_metrics()
+        self.set_portfolio_data([itm[0] for itm in data], [itm[1] for itm in data],
+                                [itm[2] for itm in data], [itm[3] for itm in data], with_cash=with_cash)
 
     # ----- PRICE LOADING AND ALIGNING BLOCK -----
 
@@ -135,7 +171,13 @@ class Portfolio:
     def set_duration(self, ticker, value):
         if ticker not in self.tickers:
             return
-        self.durations[self.tickers.index(ticker)] = value
+        self.durations[self.tickers.index(ticker)] = np.nan if value is None else value
+
+    # set convexity
+    def set_convexity(self, ticker, value):
+        if ticker not in self.tickers:
+            return
+        self.convexities[self.tickers.index(ticker)] = np.nan if value is None else value
 
     # temporary function - to be deleted
     def set_durations(self):
@@ -146,6 +188,8 @@ class Portfolio:
         self.set_duration('RU000A103KG4', 2.7)
 
     # get market data
+    @profiling.profiled('Portfolio.get_market_data',
+                        rows=lambda result, self, *args, **kwargs: len(self.roughPriceSeries))
     def get_market_data(self):
         # loading prices
         self.__load_prices_from_db()
@@ -154,27 +198,35 @@ class Portfolio:
         # calculating portfolio value / securities weights
         self.__update_portfolio_volumes()
 
+    # set market data loaded from an external source (columns are the portfolio tickers)
+    def set_market_data(self, price_series):
+        self.dataSource = 'external', next(Portfolio.externalSourceIds)
+        self.roughPriceSeries = price_series
+        self.__align_rough_data()
+        self.__update_portfolio_volumes()
+
     # loading prices from db
     def __load_prices_from_db(self):
         self.roughPriceSeries = pd.DataFrame()
         if self.dbConn is None:
+            self.dataSource = 'external', next(Portfolio.externalSourceIds)
             return
-        # loading shares prices
+        self.dataSource = 'db', get_pool(self.database).connString
+        # loading shares prices by the prepared statement, the data frame is built once
+        bonds = self.is_bond()
+        queries = self.get_queries()
+        price_series = {}
         for ind in range(self.ast_num):
-            if self.tickers[ind] == 'CASH' or self.durations[ind] is not None:
+            if self.tickers[ind] == 'CASH' or bonds[ind]:
                 continue
-            cursor = self.dbConn.cursor()
-            cursor.execute("exec dbo.AssetPriceSeries %d, '%s', '%s'" %
-                           (self.ids[ind], self.fromDate, self.toDate))
-            rows = cursor.fetchall()
+            rows = queries.fetchall('AssetPriceSeries', int(self.ids[ind]), str(self.fromDate), str(self.toDate))
             series = {row[0]: row[1] for row in rows}
-            self.roughPriceSeries[self.tickers[ind]] =\
-                pd.Series(list(series.values()), index=pd.to_datetime(list(series.keys())))
+            price_series[self.tickers[ind]] = \
+                pd.Series(list(series.values()), index=pd.to_datetime(list(series.keys())), dtype=float)
+        self.roughPriceSeries = pd.DataFrame(price_series)
 
         # calculating ofz spot rate for bonds
-        for ind in range(self.ast_num):
-            if self.durations[ind] is None:
-                continue
+        for ind in np.flatnonzero(bonds):
             self.roughPriceSeries[self.tickers[ind]] = \
                 pd.Series([-1] * len(self.roughPriceSeries[self.tickers[0]]), index=self.roughPriceSeries.index)
             # for dt in self.roughPriceSeries.index:
@@ -191,78 +243,113 @@ class Portfolio:
 
     # align loaded data
     def __align_rough_data(self):
-        self.roughPriceSeries.fillna(method='ffill', inplace=True)
-        self.roughPriceSeries.fillna(method='bfill', inplace=True)
+        self.roughPriceSeries = self.roughPriceSeries.sort_index()
+        # bonds and cash have placeholder prices: only quoted prices are validated
+        if self.validator is not None:
+            placeholders = [ticker for ticker, bond in zip(self.tickers, self.is_bond()) if bond or ticker == 'CASH']
+            self.roughPriceSeries = self.validator.clean_series(
+                self.roughPriceSeries, [ticker for ticker in self.roughPriceSeries if ticker not in placeholders])
+        self.roughPriceSeries = self.roughPriceSeries.ffill().bfill()
+        # resampled series of the previous data are not valid any more
+        self.__clear_resample_cache()
         # init used price series to daily format by default
         self.priceSeries = self.roughPriceSeries
 
     # calculate portfolio/securities value/weights
     def __update_portfolio_volumes(self):
-        end_date = self.roughPriceSeries.index[-1]
         if self.portVolume is None:
-            self.portVolume = 0
-            for ind in range(self.ast_num):
-                self.volumes[ind] = self.quantities[ind] * self.roughPriceSeries.loc[end_date, self.tickers[ind]]
-                self.portVolume += self.volumes[ind]
-            for ind in range(self.ast_num):
-                self.weights[ind] = self.volumes[ind] / self.portVolume
+            # last prices taken in the portfolio assets order
+            last_prices = self.roughPriceSeries[self.tickers].to_numpy()[-1]
+            self.volumes = self.quantities * last_prices
+            self.portVolume = self.volumes.sum()
+            self.weights = self.volumes / self.portVolume
         else:
-            for ind in range(self.ast_num):
-                self.volumes[ind] = self.portVolume * self.weights[ind]
+            self.volumes = self.portVolume * self.weights
 
     # ----- RESHAPING PRICE SERIES BLOCK -----
 
     # reshape price series to daily format
     def reshape_as_daily(self):
-        self.priceSeries = self.roughPriceSeries
+        self.priceSeries = self.__get_resampled_series('Daily')
         self.Frequency = 'Daily'
-        pass
-
-    # get daily series with filled NA items
-    def __get_daily_series(self):
-        # daily dates
-        daily_dates = pd.date_range(self.fromDate, self.toDate, freq='D')
-        # reindexing to daily dates with filling NA items
-        series = self.roughPriceSeries.reindex(daily_dates, method='ffill')
-        return series.fillna(method='bfill')
 
     # reshape price series to weekly format
     def reshape_as_weekly(self):
-        # weekly dates
-        weekly_dates = pd.date_range(self.fromDate, self.toDate, freq='W-FRI')
-        # reindexing to weekly dates
-        self.priceSeries = self.__get_daily_series().reindex(weekly_dates)
+        self.priceSeries = self.__get_resampled_series('Weekly')
         self.Frequency = 'Weekly'
 
     # reshape price series to monthly format
     def reshape_as_monthly(self):
-        # monthly dates
-        weekly_dates = pd.date_range(self.fromDate, self.toDate, freq='M')
-        # reindexing to monthly dates
-        self.priceSeries = self.__get_daily_series().reindex(weekly_dates)
+        self.priceSeries = self.__get_resampled_series('Monthly')
         self.Frequency = 'Monthly'
 
+    # cache key of the resampled price series: prices of the same source cleaned by the same validator
+    def __resample_key(self, frequency):
+        return self.dataSource, self.validator, tuple(self.tickers), self.fromDate, self.toDate, frequency
+
+    # drop cached price series of the portfolio assets and dates
+    def __clear_resample_cache(self):
+        with Portfolio.resampleLock:
+            for frequency in Portfolio.resampleFrequencies:
+                Portfolio.resampleCache.pop(self.__resample_key(frequency), None)
+
+    # get price series of the specified frequency computed once per data source, assets set and dates period
+    def __get_resampled_series(self, frequency):
+        key = self.__resample_key(frequency)
+        cache = Portfolio.resampleCache
+        with Portfolio.resampleLock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        # series are resampled outside of the lock (concurrent misses compute the same series)
+        price_series = self.__resample_to_trading_days(frequency)
+        with Portfolio.resampleLock:
+            cache[key] = price_series
+            cache.move_to_end(key)
+            while len(cache) > Portfolio.resampleCacheSize:
+                cache.popitem(last=False)
+        return price_series
+
+    # resample aligned rough prices to the last trading day of each period
+    def __resample_to_trading_days(self, frequency):
+        # last trading days of the completed periods by the shared MOEX calendar
+        period_freq = Portfolio.resampleFrequencies[frequency]
+        period_ends = get_calendar(self.dbConn).period_ends(self.fromDate, self.toDate,
+                                                            'D' if period_freq is None else period_freq)
+        period_ends = pd.DatetimeIndex(period_ends)
+        # prices of the last quoted dates not later than the period ends (binary search over aligned prices)
+        positions = self.roughPriceSeries.index.searchsorted(period_ends, side='right') - 1
+        period_ends, positions = period_ends[positions >= 0], positions[positions >= 0]
+        price_series = self.roughPriceSeries.iloc[positions]
+        price_series.index = period_ends
+        return price_series
+
     # ----- CALCULATING RISK METRICS BLOCK -----
 
     # calculate covariance matrix
+    @profiling.profiled('Portfolio.calculate_covariance',
+                        rows=lambda result, self, *args, **kwargs: len(self.returnSeries))
     def calculate_covariance(self):
         # calculate returns
         self.returnSeries = self.priceSeries / self.priceSeries.shift(1) - 1
         self.returnSeries.dropna(inplace=True)
         # correction for duration for bonds
-        for ind in range(self.ast_num):
-            if self.durations[ind] is not None:
-                self.returnSeries[self.tickers[ind]] *= -self.durations[ind]
-        # covariance matrix
-        self.covMatrix = self.returnSeries.cov()
+        self.returnSeries = self.returnSeries[self.tickers]
+        self.returnSeries *= np.where(self.is_bond(), -self.durations, 1.0)
+        # covariance matrix (returns have no gaps after aligning)
+        cov = np.atleast_2d(np.cov(self.returnSeries.to_numpy(), rowvar=False))
+        self.covMatrix = pd.DataFrame(cov, index=self.tickers, columns=self.tickers)
         # correlation matrix
-        self.corrMatrix = self.returnSeries.corr()
+        volats = np.sqrt(np.diag(cov))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(volats, volats)
+        self.corrMatrix = pd.DataFrame(corr, index=self.tickers, columns=self.tickers)
 
     # calculate risk metrics
     def calculate_intra_risk_metrics(self):
         # portfolio variance and volatility
-        bv = np.dot(self.weights, self.covMatrix)
-        self.portVariance = np.dot(bv, self.weights)
+        bv = self.weights @ self.covMatrix.to_numpy()
+        self.portVariance = bv @ self.weights
         self.portVolatility = np.sqrt(self.portVariance)
 
         # portfolio VAR
@@ -271,7 +358,7 @@ class Portfolio:
         # asset betas
         self.betas = bv / self.portVariance
         # assets VARs
-        ast_volats = np.array([np.sqrt(self.covMatrix.iloc[i, i]) for i in range(self.ast_num)])
+        ast_volats = np.sqrt(np.diag(self.covMatrix.to_numpy()))
         # undiversified asset VARs
         self.VARs = 1.96 * ast_volats * self.weights * self.portVolume
         # marginal VARs
@@ -279,35 +366,11 @@ class Portfolio:
         #  component VARs
         self.cVARs = self.mVARs * self.volumes
 
-    # delete data
-    def __del_data(self):
-        if self.dbConn is None:
-            return
-        # delete portfolio data
-        cursor = self.dbConn.cursor()
-        cursor.execute(self.portDelTemplate % (self.portfolioId, self.fromDate, self.toDate, self.Frequency))
-        cursor.commit()
-        # delete securities data
-        for sec_id in self.ids:
-            cursor = self.dbConn.cursor()
-            cursor.execute(self.secDelTemplate % (self.portfolioId, sec_id, self.fromDate, self.toDate, self.Frequency))
-            cursor.commit()
-
     # save data
     def save_data(self):
         if self.dbConn is None:
             return
-        # clear data
-        self.__del_data()
-        # insert portfolio metrics
-        cursor = self.dbConn.cursor()
-        cursor.execute(self.portInsTemplate %
-                       (self.portfolioId, self.fromDate, self.toDate, self.Frequency, sum(self.VARs), self.portVAR))
-        cursor.commit()
-        # insert security metrics
-        for ind in range(len(self.ids)):
-            cursor = self.dbConn.cursor()
-            cursor.execute(self.secInsTemplate %
-                           (self.portfolioId, self.ids[ind], self.fromDate, self.toDate, self.Frequency,
-                            self.VARs[ind], self.mVARs[ind], self.cVARs[ind]))
-            cursor.commit()
+        # replace portfolio and securities metrics in one transaction
+        writer = VARWriter()
+        writer.add_portfolio(self)
+        writer.save_to_db(self.dbConn)
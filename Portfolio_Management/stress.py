@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+
+# Stress testing and scenario revaluation of Portfolio positions
+class StressTester:
+
+    def __init__(self, curve=None):
+        # OFZ object with loaded G-curve coefficients (used for bond revaluation)
+        self.curve = curve
+        # equity index price series used for share betas and historical index moves
+        self.indexSeries = None
+
+        # tested portfolios
+        self.portfolios = []
+
+        # scenario names / equity index moves
+        self.scenarioNames = []
+        self.indexMoves = []
+        # base and shocked G-curve coefficients of the scenarios (None if the curve is not shocked)
+        self.baseCoeffs = []
+        self.shockedCoeffs = []
+
+        # scenario x position returns and P&L
+        self.positionReturns = self.positionPnL = None
+        # scenario x portfolio P&L and returns
+        self.portfolioPnL = self.portfolioReturns = None
+
+    # set equity index price series
+    def set_index_series(self, series):
+        self.indexSeries = series.sort_index()
+
+    # add portfolio with calculated volumes (and return series for share betas)
+    def add_portfolio(self, port):
+        self.portfolios.append(port)
+
+    # reset portfolios
+    def reset_portfolios(self):
+        self.portfolios = []
+
+    # reset scenarios
+    def reset_scenarios(self):
+        self.scenarioNames = []
+        self.indexMoves = []
+        self.baseCoeffs = []
+        self.shockedCoeffs = []
+
+    # ----- SCENARIO SETTING BLOCK -----
+
+    # curve coefficients on the date or the last date before it
+    def __curve_coeffs(self, date):
+        if date is None:
+            return self.curve.OFZCVals.iloc[-1]
+        return self.curve.OFZCVals.asof(pd.Timestamp(date))
+
+    # add historical stress window, e.g. ('2022-02-18', '2022-03-31')
+    def add_historical_scenario(self, name, from_date, to_date):
+        if self.indexSeries is None:
+            return -1
+        index_from = self.indexSeries.asof(pd.Timestamp(from_date))
+        index_to = self.indexSeries.asof(pd.Timestamp(to_date))
+        self.scenarioNames.append(name)
+        self.indexMoves.append(index_to / index_from - 1)
+        if self.curve is None:
+            self.baseCoeffs.append(None)
+            self.shockedCoeffs.append(None)
+        else:
+            self.baseCoeffs.append(self.__curve_coeffs(from_date))
+            self.shockedCoeffs.append(self.__curve_coeffs(to_date))
+        return 0
+
+    # add user-defined shock: equity index move and G-curve level / slope / curvature shifts in basis points
+    def add_shock_scenario(self, name, index_move=0.0, parallel=0.0, slope=0.0, curvature=0.0, date=None):
+        curve_shocked = parallel != 0 or slope != 0 or curvature != 0
+        if curve_shocked and self.curve is None:
+            return -1
+        self.scenarioNames.append(name)
+        self.indexMoves.append(index_move)
+        if self.curve is None:
+            self.baseCoeffs.append(None)
+            self.shockedCoeffs.append(None)
+        else:
+            base = self.__curve_coeffs(date)
+            # B1 moves the whole curve, B2 the short end only (twist), B3 the middle of the curve
+            shocked = base.copy()
+            shocked['B1'] += parallel
+            shocked['B2'] += slope
+            shocked['B3'] += curvature
+            self.baseCoeffs.append(base)
+            self.shockedCoeffs.append(shocked)
+        return 0
+
+    # ----- REVALUATION BLOCK -----
+
+    # share betas to the equity index
+    def __asset_betas(self, port):
+        betas = np.ones(port.ast_num)
+        if self.indexSeries is not None and port.returnSeries is not None:
+            index_prices = self.indexSeries.reindex(port.priceSeries.index).ffill().bfill()
+            index_returns = (index_prices / index_prices.shift(1) - 1).reindex(port.returnSeries.index).to_numpy()
+            returns = port.returnSeries[port.tickers].to_numpy()
+            index_returns = index_returns - index_returns.mean()
+            betas = (index_returns @ (returns - returns.mean(axis=0))) / (index_returns @ index_returns)
+        # no equity exposure for cash
+        betas[np.array(port.tickers) == 'CASH'] = 0
+        return betas
+
+    # yield changes of the scenarios for the passed terms
+    def __yield_changes(self, terms):
+        scn_num = len(self.scenarioNames)
+        shocked = np.array([coeffs is not None for coeffs in self.shockedCoeffs])
+        changes = np.zeros((scn_num, len(terms)))
+        if self.curve is None or not shocked.any() or len(terms) == 0:
+            return changes
+        # scenario coefficients as column vectors broadcast against the terms row
+        base = pd.DataFrame([self.baseCoeffs[ind] for ind in np.flatnonzero(shocked)])
+        shocked_cfs = pd.DataFrame([self.shockedCoeffs[ind] for ind in np.flatnonzero(shocked)])
+        base = {cf: base[cf].to_numpy()[:, None] for cf in self.curve.OFZCNames}
+        shocked_cfs = {cf: shocked_cfs[cf].to_numpy()[:, None] for cf in self.curve.OFZCNames}
+        # zero terms are shifted to avoid division by zero in the curve formula
+        terms = np.maximum(np.asarray(terms, dtype=float), 1e-3)[None, :]
+        changes[shocked] = self.curve.g_curve_rates(shocked_cfs, terms) - self.curve.g_curve_rates(base, terms)
+        return changes
+
+    # revalue positions of all portfolios for all scenarios
+    def run(self):
+        if len(self.portfolios) == 0 or len(self.scenarioNames) == 0:
+            return -1
+        # stacking positions of all portfolios
+        volumes = np.concatenate([port.volumes for port in self.portfolios])
+        durations = np.concatenate([port.durations for port in self.portfolios])
+        convexities = np.concatenate([port.convexities for port in self.portfolios])
+        betas = np.concatenate([self.__asset_betas(port) for port in self.portfolios])
+        port_index = np.repeat(np.arange(len(self.portfolios)), [port.ast_num for port in self.portfolios])
+        bonds = ~np.isnan(durations)
+
+        # shares revalued through beta to the index move
+        index_moves = np.asarray(self.indexMoves, dtype=float)
+        returns = np.outer(index_moves, np.where(bonds, 0.0, betas))
+        # bonds revalued through duration and convexity
+        dy = self.__yield_changes(durations[bonds])
+        returns[:, bonds] = -durations[bonds] * dy + 0.5 * np.nan_to_num(convexities[bonds]) * dy ** 2
+
+        # position / portfolio P&L
+        self.positionReturns = returns
+        self.positionPnL = returns * volumes
+        membership = np.zeros((len(volumes), len(self.portfolios)))
+        membership[np.arange(len(volumes)), port_index] = 1
+        port_names = [port.portfolioId for port in self.portfolios]
+        self.portfolioPnL = pd.DataFrame(self.positionPnL @ membership, index=self.scenarioNames, columns=port_names)
+        port_volumes = np.array([port.volumes.sum() for port in self.portfolios])
+        self.portfolioReturns = self.portfolioPnL / port_volumes
+        return 0
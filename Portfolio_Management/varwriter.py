@@ -0,0 +1,98 @@
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data_Loading'))
+from lazyimport import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+# Bulk writer of the Portfolio VAR results to dbo.RM_VARs or a local SQLite / Parquet sink
+class VARWriter:
+
+    # result columns in the dbo.RM_VARs order
+    columns = ['PortfolioId', 'SecurityId', 'StartDate', 'EndDate', 'Frequency', 'udVAR', 'VAR', 'mVAR', 'cVAR']
+
+    def __init__(self):
+        # deleted keys: (PortfolioId, StartDate, EndDate, Frequency)
+        self.keys = []
+        # inserted rows in the columns order
+        self.rows = []
+
+        # delete template: one predicate removes portfolio and securities rows of the key
+        self.delTemplate = \
+            "delete from %s where PortfolioId = ? and StartDate = ? and EndDate = ? and Frequency = ?"
+        # insert template
+        self.insTemplate = \
+            "insert into %s (" + ', '.join(VARWriter.columns) + ") values (" + \
+            ', '.join(['?'] * len(VARWriter.columns)) + ")"
+
+    # reset collected results
+    def reset(self):
+        self.keys = []
+        self.rows = []
+
+    # collect results of the calculated portfolio
+    def add_portfolio(self, port):
+        port_id = int(port.portfolioId)
+        key = (port_id, port.fromDate, port.toDate, port.Frequency)
+        self.keys.append(key)
+        # portfolio row
+        self.rows.append((port_id, None) + key[1:] + (float(np.sum(port.VARs)), float(port.portVAR), None, None))
+        # securities rows
+        for sec_id, ud_var, m_var, c_var in \
+                zip(np.asarray(port.ids).tolist(), port.VARs.tolist(), port.mVARs.tolist(), port.cVARs.tolist()):
+            self.rows.append((port_id, sec_id) + key[1:] + (ud_var, None, m_var, c_var))
+
+    # collected results as a data frame
+    def to_frame(self):
+        return pd.DataFrame(self.rows, columns=VARWriter.columns)
+
+    # write collected results in one transaction
+    def save_to_db(self, db_conn, table='dbo.RM_VARs'):
+        if len(self.rows) == 0:
+            return 0
+        keys, rows = self.keys, self.rows
+        # sqlite has neither schemas nor native date types
+        if isinstance(db_conn, sqlite3.Connection):
+            table = table.split('.')[-1]
+            keys = [self.__iso_dates(key, 1, 2) for key in keys]
+            rows = [self.__iso_dates(row, 2, 3) for row in rows]
+
+        cursor = db_conn.cursor()
+        # pyodbc sends parameter arrays in one round-trip when supported
+        if hasattr(cursor, 'fast_executemany'):
+            cursor.fast_executemany = True
+        try:
+            cursor.executemany(self.delTemplate % table, keys)
+            cursor.executemany(self.insTemplate % table, rows)
+            db_conn.commit()
+        except Exception:
+            db_conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return len(rows)
+
+    # write collected results to a local SQLite database (file path or connection)
+    def save_to_sqlite(self, database):
+        db_conn = sqlite3.connect(database) if isinstance(database, str) else database
+        db_conn.execute("create table if not exists RM_VARs (PortfolioId integer, SecurityId integer, "
+                        "StartDate text, EndDate text, Frequency text, udVAR real, VAR real, mVAR real, cVAR real)")
+        db_conn.execute("create index if not exists IX_RM_VARs on RM_VARs (PortfolioId, StartDate, EndDate, Frequency)")
+        result = self.save_to_db(db_conn, 'RM_VARs')
+        if isinstance(database, str):
+            db_conn.close()
+        return result
+
+    # write collected results to a Parquet file
+    def save_to_parquet(self, path):
+        self.to_frame().to_parquet(path, index=False)
+        return len(self.rows)
+
+    # convert the date items of the tuple to ISO strings
+    @staticmethod
+    def __iso_dates(items, *positions):
+        return tuple(str(pd.Timestamp(item).date()) if ind in positions else item for ind, item in enumerate(items))
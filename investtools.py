@@ -0,0 +1,372 @@
+import os
+import sys
+import math
+import argparse
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+
+root_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(root_dir, 'Data_Loading'), os.path.join(root_dir, 'Portfolio_Management')]
+import profiling
+from dbpool import get_pool
+from tradecal import get_calendar
+from jobstate import JobState
+
+"""
+Command line batch runner of the scheduled jobs (unattended equivalent of the WB scripts)
+    python investtools.py load moex [--codes SBER,GAZP | --index IMOEX] [--mode incremental|full]
+                                    [--from 2019-09-01] [--to 2023-04-21] [--workers 8] [--validate]
+                                    [--state backfill.db [--job NAME] [--months 12]]
+    python investtools.py load interfax --fintools 101,102 [--workers 4] [--proxy-user LOGIN] [--state ...]
+    python investtools.py load yahoo --tickers EURUSD=X,SPY [--mode incremental|full] [--from ...] [--to ...]
+    python investtools.py risk --portfolios 1,2,3 [--frequency daily|weekly|monthly] [--workers 3]
+    python investtools.py curve [--terms 1,2,3,5,7,10] [--output yields.csv]
+The end date is the last completed trading day and the start date is one trading year before it by default,
+the start date later than the end date is rejected as a wrong argument
+risk runs one process per portfolio up to the number of CPUs by default (--workers limits the processes)
+--profile FILE dumps the timing spans of the run to the pstats file
+--state FILE checkpoints the MOEX windows / Interfax requests written to DB: a restarted job runs the tasks
+of its first run (codes and dates) and skips the finished ones, the checkpoints of the job are dropped
+when it completes without errors
+Exit codes: 0 - done, 1 - some items failed, 2 - wrong arguments, 3 - run aborted
+"""
+
+EXIT_OK, EXIT_FAILED, EXIT_USAGE, EXIT_ERROR = 0, 1, 2, 3
+
+
+# wrong arguments found after parsing (exit code EXIT_USAGE)
+class UsageError(ValueError):
+    pass
+
+
+# comma separated list argument
+def list_arg(item_type):
+    def parse(value):
+        return [item_type(item) for item in value.split(',') if item.strip() != '']
+    return parse
+
+
+# date argument in ISO format
+def date_arg(value):
+    return dt.date.fromisoformat(value)
+
+
+# default dates period: to date - the last completed trading day, from date - one trading year before it
+def default_dates(args, db_conn=None):
+    calendar = get_calendar(db_conn)
+    to_date = args.to_date if args.to_date is not None else calendar.offset(dt.date.today(), -1)
+    from_date = args.from_date if args.from_date is not None else calendar.offset(to_date, -250)
+    if from_date > to_date:
+        raise UsageError('start date %s is later than end date %s' % (from_date, to_date))
+    return from_date, to_date
+
+
+# job state of the checkpointed load (None - no checkpoints)
+def job_state(args):
+    if args.state is None:
+        return None
+    state = JobState(args.state, args.job if args.job is not None else 'load ' + args.source)
+    if state.resumedNum > 0 or state.params is not None:
+        print('Job "%s" resumed: %d items are finished' % (state.job, state.resumedNum))
+    return state
+
+
+# run the pipeline on the pooled connection
+def run_pipeline(pipeline, database):
+    with get_pool(database).connection() as db_conn:
+        pipeline.set_db_conn(db_conn)
+        pipeline.run()
+
+
+# print failed pipeline tasks and return the exit code: checkpoints of the completed job are dropped
+def pipeline_status(pipeline):
+    print(pipeline.report())
+    for name, task, stage, error in pipeline.errors:
+        task = ' '.join(str(item) for item in task) if isinstance(task, tuple) else task
+        print('%s %s failed at %s: %s' % (name, task, stage, error), file=sys.stderr)
+    if pipeline.jobState is not None:
+        if pipeline.skippedNum > 0:
+            print('%d finished items skipped' % pipeline.skippedNum)
+        if len(pipeline.errors) == 0:
+            pipeline.jobState.finish()
+        pipeline.jobState.close()
+    return EXIT_FAILED if len(pipeline.errors) > 0 else EXIT_OK
+
+
+# ----- LOAD COMMANDS -----
+
+# MOEX quotes of the codes or the index with its constituents
+def load_moex(args):
+    from moexdata import MOEXData
+    from pipeline import IngestionPipeline, MOEXAdapter
+    from quotecheck import QuoteValidator
+
+    mxd = MOEXData()
+    mxd.open_db_conn()
+    try:
+        from_date, to_date = default_dates(args, mxd.dbConn)
+        mxd.preload_instruments()
+        codes = args.codes if args.codes is not None else [args.index] + mxd.resolve_index_constituents(args.index)
+        instruments = mxd.get_instruments(codes)
+        last_dates = mxd.last_dates(codes) if args.mode == 'incremental' else {}
+    finally:
+        mxd.close_db_conn()
+
+    status = EXIT_OK
+    unknown = [code for code in codes if code not in instruments]
+    for code in unknown:
+        print('%s is not found in DB' % code, file=sys.stderr)
+        status = EXIT_FAILED
+    state = job_state(args)
+    if state is not None and state.params is not None:
+        # restarted job runs the tasks of its first run: incremental start dates computed again would move
+        # past the failed windows once the later windows of the codes are committed
+        to_date = dt.date.fromisoformat(state.params['to'])
+        start_dates = {code: dt.date.fromisoformat(date) for code, date in state.params['starts'].items()}
+    else:
+        # incremental loads start the day after the last stored date
+        start_dates = {}
+        for code in codes:
+            if code in unknown:
+                continue
+            last_date = last_dates.get(code)
+            start_dates[code] = from_date if last_date is None else max(from_date, last_date + dt.timedelta(days=1))
+        start_dates = {code: date for code, date in start_dates.items() if date <= to_date}
+        if state is not None:
+            state.save_params({'to': to_date.isoformat(),
+                               'starts': {code: date.isoformat() for code, date in start_dates.items()}})
+    if len(start_dates) == 0:
+        print('MOEX quotes are up to date')
+        if state is not None:
+            state.finish()
+            state.close()
+        return status
+
+    # codes grouped by their start dates
+    groups = {}
+    for code, start_date in start_dates.items():
+        groups.setdefault(start_date, {})[code] = instruments[code]
+    validator = QuoteValidator() if args.validate else None
+    pipeline = IngestionPipeline(fetch_workers=args.workers, job_state=state)
+    for start_date, group in sorted(groups.items()):
+        pipeline.add_adapter(MOEXAdapter(group, start_date, to_date, use_db=False, validator=validator,
+                                         months=args.months))
+    run_pipeline(pipeline, mxd.database)
+    if validator is not None:
+        print(validator.summary())
+    return max(status, pipeline_status(pipeline))
+
+
+# Interfax coupons of the fin tools
+def load_interfax(args):
+    from ifxdata import InterfaxData
+    from pipeline import IngestionPipeline, InterfaxAdapter
+
+    proxies = None
+    if args.proxy_user is not None:
+        ifx_data = InterfaxData()
+        ifx_data.set_proxies(args.proxy_user, os.environ.get('INVESTTOOLS_PROXY_PASSWORD', ''))
+        proxies = ifx_data.proxies
+    pipeline = IngestionPipeline(fetch_workers=args.workers, job_state=job_state(args))
+    pipeline.add_adapter(InterfaxAdapter.bond_coupons(args.fintools, proxies))
+    run_pipeline(pipeline, InterfaxData.database)
+    return pipeline_status(pipeline)
+
+
+# Yahoo quotes of the tickers
+def load_yahoo(args):
+    from yfin import yfin
+    from pipeline import IngestionPipeline, YahooAdapter
+
+    loader = yfin()
+    loader.open_db_conn()
+    try:
+        from_date, to_date = default_dates(args, loader.dbConn)
+        loader.set_dates(from_date, to_date)
+        tickers = loader.set_tickers(args.tickers)
+        if args.mode == 'incremental':
+            loader.set_incremental_dates(to_date)
+    finally:
+        loader.close_db_conn()
+
+    status = EXIT_OK
+    for ticker in [ticker for ticker, asset_id in tickers.items() if asset_id is None]:
+        print('%s is not found in DB' % ticker, file=sys.stderr)
+        del tickers[ticker]
+        status = EXIT_FAILED
+    if len(tickers) == 0 or loader.fromDate > loader.toDate:
+        print('Yahoo quotes are up to date')
+        return status
+    pipeline = IngestionPipeline(fetch_workers=args.workers)
+    pipeline.add_adapter(YahooAdapter(tickers, loader.fromDate, loader.toDate))
+    run_pipeline(pipeline, loader.database)
+    return max(status, pipeline_status(pipeline))
+
+
+# ----- RISK AND CURVE COMMANDS -----
+
+# VAR of the portfolio saved to DB (run in the worker processes)
+def portfolio_var(port_id, from_date, to_date, frequency, port_volume, with_cash):
+    from porta import Portfolio
+
+    port = Portfolio()
+    port.set_dates(from_date, to_date)
+    port.open_db_conn()
+    try:
+        port.set_portfolio_by_id(port_id, with_cash, port_volume)
+        if port.ast_num is None or port.ast_num == 0:
+            raise ValueError("Portfolio %d has no assets" % port_id)
+        port.get_market_data()
+        getattr(port, 'reshape_as_' + frequency)()
+        port.calculate_covariance()
+        port.calculate_intra_risk_metrics()
+        # assets without prices make the VAR undefined: nothing is saved
+        if not math.isfinite(port.portVAR):
+            raise ValueError("VAR of the portfolio %d is not defined (assets without prices)" % port_id)
+        port.save_data()
+        return float(port.portVAR)
+    finally:
+        port.close_db_conn()
+
+
+# VAR of the portfolios calculated in parallel processes
+def risk(args):
+    from porta import Portfolio
+
+    # dates by the DB calendar as in the other commands
+    with get_pool(Portfolio().database).connection() as db_conn:
+        from_date, to_date = default_dates(args, db_conn)
+    params = (from_date, to_date, args.frequency, args.volume, args.cash)
+    status = EXIT_OK
+    workers = args.workers if args.workers is not None else os.cpu_count() or 1
+    workers = min(workers, len(args.portfolios))
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = {port_id: executor.submit(portfolio_var, port_id, *params) for port_id in args.portfolios}
+            results = {}
+            for port_id, future in futures.items():
+                try:
+                    results[port_id] = future.result()
+                except Exception as error:
+                    results[port_id] = error
+    else:
+        results = {}
+        for port_id in args.portfolios:
+            try:
+                results[port_id] = portfolio_var(port_id, *params)
+            except Exception as error:
+                results[port_id] = error
+    for port_id, result in results.items():
+        if isinstance(result, Exception):
+            print('Portfolio %d failed: %r' % (port_id, result), file=sys.stderr)
+            status = EXIT_FAILED
+        else:
+            print('Portfolio %d: VAR %.2f (%s, %s - %s)' % (port_id, result, args.frequency, from_date, to_date))
+    return status
+
+
+# OFZ yields of the terms and their principal components
+def curve(args):
+    from ofz import OFZ
+
+    gcurve = OFZ(True)
+    try:
+        gcurve.set_dates(*default_dates(args, gcurve.dbConn))
+        gcurve.get_spot_curve_coefficients()
+    finally:
+        gcurve.close_db_conn()
+    if len(gcurve.OFZCVals) == 0:
+        print('No curve coefficients for %s - %s' % (gcurve.fromDate, gcurve.toDate), file=sys.stderr)
+        return EXIT_FAILED
+    gcurve.calculate_yields(args.terms)
+    gcurve.pca(args.terms)
+    if args.output is not None:
+        gcurve.OFZYields.to_csv(args.output)
+    else:
+        print(gcurve.OFZYields.tail())
+    print('Principal components variance shares:', (gcurve.eval.real / gcurve.eval.real.sum()).round(4))
+    return EXIT_OK
+
+
+# ----- COMMAND LINE -----
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='investtools', description='InvestTools batch jobs')
+    parser.add_argument('--profile', metavar='FILE', help='dump the timing spans to the pstats file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    # date range options shared by the commands
+    dates = argparse.ArgumentParser(add_help=False)
+    dates.add_argument('--from', dest='from_date', type=date_arg, help='start date (YYYY-MM-DD)')
+    dates.add_argument('--to', dest='to_date', type=date_arg, help='end date (YYYY-MM-DD)')
+    workers = argparse.ArgumentParser(add_help=False)
+    workers.add_argument('--workers', type=int, default=8, help='number of parallel workers')
+    modes = argparse.ArgumentParser(add_help=False)
+    modes.add_argument('--mode', choices=['incremental', 'full'], default='incremental',
+                       help='load after the last stored dates or reload the whole period')
+    checkpoints = argparse.ArgumentParser(add_help=False)
+    checkpoints.add_argument('--state', metavar='FILE', help='checkpoints file: restarted job skips finished items')
+    checkpoints.add_argument('--job', help='job name in the checkpoints file (load <source> by default)')
+
+    load = commands.add_parser('load', help='load market data').add_subparsers(dest='source', required=True)
+    moex = load.add_parser('moex', parents=[dates, workers, modes, checkpoints], help='MOEX ISS quotes')
+    moex_codes = moex.add_mutually_exclusive_group()
+    moex_codes.add_argument('--codes', type=list_arg(str), help='comma separated MOEX codes')
+    moex_codes.add_argument('--index', default='IMOEX', help='index loaded with its constituents')
+    moex.add_argument('--validate', action='store_true', help='skip and report invalid quotes')
+    moex.add_argument('--months', type=int, default=12, help='length of the checkpointed backfill windows')
+    moex.set_defaults(func=load_moex)
+    interfax = load.add_parser('interfax', parents=[workers, checkpoints], help='Interfax bond coupons')
+    interfax.add_argument('--fintools', type=list_arg(int), required=True, help='comma separated fin tool ids')
+    interfax.add_argument('--proxy-user', help='proxy login (password is INVESTTOOLS_PROXY_PASSWORD)')
+    interfax.set_defaults(func=load_interfax)
+    yahoo = load.add_parser('yahoo', parents=[dates, workers, modes], help='Yahoo Finance quotes')
+    yahoo.add_argument('--tickers', type=list_arg(str), required=True, help='comma separated Yahoo tickers')
+    yahoo.set_defaults(func=load_yahoo)
+
+    risk_parser = commands.add_parser('risk', parents=[dates], help='portfolio VAR saved to DB')
+    risk_parser.add_argument('--workers', type=int,
+                             help='number of worker processes (number of CPUs capped by portfolios by default)')
+    risk_parser.add_argument('--portfolios', type=list_arg(int), required=True, help='comma separated ids')
+    risk_parser.add_argument('--frequency', choices=['daily', 'weekly', 'monthly'], default='daily')
+    risk_parser.add_argument('--volume', type=float, help='portfolio volume (market value by default)')
+    risk_parser.add_argument('--cash', action='store_true', help='add cash asset')
+    risk_parser.set_defaults(func=risk)
+
+    curve_parser = commands.add_parser('curve', parents=[dates], help='OFZ curve yields and PCA')
+    curve_parser.add_argument('--terms', type=list_arg(float), default=[1, 2, 3, 4, 5, 7, 10])
+    curve_parser.add_argument('--output', help='CSV file of the yields')
+    curve_parser.set_defaults(func=curve)
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    workers = getattr(args, 'workers', None)
+    if (workers is not None and workers < 1) or getattr(args, 'months', 1) < 1:
+        print('--workers and --months should be positive', file=sys.stderr)
+        return EXIT_USAGE
+    if getattr(args, 'from_date', None) is not None and getattr(args, 'to_date', None) is not None and \
+            args.from_date > args.to_date:
+        print('--from should not be later than --to', file=sys.stderr)
+        return EXIT_USAGE
+    if args.profile is not None:
+        profiling.enable()
+    try:
+        return args.func(args)
+    except UsageError as error:
+        print(error, file=sys.stderr)
+        return EXIT_USAGE
+    except KeyboardInterrupt:
+        print('Interrupted', file=sys.stderr)
+        return EXIT_ERROR
+    except Exception as error:
+        print('%s %s aborted: %r' % (args.command, getattr(args, 'source', ''), error), file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        if args.profile is not None:
+            profiling.dump_stats(args.profile)
+
+
+if __name__ == '__main__':
+    sys.exit(main())